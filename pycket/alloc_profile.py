@@ -0,0 +1,174 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Allocation profiler, enabled with the allocation_profiling translation
+# option. The constructors of all value, environment and continuation classes
+# are wrapped (in the same way add_impersonator_counts does it for
+# impersonators) to count the instances created per class and attribute them to
+# the AST node being interpreted or the primitive being called at the time.
+#
+# Sizes are estimates: a GC header plus one word per declared field of the
+# class. Objects created through objectmodel.instantiate (continuation clones,
+# copy methods) bypass the constructor and are not counted.
+
+from rpython.rlib             import jit
+from rpython.rlib.objectmodel import specialize
+from rpython.rlib.rarithmetic import LONG_BIT
+
+WORD = LONG_BIT / 8
+HEADER_WORDS = 2
+REPORT_LIMIT = 20
+
+class ClassAllocInfo(object):
+    _attrs_ = ['name', 'size', 'count']
+
+    def __init__(self, name, size):
+        self.name  = name
+        self.size  = size
+        self.count = 0
+
+class SiteAllocInfo(object):
+    _attrs_ = ['name', 'count', 'bytes', 'per_class']
+
+    def __init__(self, name):
+        self.name      = name
+        self.count     = 0
+        self.bytes     = 0
+        self.per_class = {}
+
+    def record(self, info):
+        self.count += 1
+        self.bytes += info.size
+        self.per_class[info.name] = self.per_class.get(info.name, 0) + 1
+
+class AllocProfilerState(object):
+    def __init__(self):
+        self.classes         = []
+        self.ast_sites       = {}
+        self.prim_sites      = {}
+        self.current_ast     = None
+        self.current_prim    = None
+        # the objects whose constructors are currently running, used to avoid
+        # counting calls to the constructors of base classes
+        self.initializing_w    = None
+        self.initializing_cont = None
+
+state = AllocProfilerState()
+
+def enter_ast(ast):
+    state.current_ast  = ast
+    state.current_prim = None
+
+def enter_prim(w_prim):
+    state.current_prim = w_prim
+
+@jit.dont_look_inside
+def record_allocation(info):
+    info.count += 1
+    w_prim = state.current_prim
+    if w_prim is not None:
+        site = state.prim_sites.get(w_prim, None)
+        if site is None:
+            site = state.prim_sites[w_prim] = SiteAllocInfo(w_prim.tostring())
+        site.record(info)
+        return
+    ast = state.current_ast
+    if ast is not None:
+        site = state.ast_sites.get(ast, None)
+        if site is None:
+            site = state.ast_sites[ast] = SiteAllocInfo(ast.tostring())
+        site.record(info)
+
+def _estimate_size(cls):
+    "NOT_RPYTHON"
+    from pycket.util import strip_immutable_field_name
+    fields = {}
+    for base in cls.__mro__:
+        for name in base.__dict__.get("_attrs_", []):
+            fields[name] = None
+        for name in base.__dict__.get("_immutable_fields_", []):
+            fields[strip_immutable_field_name(name)] = None
+    return WORD * (HEADER_WORDS + len(fields))
+
+def _wrap_init(cls, marker):
+    "NOT_RPYTHON"
+    old_init = cls.__dict__["__init__"]
+
+    def counting_init(self, *args):
+        outer = getattr(state, marker)
+        if outer is not self:
+            record_allocation(self._alloc_info)
+            setattr(state, marker, self)
+        old_init(self, *args)
+        setattr(state, marker, outer)
+
+    counting_init.__name__ = old_init.__name__
+    cls.__init__ = counting_init
+
+def _all_subclasses(root):
+    "NOT_RPYTHON"
+    result = []
+    todo = [root]
+    seen = {}
+    while todo:
+        cls = todo.pop()
+        if cls in seen:
+            continue
+        seen[cls] = None
+        result.append(cls)
+        todo.extend(cls.__subclasses__())
+    return result
+
+def instrument_classes():
+    "NOT_RPYTHON"
+    from pycket.base import W_ProtoObject
+    from pycket.cont import BaseCont
+    for root, marker in [(W_ProtoObject, "initializing_w"),
+                         (BaseCont, "initializing_cont")]:
+        for cls in _all_subclasses(root):
+            info = ClassAllocInfo(cls.__name__, _estimate_size(cls))
+            state.classes.append(info)
+            cls._alloc_info = info
+            if "__init__" in cls.__dict__:
+                _wrap_init(cls, marker)
+
+@specialize.argtype(1)
+def _insert_sorted(result, elem):
+    i = len(result)
+    result.append(elem)
+    while i > 0 and result[i - 1].count < elem.count:
+        result[i] = result[i - 1]
+        i -= 1
+    result[i] = elem
+
+def print_report():
+    classes = []
+    for info in state.classes:
+        if info.count:
+            _insert_sorted(classes, info)
+    if not classes:
+        return
+    print "=== allocations by class ==="
+    print "%12s %14s  %s" % ("count", "est. bytes", "class")
+    for info in classes[:REPORT_LIMIT]:
+        print "%12d %14d  %s" % (info.count, info.count * info.size, info.name)
+    _print_sites("=== allocations by primitive ===", state.prim_sites.values())
+    _print_sites("=== allocations by AST node ===", state.ast_sites.values())
+
+def _print_sites(title, sites):
+    result = []
+    for site in sites:
+        _insert_sorted(result, site)
+    if not result:
+        return
+    print title
+    print "%12s %14s  %s" % ("count", "est. bytes", "site")
+    for site in result[:REPORT_LIMIT]:
+        name = site.name
+        if len(name) > 80:
+            name = name[:77] + "..."
+        print "%12d %14d  %s" % (site.count, site.bytes, name)
+        breakdown = []
+        for clsname, count in site.per_class.iteritems():
+            breakdown.append("%s=%d" % (clsname, count))
+        print "%28s%s" % ("", " ".join(breakdown))
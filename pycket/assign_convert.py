@@ -1,7 +1,9 @@
 
-from pycket.ast_visitor import ASTVisitor
-from pycket.env         import SymList
-from pycket.interpreter import (
+from pycket              import values
+from pycket.ast_visitor  import ASTVisitor
+from pycket.env          import SymList
+from pycket.error        import SchemeException
+from pycket.interpreter  import (
     App,
     Begin,
     Begin0,
@@ -10,6 +12,7 @@ from pycket.interpreter import (
     Cell,
     CellRef,
     DefineValues,
+    Gensym,
     If,
     Lambda,
     Let,
@@ -22,10 +25,15 @@ from pycket.interpreter import (
     Require,
     SetBang,
     SequencedBodyAST,
+    SimplePrimApp1,
+    SimplePrimApp2,
     SymbolSet,
     ToplevelVar,
+    Var,
     VariableReference,
     WithContinuationMark,
+    make_lambda,
+    make_let,
     variable_set,
 )
 
@@ -121,7 +129,7 @@ class AssignConvertVisitor(ASTVisitor):
             local_muts[lv] = None
         new_vars = vars.copy()
         new_vars.update(local_muts)
-        sub_env_structure = SymList(ast.args.elems, env_structure)
+        sub_env_structure = SymList.make(ast.args.elems, env_structure)
         new_rhss = [rhs.visit(self, new_vars, sub_env_structure) for rhs in ast.rhss]
 
         body_env_structures, body_remove_num_envs = self._visit_sequenced_body(
@@ -135,7 +143,7 @@ class AssignConvertVisitor(ASTVisitor):
 
     def visit_let(self, ast, vars, env_structure):
         assert isinstance(ast, Let)
-        sub_env_structure = SymList(ast.args.elems, env_structure)
+        sub_env_structure = SymList.make(ast.args.elems, env_structure)
         local_muts = self.body_muts(ast)
         new_vars = vars.copy()
         new_vars.update(local_muts)
@@ -241,18 +249,26 @@ class AssignConvertVisitor(ASTVisitor):
             body_env_structure = sub_env_structure
         else:
             next_structure = sub_env_structure.prev.drop_frames(curr_remove)
-            body_env_structure = SymList(ast.args.elems, next_structure)
+            body_env_structure = SymList.make(ast.args.elems, next_structure)
 
-        if (free_vars_not_mutated and max_needed == curr_remove and
+        if config.flat_env and free_vars_not_mutated and max_needed > 0:
+            # copy everything the body needs into the frame of the let, so
+            # that the body only ever looks into its own frame
+            copy = True
+        elif (free_vars_not_mutated and max_needed == curr_remove and
                 max_depth > max_needed):
             before_max_needed = sub_env_structure.drop_frames(max_needed + 2)
-            if before_max_needed and before_max_needed.depth_and_size()[1] > 0:
-                counts, new_lhs_vars, new_rhss = self._copy_live_vars(
-                        ast, free_vars_not_from_let)
-                body_env_structure = SymList(new_lhs_vars)
-                sub_env_structure = SymList(new_lhs_vars, sub_env_structure.prev)
-                ast = Let(body_env_structure, counts, new_rhss, ast.body)
-                return self._compute_remove_num_envs(ast, new_vars, sub_env_structure)
+            copy = (before_max_needed is not None and
+                    before_max_needed.depth_and_size()[1] > 0)
+        else:
+            copy = False
+        if copy:
+            counts, new_lhs_vars, new_rhss = self._copy_live_vars(
+                    ast, free_vars_not_from_let)
+            body_env_structure = SymList.make(new_lhs_vars)
+            sub_env_structure = SymList.make(new_lhs_vars, sub_env_structure.prev)
+            ast = Let(body_env_structure, counts, new_rhss, ast.body)
+            return self._compute_remove_num_envs(ast, new_vars, sub_env_structure)
 
         # The loops will modify all but the last element
         remove_num_envs = [curr_remove] * (len(ast.rhss) + 1)
@@ -305,8 +321,191 @@ class AssignConvertVisitor(ASTVisitor):
         counts = counts[:]
         return counts, new_lhs_vars, new_rhss
 
+class RebindAssignmentsVisitor(ASTVisitor):
+    """
+    Replaces the set!s of let-bound variables and lambda arguments by new
+    bindings, so that assignment conversion does not have to put these
+    variables into cells. If the set!s of a variable are all expressions of the
+    body that binds it (or the last expression of lets in that body, where
+    normalization puts the set! of a non-simple value), the rest of the body
+    after each set! is moved into a let that binds a fresh variable to the new
+    value.
+
+    This is only done if no closure refers to the variable, and if nothing
+    evaluated before the last set! can capture a continuation. Reentering such a
+    continuation after the set! would otherwise see the binding from before the
+    set! instead of the assigned value.
+
+    Variables that a closure refers to keep their cells. This includes the
+    counters of named-let loops that are bound outside the loop, as in
+    (let ([i 0]) (let loop () ... (set! i (+ i 1)) (loop))): the loop is a
+    closure, and after it returns the body sees the value of its last set!.
+    Handling these would mean passing the variable through the loop and back
+    out of it.
+    """
+
+    def visit_lambda(self, ast):
+        assert isinstance(ast, Lambda)
+        body = [b.visit(self) for b in ast.body]
+        for sym in ast.args.elems:
+            body = rebind_assignments(body, sym)
+        return make_lambda(ast.formals, ast.rest, body, sourceinfo=ast.sourceinfo)
+
+    def visit_let(self, ast):
+        assert isinstance(ast, Let)
+        rhss = [r.visit(self) for r in ast.rhss]
+        body = [b.visit(self) for b in ast.body]
+        for sym in ast.args.elems:
+            body = rebind_assignments(body, sym)
+        return make_let(ast._rebuild_args(), rhss, body)
+
+class RenameVisitor(ASTVisitor):
+    """ Renames the references to a variable that no closure refers to. """
+
+    def __init__(self, old_sym, new_sym):
+        self.old_sym = old_sym
+        self.new_sym = new_sym
+
+    def visit_lexical_var(self, ast):
+        assert isinstance(ast, LexicalVar)
+        if ast.sym is self.old_sym:
+            return LexicalVar(self.new_sym)
+        return ast
+
+    def visit_cell_ref(self, ast):
+        assert isinstance(ast, CellRef)
+        if ast.sym is self.old_sym:
+            return CellRef(self.new_sym)
+        return ast
+
+    def visit_lambda(self, ast):
+        assert isinstance(ast, Lambda)
+        return ast
+
+    def visit_let(self, ast):
+        assert isinstance(ast, Let)
+        rhss = [r.visit(self) for r in ast.rhss]
+        if self.old_sym in ast.args.elems:
+            body = ast.body
+        else:
+            body = [b.visit(self) for b in ast.body]
+        return make_let(ast._rebuild_args(), rhss, body)
+
+    def visit_letrec(self, ast):
+        assert isinstance(ast, Letrec)
+        if self.old_sym in ast.args.elems:
+            return ast
+        return ASTVisitor.visit_letrec(self, ast)
+
+def is_captured(ast, sym):
+    """ Whether a closure or a variable reference in ast refers to sym. """
+    if isinstance(ast, Lambda):
+        return ast.free_vars().haskey(sym)
+    if isinstance(ast, VariableReference):
+        var = ast.var
+        return isinstance(var, Var) and var.sym is sym
+    for child in ast.direct_children():
+        if is_captured(child, sym):
+            return True
+    return False
+
+def cannot_capture_continuation(ast):
+    """ Whether evaluating ast certainly neither captures a continuation nor
+    calls anything that could. """
+    if isinstance(ast, Lambda) or isinstance(ast, CaseLambda):
+        # only creates a closure
+        return True
+    if isinstance(ast, SimplePrimApp1) or isinstance(ast, SimplePrimApp2):
+        return True
+    if isinstance(ast, App):
+        rator = ast.rator
+        if not isinstance(rator, ModuleVar) or not rator.is_primitive():
+            return False
+        try:
+            w_prim = rator._lookup_primitive()
+        except SchemeException:
+            return False
+        if not isinstance(w_prim, values.W_Prim) or w_prim.simple_n is None:
+            return False
+    elif not (isinstance(ast, Var) or isinstance(ast, Quote) or
+              isinstance(ast, QuoteSyntax) or isinstance(ast, VariableReference) or
+              isinstance(ast, SetBang) or isinstance(ast, If) or
+              isinstance(ast, Let) or isinstance(ast, Letrec) or
+              isinstance(ast, Begin) or isinstance(ast, Begin0)):
+        return False
+    for child in ast.direct_children():
+        if not cannot_capture_continuation(child):
+            return False
+    return True
+
+def rebind_assignments(body, sym):
+    """ Returns body with the set!s of sym, which is bound around body,
+    replaced by new bindings, or body itself if that is not possible. """
+    from pycket import config
+    if not config.rebind_assignments:
+        return body
+    var = LexicalVar(sym)
+    last = -1
+    for i, b in enumerate(body):
+        if is_captured(b, sym):
+            return body
+        if var in b.mutated_vars():
+            last = i
+    if last == -1:
+        return body
+    for i in range(last + 1):
+        if not cannot_capture_continuation(body[i]):
+            return body
+    result = _rebind_assignments(body, sym)
+    if result is None:
+        return body
+    return result
+
+def _rebind_assignments(body, sym):
+    var = LexicalVar(sym)
+    for i, b in enumerate(body):
+        if var not in b.mutated_vars():
+            continue
+        new_sym = Gensym.gensym(sym.variable_name() + "_")
+        rest = body[i + 1:]
+        if rest:
+            visitor = RenameVisitor(sym, new_sym)
+            rest = [r.visit(visitor) for r in rest]
+            rest = _rebind_assignments(rest, new_sym)
+            if rest is None:
+                return None
+        else:
+            rest = [Quote(values.w_void)]
+        new_b = _bind_assigned_value(b, sym, new_sym, rest)
+        if new_b is None:
+            return None
+        return body[:i] + [new_b]
+    return body
+
+def _bind_assigned_value(ast, sym, new_sym, rest):
+    """ Replaces the set! of sym at the end of ast by a let binding new_sym
+    around rest. """
+    if isinstance(ast, SetBang):
+        if isinstance(ast.var, CellRef) and ast.var.sym is sym:
+            return make_let([[new_sym]], [ast.rhs], rest)
+        return None
+    if isinstance(ast, Let):
+        var = LexicalVar(sym)
+        for rhs in ast.rhss:
+            if var in rhs.mutated_vars():
+                return None
+        for b in ast.body[:-1]:
+            if var in b.mutated_vars():
+                return None
+        last = _bind_assigned_value(ast.body[-1], sym, new_sym, rest)
+        if last is None:
+            return None
+        return make_let(ast._rebuild_args(), ast.rhss, ast.body[:-1] + [last])
+    return None
+
 def assign_convert(ast, visitor=None):
     if visitor is None:
         visitor = AssignConvertVisitor()
+    ast = ast.visit(RebindAssignmentsVisitor())
     return ast.visit(visitor, variable_set(), None)
 
@@ -191,7 +191,7 @@ class CopyVisitor(ASTVisitor):
 
     def visit_module_var(self, ast):
         assert isinstance(ast, ModuleVar)
-        var = ModuleVar(ast.sym, ast.srcmod, ast.srcsym, ast.path)
+        var = ModuleVar(ast.sym, ast.srcmod, ast.srcsym, ast.path, ast.native)
         var.modenv = ast.modenv
         var.w_value = ast.w_value
         return var
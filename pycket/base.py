@@ -6,6 +6,30 @@ from rpython.rlib          import jit, objectmodel
 class UnhashableType(Exception):
     pass
 
+# How many components of composite values (elements of pairs and vectors,
+# fields of structs, contents of boxes) one equal hash looks at, so hashing a
+# large or deep value takes bounded time.
+EQUAL_HASH_FUEL = 64
+
+class EqualHashState(object):
+    """ The equal hash being computed: how many more components it may look
+    at, and whether everything it looked at is immutable, so that the hash can
+    be cached. """
+    def __init__(self):
+        self.fuel   = 0
+        self.stable = True
+
+equal_hash_state = EqualHashState()
+
+def start_equal_hash(w_obj):
+    """ The equal hash of the composite value w_obj. Composite values
+    implement hash_equal with this and hash their components with
+    hash_equal_part, which draws on the shared fuel. """
+    state = equal_hash_state
+    state.fuel   = EQUAL_HASH_FUEL
+    state.stable = True
+    return w_obj.hash_equal_part()
+
 class W_ProtoObject(object):
     """ abstract base class of both actual values (W_Objects) and multiple
     return values (Values)"""
@@ -81,6 +105,11 @@ class W_Object(W_ProtoObject):
     def get_prop(self, property, env, cont):
         raise SchemeException("%s is not a struct" % self.tostring())
 
+    def builtin_prop(self, property):
+        """ The value of a structure type property for a value that is not a
+        struct but stands in for the structs of a library, or None. """
+        return None
+
     # Interface for proxies
 
     def is_impersonator(self):
@@ -115,9 +144,14 @@ class W_Object(W_ProtoObject):
     def hash_equal(self, info=None):
         return objectmodel.compute_hash(self) # default implementation
 
-    def hash_eqv(self):
+    def hash_equal_part(self):
+        """ The equal hash of self as a component of a composite value. Must be
+        overridden by composite values, see start_equal_hash. """
         return self.hash_equal()
 
+    def hash_eqv(self):
+        return objectmodel.compute_hash(self) # like eqv, the default is identity
+
     def tostring(self):
         return str(self)
 
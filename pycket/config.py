@@ -18,10 +18,22 @@ pycketoption_descr = OptionDescription(
                default=True, cmdline="--type-size-specialization"),
     BoolOption("prune_env", "prune environment",
                default=True, cmdline="--prune-env"),
+    BoolOption("flat_env", "copy the variables a let body needs into the frame of the let, so lookups do not walk the environment chain (needs prune_env)",
+               default=False, cmdline="--flat-env"),
+    BoolOption("rebind_assignments", "replace set! of variables no closure refers to by new bindings instead of cells",
+               default=True, cmdline="--rebind-assignments"),
     BoolOption("immutable_boolean_field_elision", "elide immutable boolean fields from structs",
                default=False, cmdline="--ibfe"),
     BoolOption("hidden_classes", "use hidden classes to implement impersonators",
-               default=True, cmdline="--hidden-classes")
+               default=True, cmdline="--hidden-classes"),
+    BoolOption("lambda_profiling", "count lambda invocations and time spent in their bodies, reported at exit",
+               default=False, cmdline="--lambda-profiling"),
+    BoolOption("direct_interpretation", "evaluate in direct style and use the CEK machine only where the continuation is needed (for builds without the JIT)",
+               default=False, cmdline="--direct-interpretation"),
+    BoolOption("native_sets", "resolve the hash set operations of racket/set to native primitives, whose sets are backed by the hash table strategies",
+               default=False, cmdline="--native-sets"),
+    BoolOption("allocation_profiling", "count allocations per class and allocation site, reported at exit",
+               default=False, cmdline="--allocation-profiling"),
 ])
 
 def get_testing_config(**overrides):
@@ -38,6 +50,10 @@ def compute_executable_suffix(config):
         res.append("-no-callgraph")
     if not config.prune_env:
         res.append("-no-prune-env")
+    if config.flat_env:
+        res.append("-flat-env")
+    if not config.rebind_assignments:
+        res.append("-no-rebind-assignments")
     if not config.two_state:
         res.append("-no-two-state")
     if not config.strategies:
@@ -48,6 +64,14 @@ def compute_executable_suffix(config):
         res.append("-no-hidden-classes")
     if config.immutable_boolean_field_elision:
         res.append("-ibfe")
+    if config.lambda_profiling:
+        res.append("-lambda-profiling")
+    if config.direct_interpretation:
+        res.append("-direct")
+    if config.allocation_profiling:
+        res.append("-allocation-profiling")
+    if config.native_sets:
+        res.append("-native-sets")
     return "".join(res)
 
 
@@ -60,8 +84,13 @@ def compute_executable_suffix(config):
 exposed_options = ['strategies',
                    'type_size_specialization',
                    'prune_env',
+                   'flat_env',
+                   'rebind_assignments',
                    'immutable_boolean_field_elision',
                    'hidden_classes',
+                   'lambda_profiling',
+                   'allocation_profiling',
+                   'native_sets',
 ]
 
 def expose_options(config):
@@ -21,6 +21,8 @@ class Link(AbstractLink):
         self.key = k
         self.val = v
         self.next = next
+        # whether a cached mark lookup went past the frame of this link
+        self.walked = False
 
     @jit.unroll_safe
     def clone_links(self):
@@ -37,10 +39,108 @@ class ForwardLink(AbstractLink):
     def __init__(self, cont):
         assert isinstance(cont, BaseCont)
         self.cont = cont
+        self.cache_epochs = None
+        self.cache_frames = None
 
     def clone_links(self):
         return self
 
+    def is_cached(self, index):
+        return (self.cache_epochs is not None and
+                self.cache_epochs[index] == mark_cache.epochs[index])
+
+    def get_cached(self, index):
+        return self.cache_frames[index]
+
+    def set_cached(self, index, frame):
+        if self.cache_epochs is None:
+            self.cache_epochs = [-1] * NUM_CACHED_KEYS
+            self.cache_frames = [None] * NUM_CACHED_KEYS
+        self.cache_epochs[index] = mark_cache.epochs[index]
+        self.cache_frames[index] = frame
+
+# Lookups of the marks for the parameterization, the exception handler and
+# whether breaks are enabled happen all the time, and walking the continuation
+# for them costs time proportional to the number of frames with marks. For
+# these keys, every ForwardLink caches the frame that the walk starting at its
+# cont ends at: the nearest frame that has a mark for the key itself, or that is
+# a prompt or a barrier (where the caller decides whether the lookup goes on).
+# The cache is filled for all the ForwardLinks passed on the way, so lookups take
+# amortized constant time.
+#
+# A frame only gets new marks while it is the current continuation, so the
+# frames a cache entry skips can only change under captured continuations that
+# are reinstated later. The walks only look at frames with marks of their own
+# (the ForwardLinks of the frames after one without marks point past it), and
+# every walk going past such a frame flags its first Link. When update_cm adds
+# a mark for one of these keys to a frame with a flagged Link, it starts a new
+# epoch for that key, invalidating the caches of the key. Adding the first mark
+# to a frame, as parameterize and with-handlers do, never invalidates anything.
+
+NUM_CACHED_KEYS = 3
+
+class MarkCacheState(object):
+    def __init__(self):
+        self.epochs = [0] * NUM_CACHED_KEYS
+
+mark_cache = MarkCacheState()
+
+def cached_mark_index(key):
+    from pycket import values
+    if key is values.parameterization_key:
+        return 0
+    if key is values.exn_handler_key:
+        return 1
+    if key is values.break_enabled_key:
+        return 2
+    return -1
+
+@jit.unroll_safe
+def find_mark_frame(cont, key, index):
+    """ The nearest of cont and the frames after it that has a mark for key
+    itself or is a prompt or a barrier, or None. key must be one of the keys
+    with cached lookups, index its cached_mark_index. """
+    l = cont.marks
+    while isinstance(l, Link):
+        if l.key is key:
+            return cont
+        l = l.next
+    if isinstance(cont, Prompt) or isinstance(cont, Barrier):
+        return cont
+    if not isinstance(l, ForwardLink):
+        return None
+    if l.is_cached(index):
+        return l.get_cached(index)
+    return _fill_mark_cache(l, key, index)
+
+@jit.dont_look_inside
+def _fill_mark_cache(link, key, index):
+    visited = [link]
+    result = None
+    while True:
+        p = link.cont
+        l = p.marks
+        while isinstance(l, Link):
+            if l.key is key:
+                break
+            l = l.next
+        if isinstance(l, Link) or isinstance(p, Prompt) or isinstance(p, Barrier):
+            result = p
+            break
+        marks = p.marks
+        if isinstance(marks, Link):
+            marks.walked = True
+        if not isinstance(l, ForwardLink):
+            break
+        if l.is_cached(index):
+            result = l.get_cached(index)
+            break
+        visited.append(l)
+        link = l
+    for l in visited:
+        l.set_cached(index, result)
+    return result
+
 class BaseCont(object):
     # Racket also keeps a separate stack for continuation marks
     # so that they can be saved without saving the whole continuation.
@@ -79,6 +179,17 @@ class BaseCont(object):
     def _clone(self):
         raise NotImplementedError("abstract method")
 
+    def plug_reduce_2(self, w_val1, w_val2, env):
+        """ plug_reduce for exactly two values. Continuations that bind the
+        values right away override this to do so without a Values object. """
+        from pycket.values import Values
+        return self.plug_reduce(Values.make2(w_val1, w_val2), env)
+
+    def plug_reduce_3(self, w_val1, w_val2, w_val3, env):
+        """ plug_reduce for exactly three values, see plug_reduce_2. """
+        from pycket.values import Values
+        return self.plug_reduce(Values.make([w_val1, w_val2, w_val3]), env)
+
     def get_ast(self):
         return None # best effort
 
@@ -103,11 +214,17 @@ class BaseCont(object):
     def update_cm(self, k, v):
         from pycket.prims.equal import eqp_logic
         l = self.marks
+        walked = False
         while isinstance(l, Link):
             if eqp_logic(l.key, k):
                 l.val = v
                 return
+            walked = walked or l.walked
             l = l.next
+        if walked:
+            index = cached_mark_index(k)
+            if index >= 0:
+                mark_cache.epochs[index] += 1
         self.marks = Link(k, v, self.marks)
 
     def get_marks(self, key, upto=[]):
@@ -121,20 +238,57 @@ class BaseCont(object):
 
     @jit.unroll_safe
     def get_mark_first(self, key, upto=[]):
+        index = cached_mark_index(key)
+        if index >= 0:
+            return self._get_cached_mark_first(key, index, upto)
+        p = self
+        while p is not None:
+            v, next = p.find_cm(key)
+            if v is not None:
+                return v
+            if p.stop_at(upto):
+                break
+            p = next
+        return None
+
+    @jit.unroll_safe
+    def _get_cached_mark_first(self, key, index, upto):
         p = self
         while p is not None:
+            p = find_mark_frame(p, key, index)
+            if p is None:
+                break
             v, next = p.find_cm(key)
             if v is not None:
                 return v
+            # a prompt or a barrier without a mark for key
             if p.stop_at(upto):
                 break
             p = next
         return None
 
+    def find_mark_frame(self, key):
+        """ The nearest frame with a mark for key (self, or one of the frames
+        after it up to the next barrier) """
+        index = cached_mark_index(key)
+        assert index >= 0
+        p = self
+        while p is not None:
+            p = find_mark_frame(p, key, index)
+            if p is None:
+                break
+            v, next = p.find_cm(key)
+            if v is not None:
+                return p
+            if isinstance(p, Barrier):
+                break
+            p = next
+        return None
+
     def stop_at(self, upto):
         return False
 
-    def append(self, tail, upto=None, stop=None):
+    def append(self, tail, upto=None, stop=None, share=False):
         return tail
 
     def plug_reduce(self, _vals, env):
@@ -192,10 +346,15 @@ class Cont(BaseCont):
     def get_next_executed_ast(self):
         return self.prev.get_next_executed_ast()
 
-    def append(self, tail, upto=None, stop=None):
+    def append(self, tail, upto=None, stop=None, share=False):
+        # With share, frames whose previous continuation stays the same are
+        # reused instead of copied, which is only safe for continuations that
+        # are reinstated once.
         if self is stop:
-            return self.clone()
-        rest = self.prev.append(tail, upto, stop)
+            return self if share else self.clone()
+        rest = self.prev.append(tail, upto, stop, share)
+        if share and rest is self.prev:
+            return self
         head = self.clone()
         assert isinstance(head, Cont)
         head.prev = rest
@@ -234,10 +393,10 @@ class Prompt(Cont):
     def get_previous_continuation(self, upto=[]):
         return self.prev if not self.stop_at(upto) else None
 
-    def append(self, tail, upto=None, stop=None):
+    def append(self, tail, upto=None, stop=None, share=False):
         if upto is self.tag or stop is tail:
             return tail
-        return Cont.append(self, tail, upto, stop)
+        return Cont.append(self, tail, upto, stop, share)
 
     def plug_reduce(self, _vals, env):
         return self.prev.plug_reduce(_vals, env)
@@ -411,6 +570,28 @@ def label(func):
 def call_cont(proc, env, cont, vals):
     return proc.call(vals.get_all_values(), env, cont)
 
+class CallValuesCont(Cont):
+    """ call_cont for the consumer of call-with-values, which passes two or
+    three values on to the consumer without a Values object """
+
+    _attrs_ = _immutable_fields_ = ['proc']
+
+    def __init__(self, proc, env, prev):
+        Cont.__init__(self, env, prev)
+        self.proc = proc
+
+    def _clone(self):
+        return CallValuesCont(self.proc, self.env, self.prev)
+
+    def plug_reduce(self, vals, env):
+        return self.proc.call(vals.get_all_values(), self.env, self.prev)
+
+    def plug_reduce_2(self, w_val1, w_val2, env):
+        return self.proc.call([w_val1, w_val2], self.env, self.prev)
+
+    def plug_reduce_3(self, w_val1, w_val2, w_val3, env):
+        return self.proc.call([w_val1, w_val2, w_val3], self.env, self.prev)
+
 # A useful continuation constructor. This invokes the given procedure with
 # the enviroment and continuation when values are supplied.
 # This is just a simple way to place a function call onto the continuation.
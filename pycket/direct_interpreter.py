@@ -0,0 +1,288 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Direct-style interpreter for builds without the JIT, enabled with the
+# direct_interpretation option. Instead of allocating a continuation for every
+# step, eval_direct evaluates an AST with recursive calls for the non-tail
+# positions (let right-hand sides, all but the last expression of a body, ...)
+# and a loop for the tail positions, so tail calls run in constant native
+# stack. Simple primitives and closures are called directly; simple
+# subexpressions are evaluated in place without recursing.
+#
+# Everything that needs the continuation (non-simple primitives, continuation
+# marks, parameters, exceptions raised by primitives) and recursion deeper than
+# DEPTH_LIMIT raise Fallback. While Fallback unwinds the native stack, every
+# pending evaluation records a frame, from which Fallback.resume builds the
+# continuations the CEK machine would have had at that point. The CEK machine
+# then takes one step and the direct interpreter continues from there.
+
+from pycket                   import config
+from pycket                   import values
+from pycket.env               import ConsEnv
+from pycket.error             import SchemeException
+from pycket.interpreter       import (App, Begin0, Begin0BodyCont, Begin0Cont,
+                                      BeginCont, Cell, CellCont, DefineValues,
+                                      If, Let, LetCont, Letrec, LetrecCont,
+                                      SequencedBodyAST, SimplePrimApp1,
+                                      SimplePrimApp2, return_multi_vals)
+
+DEPTH_LIMIT = 200
+
+class Fallback(Exception):
+    """ The computation can only continue in the CEK machine: ast is to be run
+    in env inside the frames collected while unwinding, innermost first.
+    Instead of running ast, exn is raised if it is set, and w_callable is
+    applied to args_w if it is set (the arguments are already evaluated). """
+
+    def __init__(self, ast, env, exn=None, w_callable=None, args_w=None):
+        self.ast        = ast
+        self.env        = env
+        self.exn        = exn
+        self.w_callable = w_callable
+        self.args_w     = args_w
+        self.frames     = []
+
+    def resume(self, cont):
+        """ Build the continuation and take one step of the CEK machine. """
+        for i in range(len(self.frames) - 1, -1, -1):
+            cont = self.frames[i].make_cont(cont)
+        if self.exn is not None:
+            from pycket.prims.control import convert_runtime_exception
+            return convert_runtime_exception(self.exn, self.env, cont)
+        if self.w_callable is not None:
+            return self.w_callable.call_with_extra_info(
+                    self.args_w, self.env, cont, self.ast)
+        return self.ast.interpret(self.env, cont)
+
+class Frame(object):
+    _attrs_ = ['env']
+
+    def make_cont(self, prev):
+        raise NotImplementedError("abstract base class")
+
+class LetFrame(Frame):
+    _attrs_ = ['ast', 'index', 'vals_w']
+
+    def __init__(self, ast, index, vals_w, env):
+        self.ast    = ast
+        self.index  = index
+        self.vals_w = vals_w
+        self.env    = env
+
+    def make_cont(self, prev):
+        return LetCont.make(self.vals_w, self.ast, self.index, self.env, prev)
+
+class LetrecFrame(Frame):
+    _attrs_ = ['ast', 'index']
+
+    def __init__(self, ast, index, env):
+        self.ast   = ast
+        self.index = index
+        self.env   = env
+
+    def make_cont(self, prev):
+        return LetrecCont(self.ast.counting_asts[self.index], self.env, prev)
+
+class BeginFrame(Frame):
+    _attrs_ = ['ast', 'index']
+
+    def __init__(self, ast, index, env):
+        self.ast   = ast
+        self.index = index
+        self.env   = env
+
+    def make_cont(self, prev):
+        return BeginCont(self.ast.counting_asts[self.index], self.env, prev)
+
+class Begin0Frame(Frame):
+    _attrs_ = ['ast']
+
+    def __init__(self, ast, env):
+        self.ast = ast
+        self.env = env
+
+    def make_cont(self, prev):
+        return Begin0Cont(self.ast, self.env, prev)
+
+class Begin0BodyFrame(Frame):
+    _attrs_ = ['ast', 'index', 'vals_w']
+
+    def __init__(self, ast, index, vals_w, env):
+        self.ast    = ast
+        self.index  = index
+        self.vals_w = vals_w
+        self.env    = env
+
+    def make_cont(self, prev):
+        return Begin0BodyCont.make(self.vals_w, self.ast, self.index, self.env, prev)
+
+class CellFrame(Frame):
+    _attrs_ = ['ast']
+
+    def __init__(self, ast, env):
+        self.ast = ast
+        self.env = env
+
+    def make_cont(self, prev):
+        return CellCont(self.ast, self.env, prev)
+
+def eval_direct(ast, env, depth):
+    """ Evaluate ast in env and return its values, or raise Fallback. """
+    if depth > DEPTH_LIMIT:
+        raise Fallback(ast, env)
+    while True:
+        if isinstance(ast, SimplePrimApp1) or isinstance(ast, SimplePrimApp2):
+            try:
+                return ast.run(env)
+            except SchemeException, exn:
+                raise Fallback(ast, env, exn)
+        elif ast.simple:
+            return ast.interpret_simple(env)
+        elif isinstance(ast, If):
+            if ast.tst.interpret_simple(env) is values.w_false:
+                ast = ast.els
+            else:
+                ast = ast.thn
+        elif isinstance(ast, Let):
+            env = eval_let_bindings(ast, env, depth)
+            ast, env = eval_body(ast, env, depth)
+        elif isinstance(ast, Letrec):
+            env = eval_letrec_bindings(ast, env, depth)
+            ast, env = eval_body(ast, env, depth)
+        elif isinstance(ast, Begin0):
+            return eval_begin0(ast, env, depth)
+        elif isinstance(ast, SequencedBodyAST):
+            ast, env = eval_body(ast, env, depth)
+        elif isinstance(ast, Cell):
+            return eval_cell(ast, env, depth)
+        elif isinstance(ast, DefineValues):
+            ast = ast.rhs
+        elif isinstance(ast, App):
+            if config.lambda_profiling:
+                # the profiler keeps its frames on the continuation
+                raise Fallback(ast, env)
+            w_callable = ast.rator.interpret_simple(env)
+            args_w = [None] * len(ast.rands)
+            for i, rand in enumerate(ast.rands):
+                args_w[i] = rand.interpret_simple(env)
+            if isinstance(w_callable, values.W_PromotableClosure):
+                w_callable = w_callable.closure
+            if isinstance(w_callable, values.W_Closure):
+                lam, env = w_callable.prepare_call(args_w, env, ast)
+                ast, env = eval_body(lam, env, depth)
+            elif isinstance(w_callable, values.W_Closure1AsEnv):
+                lam, env = w_callable.prepare_call(args_w, env, ast)
+                ast, env = eval_body(lam, env, depth)
+            elif (isinstance(w_callable, values.W_Prim) and
+                    w_callable.simple_n is not None):
+                if config.allocation_profiling:
+                    from pycket.alloc_profile import enter_prim
+                    enter_prim(w_callable)
+                try:
+                    result = w_callable.simple_n(args_w)
+                except SchemeException, exn:
+                    raise Fallback(ast, env, exn)
+                if result is None:
+                    result = values.w_void
+                return result
+            else:
+                raise Fallback(ast, env, w_callable=w_callable, args_w=args_w)
+        else:
+            raise Fallback(ast, env)
+
+def eval_body(ast, env, depth):
+    """ Evaluate all but the last expression of the body of ast, the way
+    make_begin_cont sequences them, and return the last one with the
+    environment to evaluate it in. """
+    env = ast._prune_sequenced_envs(env, 0)
+    last = len(ast.body) - 1
+    for i in range(last):
+        new_env = ast._prune_sequenced_envs(env, i + 1)
+        try:
+            eval_direct(ast.body[i], env, depth + 1)
+        except Fallback, fallback:
+            fallback.frames.append(BeginFrame(ast, i + 1, new_env))
+            raise
+        env = new_env
+    return ast.body[last], env
+
+def eval_let_bindings(ast, env, depth):
+    """ Evaluate the right-hand sides of a let and return the environment of
+    its body, mirroring LetCont. """
+    env = ast._prune_env(env, 0)
+    vals_w = []
+    for i, rhs in enumerate(ast.rhss):
+        try:
+            vals = eval_direct(rhs, env, depth + 1)
+        except Fallback, fallback:
+            fallback.frames.append(LetFrame(ast, i, vals_w[:] if vals_w else None, env))
+            raise
+        if ast.counts[i] != vals.num_values():
+            raise SchemeException("wrong number of values")
+        for j in range(vals.num_values()):
+            vals_w.append(vals.get_value(j))
+        env = ast._prune_env(env, i + 1)
+    for i in range(len(vals_w)):
+        vals_w[i] = ast.wrap_value(vals_w[i], i)
+    return ConsEnv.make(vals_w, env)
+
+def eval_letrec_bindings(ast, env, depth):
+    """ Evaluate the right-hand sides of a letrec into the cells of its
+    environment, mirroring LetrecCont. """
+    n_elems = len(ast.args.elems)
+    env_new = ConsEnv.make_n(n_elems, env)
+    if n_elems:
+        assert isinstance(env_new, ConsEnv)
+        for i in range(n_elems):
+            env_new._set_list(i, values.W_Cell(None))
+    for i, rhs in enumerate(ast.rhss):
+        try:
+            vals = eval_direct(rhs, env_new, depth + 1)
+        except Fallback, fallback:
+            fallback.frames.append(LetrecFrame(ast, i, env_new))
+            raise
+        if ast.counts[i] != vals.num_values():
+            raise SchemeException("wrong number of values")
+        for j in range(vals.num_values()):
+            v = env_new.lookup(ast.args.elems[ast.total_counts[i] + j], ast.args)
+            assert isinstance(v, values.W_Cell)
+            v.set_val(vals.get_value(j))
+    return env_new
+
+def eval_begin0(ast, env, depth):
+    try:
+        vals = eval_direct(ast.first, env, depth + 1)
+    except Fallback, fallback:
+        fallback.frames.append(Begin0Frame(ast, env))
+        raise
+    vals_w = vals.get_all_values()
+    for i, body in enumerate(ast.body):
+        try:
+            eval_direct(body, env, depth + 1)
+        except Fallback, fallback:
+            fallback.frames.append(Begin0BodyFrame(ast, i, vals_w, env))
+            raise
+    return values.Values.make(vals_w)
+
+def eval_cell(ast, env, depth):
+    try:
+        vals = eval_direct(ast.expr, env, depth + 1)
+    except Fallback, fallback:
+        fallback.frames.append(CellFrame(ast, env))
+        raise
+    vals_w = []
+    for i, needs_cell in enumerate(ast.need_cell_flags):
+        w_val = vals.get_value(i)
+        if needs_cell:
+            w_val = values.W_Cell(w_val)
+        vals_w.append(w_val)
+    return values.Values.make(vals_w)
+
+def inner_interpret_direct(ast, env, cont):
+    while True:
+        try:
+            vals = eval_direct(ast, env, 0)
+        except Fallback, fallback:
+            ast, env, cont = fallback.resume(cont)
+        else:
+            ast, env, cont = return_multi_vals(vals, env, cont)
@@ -22,12 +22,31 @@ def save_callgraph(config, env):
         with open('callgraph.dot', 'w') as outfile:
             env.callgraph.write_dot_file(outfile)
 
+@register_post_run_callback
+def report_lambda_profile(config, env):
+    if env.pycketconfig().lambda_profiling:
+        from pycket.lambda_profile import print_report
+        print_report()
+
+@register_post_run_callback
+def report_allocation_profile(config, env):
+    if env.pycketconfig().allocation_profiling:
+        from pycket.alloc_profile import print_report
+        print_report()
+
+@register_post_run_callback
+def report_perf_stats(config, env):
+    if config.get('stats', False):
+        from pycket.perf_stats import print_report
+        print_report()
+
 def make_entry_point(pycketconfig=None):
     from pycket.expand import JsonLoader, ModuleMap, PermException
     from pycket.interpreter import interpret_one, ToplevelEnv, interpret_module
     from pycket.error import SchemeException
     from pycket.option_helper import parse_args, ensure_json_ast
     from pycket.values_string import W_String
+    from pycket import perf_stats
 
     def entry_point(argv):
         if not objectmodel.we_are_translated():
@@ -45,10 +64,13 @@ def make_entry_point(pycketconfig=None):
         jit.set_param(None, "threshold", 131)
         jit.set_param(None, "trace_eagerness", 50)
         jit.set_param(None, "max_unroll_loops", 15)
+        perf_stats.state.startup()
 
         config, names, args, retval = parse_args(argv)
         if retval != 0 or config is None:
             return retval
+        if config.get('stats', False):
+            perf_stats.state.enable_jit_stats()
         args_w = [W_String.fromstr_utf8(arg) for arg in args]
         module_name, json_ast = ensure_json_ast(config, names)
 
@@ -86,6 +108,9 @@ def target(driver, args): #pragma: no cover
     config = driver.config
     parser = to_optparse(config, useoptions=["pycket.*"])
     parser.parse_args(args)
+    if not config.translation.jit:
+        # the CEK machine mostly pays off when its loops are traced
+        config.pycket.suggest(direct_interpretation=True)
     if config.pycket.with_branch:
         import subprocess
         base_name = subprocess.check_output(["git", "rev-parse", "--abbrev-ref", "HEAD"]).strip()
@@ -99,9 +124,20 @@ def target(driver, args): #pragma: no cover
     # it's important that the very first thing we do, before importing anything
     # else from pycket is call expose_options
     expose_options(config)
+    from pycket import perf_stats
+    perf_stats.JIT_AVAILABLE = config.translation.jit
     entry_point = make_entry_point(config)
+    if config.pycket.allocation_profiling:
+        # all value and continuation classes exist once the entry point has
+        # imported the interpreter
+        from pycket.alloc_profile import instrument_classes
+        instrument_classes()
     return entry_point, None
 
+def get_gchooks(): #pragma: no cover
+    from pycket.perf_stats import gchooks
+    return gchooks
+
 def get_additional_config_options(): #pragma: no cover
     from pycket.config import pycketoption_descr
     return pycketoption_descr
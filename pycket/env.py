@@ -1,4 +1,5 @@
 from rpython.rlib             import jit, objectmodel
+from rpython.rlib.rarithmetic import intmask
 from pycket.small_list        import inline_small_list
 from pycket.error             import SchemeException
 from pycket.base              import W_Object
@@ -6,7 +7,44 @@ from pycket.callgraph         import CallGraph
 from pycket.config            import get_testing_config
 
 
+# the number of SymLists kept for sharing, the table is emptied when it is full
+# so that programs building environment structures at run time (with eval) do
+# not keep all of them alive
+SYMLIST_TABLE_LIMIT = 4096
+
+def symlist_eq(a, b):
+    if a.prev is not b.prev or len(a.elems) != len(b.elems):
+        return False
+    for i in range(len(a.elems)):
+        if a.elems[i] is not b.elems[i]:
+            return False
+    return True
+
+def symlist_hash(a):
+    x = 0x345678
+    if a.prev is not None:
+        x = objectmodel.compute_identity_hash(a.prev)
+    for elem in a.elems:
+        x = intmask((1000003 * x) ^ objectmodel.compute_identity_hash(elem))
+    return x
+
+class SymListTable(object):
+    """ The SymLists made by SymList.make, by their elements and prev. """
+    _attrs_ = ["symlists"]
+
+    def __init__(self):
+        self.symlists = objectmodel.r_dict(symlist_eq, symlist_hash)
+
+    def intern(self, symlist):
+        result = self.symlists.get(symlist, None)
+        if result is None:
+            if len(self.symlists) >= SYMLIST_TABLE_LIMIT:
+                self.symlists.clear()
+            result = self.symlists[symlist] = symlist
+        return result
+
 class SymList(object):
+    _attrs_ = ["elems", "prev"]
     _immutable_fields_ = ["elems[*]", "prev"]
 
     def __init__(self, elems, prev=None):
@@ -14,6 +52,13 @@ class SymList(object):
         self.elems = elems
         self.prev = prev
 
+    @staticmethod
+    def make(elems, prev=None):
+        """ Return the SymList of elems and prev, which is shared by the calls
+        with the same elements and the same prev as long as it stays in the
+        (bounded) table. """
+        return symlist_table.intern(SymList(elems, prev))
+
     def check_plausibility(self, env):
         if self.elems:
             assert len(self.elems) == env.consenv_get_size()
@@ -77,6 +122,8 @@ class SymList(object):
     def __repr__(self):
         return "SymList(%r, %r)" % (self.elems, self.prev)
 
+symlist_table = SymListTable()
+
 class ModuleEnv(object):
     _immutable_fields_ = ["modules", "toplevel_env"]
     def __init__(self, toplevel_env):
@@ -12,9 +12,15 @@ class SchemeException(Exception):
     def is_user(self):
         return False
 
+    def is_contract(self):
+        return False
+
+    def get_msg(self):
+        return self.msg
+
     def format_error(self): # pragma: no cover
         # only error printing
-        result = self.msg
+        result = self.get_msg()
         if self.context_ast:
             result += "\n  while executing: %s" % (
                 self.context_ast.tostring(), )
@@ -28,4 +34,28 @@ class SchemeException(Exception):
 
 class UserException(SchemeException):
     def is_user(self):
-        return True
\ No newline at end of file
+        return True
+
+class LazySchemeException(SchemeException):
+    """ A SchemeException whose message includes the printed form of a value.
+    Printing the value can be expensive and is often not needed at all, as
+    when a handler only checks the type of the exception, so the message is
+    only built by get_msg. """
+
+    def __init__(self, prefix, w_value, suffix=""):
+        SchemeException.__init__(self, None)
+        self.prefix  = prefix
+        self.w_value = w_value
+        self.suffix  = suffix
+
+    def get_msg(self):
+        if self.msg is None:
+            self.msg = self.prefix + self.w_value.tostring() + self.suffix
+        return self.msg
+
+class ContractException(LazySchemeException):
+    """ A primitive was applied to a value it does not accept; it is raised to
+    Racket as exn:fail:contract. """
+
+    def is_contract(self):
+        return True
@@ -245,9 +245,11 @@ def parse_ast(json_string):
 def finalize_module(mod):
     from pycket.interpreter    import Context
     from pycket.assign_convert import assign_convert
+    from pycket.loop_headers   import mark_loop_headers
     mod = Context.normalize_term(mod)
     mod = assign_convert(mod)
     mod.clean_caches()
+    mark_loop_headers(mod)
     return mod
 
 def parse_module(json_string, bytecode_expand=False):
@@ -379,6 +381,15 @@ class SourceInfo(object):
         self.span = span
         self.sourcefile = sourcefile
 
+    def tostring(self):
+        if self.sourcefile is None:
+            return "<unknown>"
+        if self.line >= 0:
+            return "%s:%d:%d" % (self.sourcefile, self.line, self.column)
+        if self.position >= 0:
+            return "%s:%d" % (self.sourcefile, self.position)
+        return self.sourcefile
+
 JSON_TYPES = unrolling_iterable(['string', 'int', 'float', 'object', 'array'])
 
 @specialize.arg(2)
@@ -413,6 +424,51 @@ def get_srcloc(o):
 def convert_path(path):
     return [p.value_string() for p in path]
 
+# The modules of racket/set defining the hash set operations, whose bindings
+# in NATIVE_SET_NAMES are resolved to the primitives of prims/set.py when the
+# native_sets option is on. The constructors then make native sets, and the
+# operations of NATIVE_SET_OPERATIONS use the primitives on native sets and
+# the bindings of racket/set on the other generic sets, such as lists.
+NATIVE_SET_MODULES = ["/racket/set.rkt", "/racket/private/set.rkt",
+                      "/racket/private/set-types.rkt"]
+
+def is_native_set_module(srcmod, srcname):
+    from pycket import config
+    from pycket.prims.set import NATIVE_SET_NAMES
+    if not config.native_sets or srcmod is None:
+        return False
+    if srcname not in NATIVE_SET_NAMES:
+        return False
+    for suffix in NATIVE_SET_MODULES:
+        if srcmod.endswith(suffix):
+            return True
+    return False
+
+def is_native_set_binding(srcmod, srcname):
+    from pycket.prims.set import NATIVE_SET_OPERATIONS
+    return (is_native_set_module(srcmod, srcname) and
+            srcname not in NATIVE_SET_OPERATIONS)
+
+def is_native_set_operation(srcmod, srcname):
+    from pycket.prims.set import NATIVE_SET_OPERATIONS
+    return (is_native_set_module(srcmod, srcname) and
+            srcname in NATIVE_SET_OPERATIONS)
+
+# The modules of the Racket library that define, in Racket, the operations of
+# NATIVE_HASH_NAMES. Their bindings are always resolved to the primitives of
+# prims/hash.py, which otherwise would never be reached.
+NATIVE_HASH_MODULES = ["/racket/private/more-scheme.rkt",
+                       "/racket/private/hash.rkt"]
+
+def is_native_hash_binding(srcmod, srcname):
+    from pycket.prims.hash import NATIVE_HASH_NAMES
+    if srcmod is None or srcname not in NATIVE_HASH_NAMES:
+        return False
+    for suffix in NATIVE_HASH_MODULES:
+        if srcmod.endswith(suffix):
+            return True
+    return False
+
 def parse_path(p):
     assert len(p) >= 1
     arr = convert_path(p)
@@ -719,7 +775,12 @@ class JsonLoader(object):
                 else:
                     srcmod = "#%kernel"
                     path   = None
-                return ModuleVar(modsym, srcmod, srcsym, path=path)
+                if (is_native_set_binding(srcmod, srcname) or
+                        is_native_hash_binding(srcmod, srcname)):
+                    srcmod = "#%kernel"
+                    path   = None
+                native = is_native_set_operation(srcmod, srcname)
+                return ModuleVar(modsym, srcmod, srcsym, path=path, native=native)
             if "lexical" in obj:
                 return LexicalVar(mksym(obj["lexical"].value_string()))
             if "toplevel" in obj:
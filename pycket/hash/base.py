@@ -46,6 +46,11 @@ class W_HashTable(W_Object):
     def make_empty(self):
         raise NotImplementedError("abstract method")
 
+    def make_mutable_copy(self):
+        """ A mutable table with the same entries, the result of hash-copy, or
+        None if the entries can only be copied with a continuation. """
+        return None
+
     def get_item(self, i):
         # see get_dict_item at the bottom of the file for the interface
         raise NotImplementedError("abstract method")
@@ -3,13 +3,16 @@ from pycket                   import config
 from pycket                   import values, values_string
 from pycket.base              import SingletonMeta, UnhashableType
 from pycket.hash.base         import W_HashTable, get_dict_item, next_valid_index, w_missing
+from pycket.hash.persistent_hash_map import make_persistent_hash_type
+from pycket.hash.simple       import W_EqvImmutableHashTable
 from pycket.error             import SchemeException
 from pycket.cont              import continuation, loop_label
 from rpython.rlib             import rerased, jit
 from rpython.rlib.rarithmetic import r_uint, intmask
 from rpython.rlib.objectmodel import compute_hash, import_from_mixin, r_dict, specialize
 
-import sys
+import math
+
 
 def elidable_iff(pred):
     def wrapper(func):
@@ -23,46 +26,6 @@ def elidable_iff(pred):
         return inner
     return wrapper
 
-@loop_label
-def equal_hash_ref_loop(data, idx, key, env, cont):
-    from pycket.interpreter import return_value
-    from pycket.prims.equal import equal_func_unroll_n, EqualInfo
-    if idx >= len(data):
-        return return_value(w_missing, env, cont)
-    k, v = data[idx]
-    info = EqualInfo.BASIC_SINGLETON
-    cont = catch_ref_is_equal_cont(data, idx, key, v, env, cont)
-    return equal_func_unroll_n(k, key, info, env, cont, 5)
-
-@continuation
-def catch_ref_is_equal_cont(data, idx, key, v, env, cont, _vals):
-    from pycket.interpreter import check_one_val, return_value
-    val = check_one_val(_vals)
-    if val is not values.w_false:
-        return return_value(v, env, cont)
-    return equal_hash_ref_loop(data, idx + 1, key, env, cont)
-
-def equal_hash_set_loop(data, idx, key, val, env, cont):
-    from pycket.interpreter import check_one_val, return_value
-    from pycket.prims.equal import equal_func, EqualInfo
-    if idx >= len(data):
-        data.append((key, val))
-        return return_value(values.w_void, env, cont)
-    k, _ = data[idx]
-    info = EqualInfo.BASIC_SINGLETON
-    return equal_func(k, key, info, env,
-            catch_set_is_equal_cont(data, idx, key, val, env, cont))
-
-@continuation
-def catch_set_is_equal_cont(data, idx, key, val, env, cont, _vals):
-    from pycket.interpreter import check_one_val, return_value
-    cmp = check_one_val(_vals)
-    if cmp is not values.w_false:
-        data[idx] = (key, val)
-        return return_value(values.w_void, env, cont)
-    return equal_hash_set_loop(data, idx + 1, key, val, env, cont)
-
-
 class HashmapStrategy(object):
     __metaclass__ = SingletonMeta
 
@@ -93,6 +56,33 @@ class HashmapStrategy(object):
     def create_storage(self, keys, vals):
         raise NotImplementedError("abstract base class")
 
+    def copy_storage(self, w_dict):
+        """ A copy of the storage of the mutable table w_dict. """
+        raise NotImplementedError("abstract base class")
+
+    def remove(self, w_dict, w_key, env, cont):
+        raise NotImplementedError("abstract base class")
+
+    # The slot interface of mutable tables lets hash-ref! and hash-update!
+    # look a key up once. find_slot passes to cont two values, the value for
+    # the key, or w_missing, and the position of its entry as a fixnum, or -1
+    # if there is none. The position stays valid as long as slot_token does
+    # not change.
+
+    def find_slot(self, w_dict, w_key, env, cont):
+        raise NotImplementedError("abstract base class")
+
+    def slot_set(self, w_dict, pos, w_key, w_val, env, cont):
+        raise NotImplementedError("abstract base class")
+
+    def slot_token(self, w_dict):
+        return 0
+
+    def set_many(self, w_dict, keys, vals):
+        """ Set the keys without a continuation if that can be done without
+        comparing them with equal?, and return whether it was. """
+        return False
+
 @jit.look_inside_iff(lambda keys:
         jit.loop_unrolling_heuristic(
                 keys, len(keys), values.UNROLLING_CUTOFF))
@@ -102,12 +92,21 @@ def _find_strategy_class(keys):
     if len(keys) == 0:
         return EmptyHashmapStrategy.singleton
         # An empty vector stays empty forever. Don't implement special EmptyVectorStrategy.
+    if is_fixnum_pair(keys[0]):
+        for elem in keys:
+            if not is_fixnum_pair(elem):
+                return ObjectHashmapStrategy.singleton
+        return FixnumPairHashmapStrategy.singleton
     single_class = type(keys[0])
     for elem in keys:
         if not isinstance(elem, single_class):
             return ObjectHashmapStrategy.singleton
     if single_class is values.W_Fixnum:
         return FixnumHashmapStrategy.singleton
+    if single_class is values.W_Flonum:
+        return FlonumHashmapStrategy.singleton
+    if single_class is values.W_Character:
+        return CharacterHashmapStrategy.singleton
     if single_class is values.W_Symbol:
         return SymbolHashmapStrategy.singleton
     if single_class is values_string.W_String:
@@ -118,6 +117,42 @@ def _find_strategy_class(keys):
         return MutableByteHashmapStrategy.singleton
     return ObjectHashmapStrategy.singleton
 
+def is_eqv_key(w_key):
+    """ Keys that are equal? to another value only if they are eqv? to it. """
+    return (isinstance(w_key, values.W_Fixnum) or
+            isinstance(w_key, values.W_Symbol) or
+            isinstance(w_key, values.W_Character) or
+            isinstance(w_key, values.W_Flonum) or
+            isinstance(w_key, values.W_Bool) or
+            isinstance(w_key, values.W_Keyword))
+
+@jit.look_inside_iff(lambda keys:
+        jit.loop_unrolling_heuristic(
+                keys, len(keys), values.UNROLLING_CUTOFF))
+def _find_persistent_strategy_class(keys):
+    if not config.strategies:
+        return PersistentObjectHashmapStrategy.singleton
+    if len(keys) == 0:
+        return EmptyHashmapStrategy.singleton
+    for elem in keys:
+        if not is_eqv_key(elem):
+            return PersistentObjectHashmapStrategy.singleton
+    return PersistentEqvHashmapStrategy.singleton
+
+def distinct_hashes(keys):
+    """ The tagged hashes of keys, or None if two of them are the same. Keys
+    with different hashes are not equal?, so an immutable table with them can
+    be built without comparing them with equal?. """
+    hashes = [0] * len(keys)
+    seen = {}
+    for i in range(len(keys)):
+        hash = tagged_hash(keys[i])
+        if hash in seen:
+            return None
+        seen[hash] = None
+        hashes[i] = hash
+    return hashes
+
 class UnwrappedHashmapStrategyMixin(object):
     # the concrete class needs to implement:
     # erase, unerase, is_correct_type, wrap, unwrap
@@ -158,6 +193,44 @@ class UnwrappedHashmapStrategyMixin(object):
         key = self.unwrap(w_key)
         storage[key] = w_val
 
+    def find_slot(self, w_dict, w_key, env, cont):
+        from pycket.interpreter import return_two_vals
+        if self.is_correct_type(w_key):
+            # the dict has no positions, the store probes it once more
+            w_val = self.get_storage(w_dict).get(self.unwrap(w_key), w_missing)
+            pos = -1 if w_val is w_missing else 0
+            return return_two_vals(w_val, values.W_Fixnum(pos), env, cont)
+        self.switch_to_object_strategy(w_dict)
+        return w_dict.find_slot(w_key, env, cont)
+
+    def slot_set(self, w_dict, pos, w_key, w_val, env, cont):
+        return self.set(w_dict, w_key, w_val, env, cont)
+
+    def remove(self, w_dict, w_key, env, cont):
+        from pycket.interpreter import return_value
+        if self.is_correct_type(w_key):
+            storage = self.get_storage(w_dict)
+            key = self.unwrap(w_key)
+            if key in storage:
+                del storage[key]
+        # a key of another type is not equal? to any of the keys here
+        return return_value(values.w_void, env, cont)
+
+    def hash_iterate_next(self, w_dict, pos):
+        try:
+            next = next_valid_index(self.unerase(w_dict.hstorage), pos.value)
+        except IndexError:
+            return values.w_false
+        return values.wrap(next)
+
+    def hash_iterate_first(self, w_dict):
+        storage = self.unerase(w_dict.hstorage)
+        try:
+            get_dict_item(storage, 0)
+        except KeyError:
+            return next_valid_index(storage, 0)
+        return 0
+
     def items(self, w_dict):
         return [(self.wrap(key), w_val) for key, w_val in self.unerase(w_dict.hstorage).iteritems()]
 
@@ -168,6 +241,9 @@ class UnwrappedHashmapStrategyMixin(object):
     def length(self, w_dict):
         return len(self.unerase(w_dict.hstorage))
 
+    def copy_storage(self, w_dict):
+        return self.erase(self.unerase(w_dict.hstorage).copy())
+
     def create_storage(self, keys, vals):
         d = self._create_empty_dict()
         if not keys:
@@ -203,6 +279,33 @@ class EmptyHashmapStrategy(HashmapStrategy):
         self.switch_to_correct_strategy(w_dict, w_key)
         return w_dict._set(w_key, w_val)
 
+    def remove(self, w_dict, w_key, env, cont):
+        from pycket.interpreter import return_value
+        return return_value(values.w_void, env, cont)
+
+    def find_slot(self, w_dict, w_key, env, cont):
+        from pycket.interpreter import return_two_vals
+        return return_two_vals(w_missing, values.W_Fixnum(-1), env, cont)
+
+    def slot_set(self, w_dict, pos, w_key, w_val, env, cont):
+        return self.set(w_dict, w_key, w_val, env, cont)
+
+    def set_many(self, w_dict, keys, vals):
+        if not w_dict.is_immutable:
+            return False
+        strategy = _find_persistent_strategy_class(keys)
+        if strategy is PersistentObjectHashmapStrategy.singleton:
+            # the hashes are needed for the buckets anyway
+            hashes = distinct_hashes(keys)
+            if hashes is None:
+                return False
+            w_dict.hstorage = strategy.create_storage_hashed(keys, hashes, vals)
+        else:
+            # eqv? keys are only equal? if they are eqv?
+            w_dict.hstorage = strategy.create_storage(keys, vals)
+        w_dict.strategy = strategy
+        return True
+
     def items(self, w_dict):
         return []
 
@@ -212,14 +315,28 @@ class EmptyHashmapStrategy(HashmapStrategy):
     def length(self, w_dict):
         return 0
 
+    def copy_storage(self, w_dict):
+        return w_dict.hstorage
+
     def create_storage(self, keys, vals):
         assert not keys
         assert not vals
         return self.erase(None)
 
     def switch_to_correct_strategy(self, w_dict, w_key):
-        if type(w_key) is values.W_Fixnum:
+        if w_dict.is_immutable:
+            if is_eqv_key(w_key):
+                strategy = PersistentEqvHashmapStrategy.singleton
+            else:
+                strategy = PersistentObjectHashmapStrategy.singleton
+        elif type(w_key) is values.W_Fixnum:
             strategy = FixnumHashmapStrategy.singleton
+        elif type(w_key) is values.W_Flonum:
+            strategy = FlonumHashmapStrategy.singleton
+        elif type(w_key) is values.W_Character:
+            strategy = CharacterHashmapStrategy.singleton
+        elif is_fixnum_pair(w_key):
+            strategy = FixnumPairHashmapStrategy.singleton
         elif type(w_key) is values.W_Symbol:
             strategy = SymbolHashmapStrategy.singleton
         elif isinstance(w_key, values_string.W_String):
@@ -242,114 +359,294 @@ def tagged_hash(w_object):
     except UnhashableType:
         return UNHASHABLE_TAG
 
+FREE    = -1
+DELETED = -2
+
+# steps of equal? tried without a continuation before falling back to
+# equal_func
+EQUAL_FUEL = 100
+
+class ObjectDict(object):
+    """
+    The storage of ObjectHashmapStrategy, an open-addressing table. The entries
+    are kept in insertion order in parallel lists of hashes, keys and values,
+    and their positions are the iteration positions. A removed entry leaves a
+    None key behind until the table is resized. The index maps slots to entry
+    positions (or FREE or DELETED) and is probed like the dicts of CPython.
+    """
+    _attrs_ = ['hashes', 'keys', 'vals', 'index', 'size', 'generation']
+
+    def __init__(self):
+        self.hashes     = []
+        self.keys       = []
+        self.vals       = []
+        self.index      = [FREE] * 8
+        self.size       = 0
+        # changes whenever entries are added or removed, see
+        # object_dict_find_cont and W_EqualHashTable.slot_set
+        self.generation = 0
+
+    def copy(self):
+        copy = ObjectDict()
+        copy.hashes = self.hashes[:]
+        copy.keys   = self.keys[:]
+        copy.vals   = self.vals[:]
+        copy.index  = self.index[:]
+        copy.size   = self.size
+        return copy
+
+    def find(self, hash, w_key):
+        """ The position of the entry for w_key, -1 if there is none, or -2
+        if the keys have to be compared with equal_func. """
+        mask = len(self.index) - 1
+        perturb = r_uint(hash)
+        i = intmask(perturb & r_uint(mask))
+        from pycket.prims.equal import EQUAL_TRUE, EQUAL_UNKNOWN, equal_without_cont
+        result = -1
+        while True:
+            pos = self.index[i]
+            if pos == FREE:
+                return result
+            if pos != DELETED and self.hashes[pos] == hash:
+                w_other = self.keys[pos]
+                if w_other is w_key:
+                    return pos
+                cmp = equal_without_cont(w_other, w_key, EQUAL_FUEL)
+                if cmp == EQUAL_TRUE:
+                    return pos
+                if cmp == EQUAL_UNKNOWN:
+                    result = -2
+            perturb >>= 5
+            i = intmask((r_uint(i) * 5 + perturb + 1) & r_uint(mask))
+
+    def candidates(self, hash):
+        """ The positions of the entries with the given hash. """
+        result = []
+        mask = len(self.index) - 1
+        perturb = r_uint(hash)
+        i = intmask(perturb & r_uint(mask))
+        while True:
+            pos = self.index[i]
+            if pos == FREE:
+                return result
+            if pos != DELETED and self.hashes[pos] == hash:
+                result.append(pos)
+            perturb >>= 5
+            i = intmask((r_uint(i) * 5 + perturb + 1) & r_uint(mask))
+
+    def free_slot(self, hash):
+        mask = len(self.index) - 1
+        perturb = r_uint(hash)
+        i = intmask(perturb & r_uint(mask))
+        while self.index[i] != FREE:
+            perturb >>= 5
+            i = intmask((r_uint(i) * 5 + perturb + 1) & r_uint(mask))
+        return i
+
+    def add(self, hash, w_key, w_val):
+        if (len(self.keys) + 1) * 3 >= len(self.index) * 2:
+            self.resize()
+        self.index[self.free_slot(hash)] = len(self.keys)
+        self.hashes.append(hash)
+        self.keys.append(w_key)
+        self.vals.append(w_val)
+        self.size += 1
+        self.generation += 1
+
+    def remove(self, pos):
+        hash = self.hashes[pos]
+        mask = len(self.index) - 1
+        perturb = r_uint(hash)
+        i = intmask(perturb & r_uint(mask))
+        while self.index[i] != pos:
+            perturb >>= 5
+            i = intmask((r_uint(i) * 5 + perturb + 1) & r_uint(mask))
+        self.index[i] = DELETED
+        self.keys[pos] = None
+        self.vals[pos] = None
+        self.size -= 1
+        self.generation += 1
+
+    def resize(self):
+        """ Drop the removed entries and make room for as many again as are
+        left. """
+        hashes = []
+        keys   = []
+        vals   = []
+        for pos in range(len(self.keys)):
+            w_key = self.keys[pos]
+            if w_key is not None:
+                hashes.append(self.hashes[pos])
+                keys.append(w_key)
+                vals.append(self.vals[pos])
+        new_size = 8
+        while new_size <= len(keys) * 3:
+            new_size *= 2
+        self.hashes = hashes
+        self.keys   = keys
+        self.vals   = vals
+        self.index  = [FREE] * new_size
+        self.generation += 1
+        for pos in range(len(keys)):
+            self.index[self.free_slot(hashes[pos])] = pos
+
+    def next_position(self, pos):
+        """ The first position after pos with an entry, -1 if there is none. """
+        pos += 1
+        while pos < len(self.keys):
+            if self.keys[pos] is not None:
+                return pos
+            pos += 1
+        return -1
+
+ACTION_REF    = 0
+ACTION_SET    = 1
+ACTION_REMOVE = 2
+ACTION_SLOT   = 3
+
 class ObjectHashmapStrategy(HashmapStrategy):
     erase, unerase = rerased.new_static_erasing_pair("object-hashmap-strategry")
 
-    import_from_mixin(UnwrappedHashmapStrategyMixin)
-
-    def get_bucket(self, w_dict, w_key, nonull=False):
-        hash    = tagged_hash(w_key)
-        storage = self.get_storage(w_dict)
-        bucket  = storage.get(hash, None)
-        if nonull and bucket is None:
-            storage[hash] = bucket = []
-        return bucket
+    def get_storage(self, w_dict):
+        return self.unerase(w_dict.hstorage)
 
     def get(self, w_dict, w_key, env, cont):
-        from pycket.interpreter import return_value
-        bucket = self.get_bucket(w_dict, w_key)
-        if not bucket:
-            return return_value(w_missing, env, cont)
-        return equal_hash_ref_loop(bucket, 0, w_key, env, cont)
+        return object_dict_find(w_dict, w_key, ACTION_REF, None, env, cont)
 
     def set(self, w_dict, w_key, w_val, env, cont):
-        bucket = self.get_bucket(w_dict, w_key, nonull=True)
-        return equal_hash_set_loop(bucket, 0, w_key, w_val, env, cont)
+        return object_dict_find(w_dict, w_key, ACTION_SET, w_val, env, cont)
+
+    def remove(self, w_dict, w_key, env, cont):
+        return object_dict_find(w_dict, w_key, ACTION_REMOVE, None, env, cont)
 
     def _set(self, w_dict, w_key, w_val):
-        raise NotImplementedError("Unsafe set not supported for ObjectHashmapStrategy")
+        self.insert(self.get_storage(w_dict), w_key, w_val)
+
+    def find_slot(self, w_dict, w_key, env, cont):
+        return object_dict_find(w_dict, w_key, ACTION_SLOT, None, env, cont)
+
+    def slot_set(self, w_dict, pos, w_key, w_val, env, cont):
+        from pycket.interpreter import return_value
+        storage = self.get_storage(w_dict)
+        if pos == -1:
+            storage.add(tagged_hash(w_key), w_key, w_val)
+        else:
+            storage.vals[pos] = w_val
+        return return_value(values.w_void, env, cont)
+
+    def slot_token(self, w_dict):
+        return self.get_storage(w_dict).generation
+
+    def insert(self, storage, w_key, w_val):
+        # keys that cannot be compared without a continuation are taken to be
+        # new, this is only used for keys that come from another table
+        hash = tagged_hash(w_key)
+        pos = storage.find(hash, w_key)
+        if pos >= 0:
+            storage.vals[pos] = w_val
+        else:
+            storage.add(hash, w_key, w_val)
 
     def items(self, w_dict):
+        storage = self.get_storage(w_dict)
         items = []
-        storage = self.unerase(w_dict.hstorage)
-        for bucket in storage.itervalues():
-            for item in bucket:
-                items.append(item)
+        for pos in range(len(storage.keys)):
+            w_key = storage.keys[pos]
+            if w_key is not None:
+                items.append((w_key, storage.vals[pos]))
         return items
 
-    if sys.maxint == 2147483647:
-
-        def get_item(self, w_dict, i):
-            storage = self.unerase(w_dict.hstorage)
-            for bucket in storage.itervalues():
-                size = len(bucket)
-                if size > i:
-                    return bucket[i]
-                i -= size
+    def get_item(self, w_dict, i):
+        storage = self.get_storage(w_dict)
+        if not (0 <= i < len(storage.keys)):
             raise IndexError
+        w_key = storage.keys[i]
+        if w_key is None:
+            raise KeyError
+        return w_key, storage.vals[i]
 
-    else:
+    def hash_iterate_next(self, w_dict, pos):
+        next = self.get_storage(w_dict).next_position(pos.value)
+        if next == -1:
+            return values.w_false
+        return values.wrap(next)
 
-        @staticmethod
-        def _valid_bucket(v):
-            return bool(v[1])
-
-        def get_item(self, w_dict, i):
-            from pycket.hash.persistent_hash_map import MASK_32
-            storage = self.unerase(w_dict.hstorage)
-            assert i >= 0
-            i = r_uint(i)
-            index = i & MASK_32
-            subindex = (i >> 32) & MASK_32
-
-            bucket = get_dict_item(storage, index)[1]
-            if bucket is None:
-                raise IndexError
-            return bucket[subindex]
-
-        def hash_iterate_next(self, w_dict, pos):
-            from pycket.hash.persistent_hash_map import MASK_32
-            storage = self.unerase(w_dict.hstorage)
-            i = r_uint(pos.value)
-            assert i >= 0
-            index    = r_uint(i & MASK_32)
-            subindex = r_uint((i >> 32) & MASK_32)
-
-            bucket = get_dict_item(storage, index)[1]
-            subindex += 1
-            if subindex == r_uint(len(bucket)):
-                subindex = r_uint(0)
-                try:
-                    next = next_valid_index(storage, intmask(index),
-                                            valid=self._valid_bucket)
-                except IndexError:
-                    return values.w_false
-                index = r_uint(next)
-
-            next = intmask((subindex << r_uint(32)) | index)
-            return values.wrap(next)
-
-        def hash_iterate_first(self, w_dict):
-            return next_valid_index(w_dict, 0, valid=self._valid_bucket)
+    def hash_iterate_first(self, w_dict):
+        pos = self.get_storage(w_dict).next_position(-1)
+        if pos == -1:
+            raise IndexError
+        return pos
 
     def length(self, w_dict):
-        storage = self.unerase(w_dict.hstorage)
-        size = 0
-        for bucket in storage.itervalues():
-            size += len(bucket)
-        return size
+        return self.get_storage(w_dict).size
+
+    def copy_storage(self, w_dict):
+        return self.erase(self.get_storage(w_dict).copy())
 
     def create_storage(self, keys, vals):
-        storage = {}
-        for i, key in enumerate(keys):
-            val  = vals[i]
-            hash = tagged_hash(key)
-            bucket = storage.get(hash, None)
-            if bucket is None:
-                storage[hash] = bucket = []
-            bucket.append((key, val))
+        storage = ObjectDict()
+        for i, w_key in enumerate(keys):
+            self.insert(storage, w_key, vals[i])
         return self.erase(storage)
 
+def object_dict_find(w_dict, w_key, action, w_val, env, cont):
+    storage = ObjectHashmapStrategy.singleton.get_storage(w_dict)
+    hash = tagged_hash(w_key)
+    pos = storage.find(hash, w_key)
+    if pos == -2:
+        candidates = storage.candidates(hash)
+        return object_dict_find_loop(w_dict, storage, storage.generation,
+                                     candidates, 0, hash, w_key, action, w_val,
+                                     env, cont)
+    return object_dict_found(storage, pos, hash, w_key, action, w_val, env, cont)
+
+def object_dict_found(storage, pos, hash, w_key, action, w_val, env, cont):
+    """ Carry out action for the entry at pos, -1 if there is none. """
+    from pycket.interpreter import return_value, return_two_vals
+    if action == ACTION_REF:
+        if pos == -1:
+            return return_value(w_missing, env, cont)
+        return return_value(storage.vals[pos], env, cont)
+    if action == ACTION_SLOT:
+        w_val = storage.vals[pos] if pos != -1 else w_missing
+        return return_two_vals(w_val, values.W_Fixnum(pos), env, cont)
+    if action == ACTION_SET:
+        if pos == -1:
+            storage.add(hash, w_key, w_val)
+        else:
+            storage.vals[pos] = w_val
+    elif pos != -1:
+        storage.remove(pos)
+    return return_value(values.w_void, env, cont)
+
+@loop_label
+def object_dict_find_loop(w_dict, storage, generation, candidates, idx, hash, w_key, action, w_val, env, cont):
+    from pycket.prims.equal import equal_func_unroll_n, EqualInfo
+    if idx >= len(candidates):
+        return object_dict_found(storage, -1, hash, w_key, action, w_val,
+                                 env, cont)
+    w_other = storage.keys[candidates[idx]]
+    if w_other is None:
+        return object_dict_find_loop(w_dict, storage, generation, candidates,
+                                     idx + 1, hash, w_key, action, w_val,
+                                     env, cont)
+    info = EqualInfo.BASIC_SINGLETON
+    cont = object_dict_find_cont(w_dict, storage, generation, candidates, idx,
+                                 w_other, hash, w_key, action, w_val, env, cont)
+    return equal_func_unroll_n(w_other, w_key, info, env, cont, 5)
+
+@continuation
+def object_dict_find_cont(w_dict, storage, generation, candidates, idx, w_other, hash, w_key, action, w_val, env, cont, _vals):
+    from pycket.interpreter import check_one_val
+    # equal? may have run code that changed the table
+    if storage.generation != generation or storage.keys[candidates[idx]] is not w_other:
+        return object_dict_find(w_dict, w_key, action, w_val, env, cont)
+    if check_one_val(_vals) is not values.w_false:
+        return object_dict_found(storage, candidates[idx], hash, w_key, action,
+                                 w_val, env, cont)
+    return object_dict_find_loop(w_dict, storage, generation, candidates,
+                                 idx + 1, hash, w_key, action, w_val, env, cont)
+
 class FixnumHashmapStrategy(HashmapStrategy):
     import_from_mixin(UnwrappedHashmapStrategyMixin)
 
@@ -367,6 +664,99 @@ class FixnumHashmapStrategy(HashmapStrategy):
         return w_val.value
 
 
+def hash_flonums(f):
+    return compute_hash(f)
+
+def cmp_flonums(f1, f2):
+    # eqv?, which tells 0.0 from -0.0 and makes every NaN the same
+    from rpython.rlib.longlong2float import float2longlong
+    return (float2longlong(f1) == float2longlong(f2) or
+            (math.isnan(f1) and math.isnan(f2)))
+
+class FlonumHashmapStrategy(HashmapStrategy):
+    import_from_mixin(UnwrappedHashmapStrategyMixin)
+
+    erase, unerase = rerased.new_static_erasing_pair("flonum-hashmap-strategry")
+
+    def is_correct_type(self, w_obj):
+        return isinstance(w_obj, values.W_Flonum)
+
+    def wrap(self, val):
+        assert isinstance(val, float)
+        return values.W_Flonum(val)
+
+    def unwrap(self, w_val):
+        assert isinstance(w_val, values.W_Flonum)
+        return w_val.value
+
+    def _create_empty_dict(self):
+        return r_dict(cmp_flonums, hash_flonums)
+
+
+class CharacterHashmapStrategy(HashmapStrategy):
+    import_from_mixin(UnwrappedHashmapStrategyMixin)
+
+    erase, unerase = rerased.new_static_erasing_pair("character-hashmap-strategry")
+
+    def is_correct_type(self, w_obj):
+        return isinstance(w_obj, values.W_Character)
+
+    def wrap(self, val):
+        return values.W_Character(val)
+
+    def unwrap(self, w_val):
+        assert isinstance(w_val, values.W_Character)
+        return w_val.value
+
+
+def is_fixnum_pair(w_obj):
+    return (isinstance(w_obj, values.W_Cons) and
+            isinstance(w_obj.car(), values.W_Fixnum) and
+            isinstance(w_obj.cdr(), values.W_Fixnum))
+
+def hash_fixnum_pairs(w_pair):
+    assert isinstance(w_pair, values.W_Cons)
+    w_car = w_pair.car()
+    w_cdr = w_pair.cdr()
+    assert isinstance(w_car, values.W_Fixnum)
+    assert isinstance(w_cdr, values.W_Fixnum)
+    return compute_hash((w_car.value, w_cdr.value))
+
+def cmp_fixnum_pairs(w_a, w_b):
+    assert isinstance(w_a, values.W_Cons)
+    assert isinstance(w_b, values.W_Cons)
+    w_a_car = w_a.car()
+    w_a_cdr = w_a.cdr()
+    w_b_car = w_b.car()
+    w_b_cdr = w_b.cdr()
+    assert isinstance(w_a_car, values.W_Fixnum)
+    assert isinstance(w_a_cdr, values.W_Fixnum)
+    assert isinstance(w_b_car, values.W_Fixnum)
+    assert isinstance(w_b_cdr, values.W_Fixnum)
+    return (w_a_car.value == w_b_car.value and
+            w_a_cdr.value == w_b_cdr.value)
+
+class FixnumPairHashmapStrategy(HashmapStrategy):
+    """ Pairs of fixnums. The pairs themselves are the keys, so iterating
+    hands out the pairs that were put in, and their fixnums are only unboxed
+    to hash and compare them. """
+    import_from_mixin(UnwrappedHashmapStrategyMixin)
+
+    erase, unerase = rerased.new_static_erasing_pair("fixnum-pair-hashmap-strategry")
+
+    def is_correct_type(self, w_obj):
+        return is_fixnum_pair(w_obj)
+
+    def wrap(self, w_val):
+        return w_val
+
+    def unwrap(self, w_val):
+        return w_val
+
+    def _create_empty_dict(self):
+        return r_dict(cmp_fixnum_pairs, hash_fixnum_pairs)
+
+
 class SymbolHashmapStrategy(HashmapStrategy):
     import_from_mixin(UnwrappedHashmapStrategyMixin)
 
@@ -464,12 +854,325 @@ class ImmutableByteHashmapStrategy(HashmapStrategy):
      def _create_empty_dict(self):
         return r_dict(cmp_immutable_bytes, hash_immutable_bytes)
 
+# Immutable tables are persistent: hash-set and hash-remove share all but a
+# path of the table they are given. The strategies below update the storage of
+# the table in place, which is only done to fresh copies (see hash_assoc) and
+# while building a table.
+
+class PersistentEqvHashmapStrategy(HashmapStrategy):
+    """ Keys that are compared with eqv?, stored in the persistent map of
+    immutable hasheqv tables. """
+    erase, unerase = rerased.new_static_erasing_pair("persistent-eqv-hashmap-strategy")
+
+    def get_storage(self, w_dict):
+        return self.unerase(w_dict.hstorage)
+
+    def get(self, w_dict, w_key, env, cont):
+        from pycket.interpreter import return_value
+        # a key that is not eqv? to any key here is not equal? to any either
+        w_res = self.get_storage(w_dict).val_at(w_key, w_missing)
+        return return_value(w_res, env, cont)
+
+    def set(self, w_dict, w_key, w_val, env, cont):
+        from pycket.interpreter import return_value
+        if not is_eqv_key(w_key):
+            self.switch_to_object_strategy(w_dict)
+            return w_dict.hash_set(w_key, w_val, env, cont)
+        w_dict.hstorage = self.erase(self.get_storage(w_dict).assoc(w_key, w_val))
+        return return_value(values.w_void, env, cont)
+
+    def _set(self, w_dict, w_key, w_val):
+        if not is_eqv_key(w_key):
+            self.switch_to_object_strategy(w_dict)
+            return w_dict._set(w_key, w_val)
+        w_dict.hstorage = self.erase(self.get_storage(w_dict).assoc(w_key, w_val))
+
+    def remove(self, w_dict, w_key, env, cont):
+        from pycket.interpreter import return_value
+        w_dict.hstorage = self.erase(self.get_storage(w_dict).without(w_key))
+        return return_value(values.w_void, env, cont)
+
+    def items(self, w_dict):
+        return [item for item in self.get_storage(w_dict).iteritems()]
+
+    def get_item(self, w_dict, i):
+        return self.get_storage(w_dict).get_item(i)
+
+    def length(self, w_dict):
+        return len(self.get_storage(w_dict))
+
+    def create_storage(self, keys, vals):
+        builder = W_EqvImmutableHashTable.transient()
+        for i, w_key in enumerate(keys):
+            builder.assoc(w_key, vals[i])
+        return self.erase(builder.persistent())
+
+    def set_many(self, w_dict, keys, vals):
+        for w_key in keys:
+            if not is_eqv_key(w_key):
+                return False
+        storage = self.get_storage(w_dict).assoc_many(keys, vals)
+        w_dict.hstorage = self.erase(storage)
+        return True
+
+    def switch_to_object_strategy(self, w_dict):
+        storage = self.get_storage(w_dict)
+        strategy = PersistentObjectHashmapStrategy.singleton
+        w_dict.hstorage = strategy.create_storage(storage.keys(), storage.vals())
+        w_dict.strategy = strategy
+
+class EqualBucket(object):
+    """ The entries of a persistent equal table whose keys have the same
+    hash. """
+    _attrs_ = _immutable_fields_ = ['keys[*]', 'vals[*]']
+
+    def __init__(self, keys, vals):
+        self.keys = keys
+        self.vals = vals
+
+    def update(self, idx, w_key, w_val):
+        """ The bucket with the key at idx (-1 for a new key) mapped to w_val,
+        or removed if w_val is None. None if the bucket becomes empty. """
+        size = len(self.keys)
+        if w_val is None:
+            if size == 1:
+                return None
+            keys = [None] * (size - 1)
+            vals = [None] * (size - 1)
+            for i in range(size - 1):
+                j = i if i < idx else i + 1
+                keys[i] = self.keys[j]
+                vals[i] = self.vals[j]
+            return EqualBucket(keys, vals)
+        if idx == -1:
+            return EqualBucket(self.keys + [w_key], self.vals + [w_val])
+        keys = self.keys[:]
+        vals = self.vals[:]
+        keys[idx] = w_key
+        vals[idx] = w_val
+        return EqualBucket(keys, vals)
+
+EqualBucketMap = make_persistent_hash_type(
+        super=object,
+        keytype=values.W_Fixnum,
+        valtype=EqualBucket,
+        name="EqualBucketMap",
+        hashfun=lambda w_hash: r_uint(w_hash.value),
+        equal=lambda w_a, w_b: w_a.value == w_b.value)
+
+class PersistentEqualStorage(object):
+    """ A persistent map from the hashes of the keys (see tagged_hash) to the
+    buckets of entries, and the number of entries. """
+    _attrs_ = ['buckets', 'size', 'flat_items']
+    _immutable_fields_ = ['buckets', 'size']
+
+    def __init__(self, buckets, size):
+        self.buckets    = buckets
+        self.size       = size
+        self.flat_items = None
+
+    def get_bucket(self, w_hash):
+        return self.buckets.val_at(w_hash, None)
+
+    def with_bucket(self, w_hash, bucket, size):
+        if bucket is None:
+            buckets = self.buckets.without(w_hash)
+        else:
+            buckets = self.buckets.assoc(w_hash, bucket)
+        return PersistentEqualStorage(buckets, size)
+
+    def items(self):
+        if self.flat_items is None:
+            items = []
+            for _, bucket in self.buckets.iteritems():
+                for i in range(len(bucket.keys)):
+                    items.append((bucket.keys[i], bucket.vals[i]))
+            self.flat_items = items
+        return self.flat_items
+
+    def get_item(self, i):
+        if self.size == len(self.buckets):
+            # no collisions, every bucket has one entry
+            _, bucket = self.buckets.get_item(i)
+            return bucket.keys[0], bucket.vals[0]
+        items = self.items()
+        if not (0 <= i < len(items)):
+            raise IndexError
+        return items[i]
+
+PersistentEqualStorage.EMPTY = PersistentEqualStorage(EqualBucketMap.EMPTY, 0)
+
+def same_key(w_a, w_b):
+    """ Decides equal? for keys of tables built without a continuation, which
+    only need to recognize the duplicates that are not eqv? in literal
+    tables. """
+    if w_a.eqv(w_b):
+        return True
+    if isinstance(w_a, values_string.W_String) or isinstance(w_a, values.W_Bytes):
+        return w_a.equal(w_b)
+    return False
+
+class PersistentObjectHashmapStrategy(HashmapStrategy):
+    erase, unerase = rerased.new_static_erasing_pair("persistent-object-hashmap-strategy")
+
+    def get_storage(self, w_dict):
+        return self.unerase(w_dict.hstorage)
+
+    def get(self, w_dict, w_key, env, cont):
+        from pycket.interpreter import return_value
+        bucket = self.get_storage(w_dict).get_bucket(values.W_Fixnum(tagged_hash(w_key)))
+        if bucket is None:
+            return return_value(w_missing, env, cont)
+        return persistent_equal_ref_loop(bucket, 0, w_key, env, cont)
+
+    def set(self, w_dict, w_key, w_val, env, cont):
+        return persistent_equal_find(w_dict, w_key, w_val, env, cont)
+
+    def remove(self, w_dict, w_key, env, cont):
+        return persistent_equal_find(w_dict, w_key, None, env, cont)
+
+    def _set(self, w_dict, w_key, w_val):
+        w_dict.hstorage = self.erase(
+                self.insert(self.get_storage(w_dict), w_key, w_val))
+
+    def insert(self, storage, w_key, w_val):
+        w_hash = values.W_Fixnum(tagged_hash(w_key))
+        bucket = storage.get_bucket(w_hash)
+        if bucket is None:
+            bucket = EqualBucket([w_key], [w_val])
+            return storage.with_bucket(w_hash, bucket, storage.size + 1)
+        for i in range(len(bucket.keys)):
+            if same_key(bucket.keys[i], w_key):
+                bucket = bucket.update(i, w_key, w_val)
+                return storage.with_bucket(w_hash, bucket, storage.size)
+        bucket = bucket.update(-1, w_key, w_val)
+        return storage.with_bucket(w_hash, bucket, storage.size + 1)
+
+    def items(self, w_dict):
+        return self.get_storage(w_dict).items()
+
+    def get_item(self, w_dict, i):
+        return self.get_storage(w_dict).get_item(i)
+
+    def length(self, w_dict):
+        return self.get_storage(w_dict).size
+
+    def create_storage(self, keys, vals):
+        hashes = [tagged_hash(w_key) for w_key in keys]
+        return self.create_storage_hashed(keys, hashes, vals)
+
+    def create_storage_hashed(self, keys, hashes, vals):
+        """ create_storage with the tagged hashes of the keys. """
+        bucket_keys = {}
+        bucket_vals = {}
+        order = []
+        size = 0
+        for i, w_key in enumerate(keys):
+            hash = hashes[i]
+            bkeys = bucket_keys.get(hash, None)
+            if bkeys is None:
+                bucket_keys[hash] = [w_key]
+                bucket_vals[hash] = [vals[i]]
+                order.append(hash)
+                size += 1
+                continue
+            bvals = bucket_vals[hash]
+            for j in range(len(bkeys)):
+                if same_key(bkeys[j], w_key):
+                    bvals[j] = vals[i]
+                    break
+            else:
+                bkeys.append(w_key)
+                bvals.append(vals[i])
+                size += 1
+        builder = EqualBucketMap.transient()
+        for hash in order:
+            bucket = EqualBucket(bucket_keys[hash], bucket_vals[hash])
+            builder.assoc(values.W_Fixnum(hash), bucket)
+        return self.erase(PersistentEqualStorage(builder.persistent(), size))
+
+@loop_label
+def persistent_equal_ref_loop(bucket, idx, w_key, env, cont):
+    from pycket.interpreter import return_value
+    from pycket.prims.equal import equal_func_unroll_n, EqualInfo
+    if idx >= len(bucket.keys):
+        return return_value(w_missing, env, cont)
+    info = EqualInfo.BASIC_SINGLETON
+    cont = persistent_equal_ref_cont(bucket, idx, w_key, env, cont)
+    return equal_func_unroll_n(bucket.keys[idx], w_key, info, env, cont, 5)
+
+@continuation
+def persistent_equal_ref_cont(bucket, idx, w_key, env, cont, _vals):
+    from pycket.interpreter import check_one_val, return_value
+    if check_one_val(_vals) is not values.w_false:
+        return return_value(bucket.vals[idx], env, cont)
+    return persistent_equal_ref_loop(bucket, idx + 1, w_key, env, cont)
+
+def persistent_equal_find(w_dict, w_key, w_val, env, cont):
+    """ Map w_key to w_val in the persistent storage of w_dict, or remove it
+    if w_val is None. """
+    storage = PersistentObjectHashmapStrategy.singleton.get_storage(w_dict)
+    w_hash = values.W_Fixnum(tagged_hash(w_key))
+    bucket = storage.get_bucket(w_hash)
+    if bucket is None:
+        return persistent_equal_update(w_dict, storage, w_hash, None, -1,
+                                       w_key, w_val, env, cont)
+    return persistent_equal_find_loop(w_dict, storage, w_hash, bucket, 0,
+                                      w_key, w_val, env, cont)
+
+@loop_label
+def persistent_equal_find_loop(w_dict, storage, w_hash, bucket, idx, w_key, w_val, env, cont):
+    from pycket.prims.equal import equal_func_unroll_n, EqualInfo
+    if idx >= len(bucket.keys):
+        return persistent_equal_update(w_dict, storage, w_hash, bucket, -1,
+                                       w_key, w_val, env, cont)
+    info = EqualInfo.BASIC_SINGLETON
+    cont = persistent_equal_find_cont(w_dict, storage, w_hash, bucket, idx,
+                                      w_key, w_val, env, cont)
+    return equal_func_unroll_n(bucket.keys[idx], w_key, info, env, cont, 5)
+
+@continuation
+def persistent_equal_find_cont(w_dict, storage, w_hash, bucket, idx, w_key, w_val, env, cont, _vals):
+    from pycket.interpreter import check_one_val
+    if check_one_val(_vals) is not values.w_false:
+        return persistent_equal_update(w_dict, storage, w_hash, bucket, idx,
+                                       w_key, w_val, env, cont)
+    return persistent_equal_find_loop(w_dict, storage, w_hash, bucket, idx + 1,
+                                      w_key, w_val, env, cont)
+
+def persistent_equal_update(w_dict, storage, w_hash, bucket, idx, w_key, w_val, env, cont):
+    from pycket.interpreter import return_value
+    size = storage.size
+    if w_val is None:
+        if idx == -1:
+            return return_value(values.w_void, env, cont)
+        size -= 1
+        bucket = bucket.update(idx, w_key, w_val)
+    elif bucket is None:
+        size += 1
+        bucket = EqualBucket([w_key], [w_val])
+    else:
+        if idx == -1:
+            size += 1
+        bucket = bucket.update(idx, w_key, w_val)
+    storage = storage.with_bucket(w_hash, bucket, size)
+    w_dict.hstorage = PersistentObjectHashmapStrategy.singleton.erase(storage)
+    return return_value(values.w_void, env, cont)
+
+@continuation
+def return_table_cont(table, env, cont, _vals):
+    from pycket.interpreter import return_value
+    return return_value(table, env, cont)
+
 class W_EqualHashTable(W_HashTable):
     _attrs_ = ['strategy', 'hstorage', 'is_immutable']
     _immutable_fields_ = ['is_immutable']
     def __init__(self, keys, vals, immutable=False):
         self.is_immutable = immutable
-        self.strategy = _find_strategy_class(keys)
+        if immutable:
+            self.strategy = _find_persistent_strategy_class(keys)
+        else:
+            self.strategy = _find_strategy_class(keys)
         self.hstorage = self.strategy.create_storage(keys, vals)
 
     def immutable(self):
@@ -502,6 +1205,59 @@ class W_EqualHashTable(W_HashTable):
     def make_empty(self):
         return W_EqualHashTable([], [], immutable=self.is_immutable)
 
+    def make_mutable_copy(self):
+        if self.is_immutable:
+            items = self.hash_items()
+            keys = [key for key, _ in items]
+            vals = [val for _, val in items]
+            return W_EqualHashTable(keys, vals)
+        copy = W_EqualHashTable([], [])
+        copy.strategy = self.strategy
+        copy.hstorage = self.strategy.copy_storage(self)
+        return copy
+
+    def make_copy(self):
+        """ A table sharing the storage of this immutable one. """
+        assert self.is_immutable
+        copy = W_EqualHashTable([], [], immutable=True)
+        copy.strategy = self.strategy
+        copy.hstorage = self.hstorage
+        return copy
+
+    def hash_assoc(self, key, val, env, cont):
+        """ hash-set on an immutable table. """
+        copy = self.make_copy()
+        return copy.hash_set(key, val, env, return_table_cont(copy, env, cont))
+
+    def set_many(self, keys, vals):
+        """ Set the keys of this fresh immutable table, if that can be done
+        without a continuation. Returns whether it was done. """
+        assert self.is_immutable
+        return self.strategy.set_many(self, keys, vals)
+
+    def find_slot(self, key, env, cont):
+        assert not self.is_immutable
+        return self.strategy.find_slot(self, key, env, cont)
+
+    def slot_token(self):
+        return self.strategy.slot_token(self)
+
+    def slot_set(self, pos, strategy, token, key, val, env, cont):
+        """ Set the entry at pos that find_slot returned while the table had
+        strategy and slot_token. If the table has changed since then, the key
+        is looked up again. """
+        if self.strategy is strategy and strategy.slot_token(self) == token:
+            return strategy.slot_set(self, pos, key, val, env, cont)
+        return self.hash_set(key, val, env, cont)
+
+    def hash_remove_inplace(self, key, env, cont):
+        assert not self.is_immutable
+        return self.strategy.remove(self, key, env, cont)
+
+    def hash_remove(self, key, env, cont):
+        copy = self.make_copy()
+        return copy.strategy.remove(copy, key, env, return_table_cont(copy, env, cont))
+
     def tostring(self):
         lst = [values.W_Cons.make(k, v).tostring() for k, v in self.hash_items()]
         return "#hash(%s)" % " ".join(lst)
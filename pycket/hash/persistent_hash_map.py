@@ -112,6 +112,9 @@ def make_persistent_hash_type(
         def _get_item_node(self, index):
             pass
 
+        def _collect_items(self, result):
+            pass
+
         def _validate_node(self):
             "NOT RPYTHON"
             pass
@@ -156,6 +159,16 @@ def make_persistent_hash_type(
                     subnodes.append(val_or_node)
             return subnodes
 
+        def _collect_items(self, result):
+            for x in range(len(self._array) / 2):
+                key_or_none, val_or_node = self.entry(x)
+                if key_or_none is None:
+                    if val_or_node is not None:
+                        assert isinstance(val_or_node, INode)
+                        val_or_node._collect_items(result)
+                else:
+                    result.append(restrict_types(key_or_none, val_or_node))
+
         @objectmodel.always_inline
         def _get_item_node(self, index):
             for x in range(len(self._array) / 2):
@@ -306,6 +319,12 @@ def make_persistent_hash_type(
             "NOT RPYTHON"
             return [node for node in self._array if node is not None]
 
+        def _collect_items(self, result):
+            for node in self._array:
+                if node is not None:
+                    assert isinstance(node, INode)
+                    node._collect_items(result)
+
         @objectmodel.always_inline
         def _get_item_node(self, index):
             for node in self._array:
@@ -433,6 +452,12 @@ def make_persistent_hash_type(
             "NOT RPYTHON"
             return []
 
+        def _collect_items(self, result):
+            for x in range(len(self._array) / 2):
+                key_or_none = self.keyat(x)
+                if key_or_none is not None:
+                    result.append(restrict_types(key_or_none, self.valat(x)))
+
         @objectmodel.always_inline
         def _get_item_node(self, index):
             for x in range(len(self._array) / 2):
@@ -550,25 +575,27 @@ def make_persistent_hash_type(
 
         __add__ = union
 
+        def items(self):
+            """ The entries in the order of get_item, collected in one walk
+            over the tree. """
+            result = []
+            if self._root is not None:
+                self._root._collect_items(result)
+            return result
+
         def iteritems(self):
-            for i in range(self._cnt):
-                yield self.get_item(i)
+            for item in self.items():
+                yield item
 
         def __iter__(self):
-            for i in range(self._cnt):
-                yield self.get_item(i)[0]
+            for key, _ in self.items():
+                yield key
 
         def keys(self):
-            keys = [None] * self._cnt
-            for i in range(self._cnt):
-                keys[i] = self.get_item(i)[0]
-            return keys
+            return [key for key, _ in self.items()]
 
         def vals(self):
-            vals = [None] * self._cnt
-            for i in range(self._cnt):
-                vals[i] = self.get_item(i)[1]
-            return vals
+            return [val for _, val in self.items()]
 
         @jit.dont_look_inside
         def assoc(self, key, val):
@@ -664,6 +691,28 @@ def make_persistent_hash_type(
             assert key_or_none is not None
             return restrict_types(key_or_none, val_or_node)
 
+        @jit.dont_look_inside
+        def assoc_many(self, keys, vals):
+            """ Associate every key with the value at the same index, the later
+            ones taking precedence. """
+            assert len(keys) == len(vals)
+            if len(keys) < self._cnt:
+                result = self
+                for i in range(len(keys)):
+                    result = result.assoc(keys[i], vals[i])
+                return result
+            # cheaper to build all nodes anew than to copy paths for each key
+            builder = TransientHashMap()
+            for key, val in self.iteritems():
+                builder.assoc(key, val)
+            for i in range(len(keys)):
+                builder.assoc(keys[i], vals[i])
+            return builder.persistent()
+
+        @staticmethod
+        def transient():
+            return TransientHashMap()
+
         @staticmethod
         def singleton(key, val=None):
             return PersistentHashMap.EMPTY.assoc(key, val)
@@ -671,6 +720,135 @@ def make_persistent_hash_type(
         def make_copy(self):
             return PersistentHashMap(self._cnt, self._root)
 
+    class TransientHashMap(object):
+        """
+        Collects entries for a new map, which is built by persistent in one go.
+        Every node of the result is allocated once, instead of the path copies
+        made by a sequence of assoc calls.
+        """
+
+        _attrs_ = ['_keys', '_vals', '_hashes', '_frozen']
+
+        def __init__(self):
+            self._keys   = []
+            self._vals   = []
+            self._hashes = []
+            self._frozen = False
+
+        def assoc(self, key, val):
+            assert not self._frozen
+            key = restrict_key_type(key)
+            val = restrict_val_type(val)
+            self._keys.append(key)
+            self._vals.append(val)
+            self._hashes.append(hashfun(key) & MASK_32)
+
+        @jit.dont_look_inside
+        def persistent(self):
+            """ The map of the collected entries. The builder cannot be used
+            afterwards. """
+            assert not self._frozen
+            self._frozen = True
+            if not self._keys:
+                return PersistentHashMap.EMPTY
+            entries = range(len(self._keys))
+            root = self.build_node(entries, r_uint(0))
+            return PersistentHashMap(root._size, root)
+
+        def build_node(self, entries, shift):
+            groups = [None] * 32
+            for i in entries:
+                idx = intmask(mask(self._hashes[i], shift))
+                group = groups[idx]
+                if group is None:
+                    group = []
+                    groups[idx] = group
+                group.append(i)
+
+            keys  = [None] * 32
+            nodes = [None] * 32
+            count = 0
+            size  = 0
+            for idx in range(32):
+                group = groups[idx]
+                if group is None:
+                    continue
+                count += 1
+                if len(group) > 1 and not self.same_hash(group):
+                    node = self.build_node(group, shift + 5)
+                    nodes[idx] = node
+                    size += node._size
+                    continue
+                node = self.build_leaf(group)
+                if node is None:
+                    i = group[-1]
+                    keys[idx] = self._keys[group[0]]
+                    nodes[idx] = self._vals[i]
+                    size += 1
+                else:
+                    nodes[idx] = node
+                    size += node._size
+
+            if count > 16:
+                subnodes = [None] * 32
+                for idx in range(32):
+                    group = groups[idx]
+                    if group is None:
+                        continue
+                    key = keys[idx]
+                    if key is None:
+                        node = nodes[idx]
+                        assert isinstance(node, INode)
+                        subnodes[idx] = node
+                    else:
+                        bit = bitpos(self._hashes[group[0]], shift + 5)
+                        subnodes[idx] = BitmapIndexedNode(bit, [key, nodes[idx]], 1)
+                return ArrayNode(count, subnodes, size)
+
+            bitmap = r_uint(0)
+            array = [None] * (2 * count)
+            j = 0
+            for idx in range(32):
+                if groups[idx] is None:
+                    continue
+                bitmap |= r_uint(1) << idx
+                array[2 * j] = keys[idx]
+                array[2 * j + 1] = nodes[idx]
+                j += 1
+            return BitmapIndexedNode(bitmap, array, size)
+
+        def same_hash(self, group):
+            hash = self._hashes[group[0]]
+            for i in group:
+                if self._hashes[i] != hash:
+                    return False
+            return True
+
+        def build_leaf(self, group):
+            """ The collision node for entries with the same hash, or None if
+            all their keys are equal. The first key and the last value of a
+            key are kept, as assoc does. """
+            keys = []
+            vals = []
+            for i in group:
+                key = self._keys[i]
+                for j in range(len(keys)):
+                    if equal(key, keys[j]):
+                        vals[j] = self._vals[i]
+                        break
+                else:
+                    keys.append(key)
+                    vals.append(self._vals[i])
+            if len(keys) == 1:
+                return None
+            array = [None] * (2 * len(keys))
+            for j in range(len(keys)):
+                array[2 * j] = keys[j]
+                array[2 * j + 1] = vals[j]
+            return HashCollisionNode(self._hashes[group[0]], array, len(keys))
+
+    TransientHashMap.__name__ = "Transient(%s)" % name
+
     PersistentHashMap.__name__ = name
     PersistentHashMap.INode = INode
     PersistentHashMap.BitmapIndexedNode = BitmapIndexedNode
@@ -0,0 +1,148 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Native hash sets, the values of set, seteq, mutable-set and friends when the
+# native_sets option makes the loader resolve the racket/set bindings to the
+# primitives in pycket/prims/set.py. A set is a hash table mapping its
+# elements to #t, so the elements are stored by the strategies of the table:
+# unwrapped for sets of fixnums, symbols, strings and so on.
+
+from pycket                   import values
+from pycket.base              import W_Object, equal_hash_state, start_equal_hash
+from pycket.cont              import continuation, loop_label
+from pycket.hash.base         import w_missing
+from pycket.hash.equal        import W_EqualHashTable
+from pycket.hash.simple       import (
+    W_EqMutableHashTable, W_EqvMutableHashTable,
+    W_EqImmutableHashTable, W_EqvImmutableHashTable,
+    make_simple_mutable_table)
+from rpython.rlib             import rarithmetic
+
+KIND_EQUAL = 0
+KIND_EQV   = 1
+KIND_EQ    = 2
+
+KIND_NAMES = ["set", "seteqv", "seteq"]
+
+# prop:sequence is made by Racket code, so the property object that sets have
+# is only known once the module defining it is instantiated
+SEQUENCE_MODULE = "/racket/private/for.rkt"
+
+class SequenceProperty(object):
+    def __init__(self):
+        self.w_prop = None
+
+sequence_property = SequenceProperty()
+
+def note_required_module(fname, module):
+    """ Called by Require for every module it instantiates. Remembers
+    prop:sequence once racket/private/for.rkt is instantiated. """
+    from pycket.values_struct import W_StructProperty
+    if sequence_property.w_prop is not None or not fname.endswith(SEQUENCE_MODULE):
+        return
+    w_prop = module.defs.get(values.W_Symbol.make("prop:sequence"), None)
+    if isinstance(w_prop, W_StructProperty):
+        sequence_property.w_prop = w_prop
+
+def make_empty_table(kind, mutable):
+    if kind == KIND_EQUAL:
+        return W_EqualHashTable([], [], immutable=not mutable)
+    if kind == KIND_EQV:
+        if mutable:
+            return make_simple_mutable_table(W_EqvMutableHashTable)
+        return W_EqvImmutableHashTable.EMPTY
+    assert kind == KIND_EQ
+    if mutable:
+        return make_simple_mutable_table(W_EqMutableHashTable)
+    return W_EqImmutableHashTable.EMPTY
+
+class W_HashSet(W_Object):
+    errorname = "set"
+    _attrs_ = _immutable_fields_ = ['table', 'kind', 'mutable']
+
+    def __init__(self, table, kind, mutable):
+        assert table.immutable() != mutable
+        self.table   = table
+        self.kind    = kind
+        self.mutable = mutable
+
+    @staticmethod
+    def make_empty(kind, mutable):
+        return W_HashSet(make_empty_table(kind, mutable), kind, mutable)
+
+    def with_table(self, table):
+        """ The immutable set of the same kind with the given elements. """
+        assert not self.mutable
+        if table is self.table:
+            return self
+        return W_HashSet(table, self.kind, False)
+
+    def length(self):
+        return self.table.length()
+
+    def elements(self):
+        return [w_key for w_key, _ in self.table.hash_items()]
+
+    def same_kind(self, other):
+        return self.kind == other.kind and self.mutable == other.mutable
+
+    def hash_equal(self, info=None):
+        return start_equal_hash(self)
+
+    def hash_equal_part(self):
+        # every element is hashed with the same share of the fuel, so that
+        # the sum does not depend on the order of the elements
+        state = equal_hash_state
+        if self.mutable:
+            state.stable = False
+        size = self.length()
+        x = 0x6d1e2f + self.kind * 31 + size
+        fuel = state.fuel
+        if fuel <= 0 or size == 0:
+            return x
+        share = max(1, fuel // size)
+        for w_elem in self.elements():
+            state.fuel = share
+            x = rarithmetic.intmask(x + w_elem.hash_equal_part())
+        state.fuel = max(0, fuel - share * size)
+        return x
+
+    def builtin_prop(self, property):
+        # the sets of racket/set are sequences through prop:sequence
+        if property is sequence_property.w_prop:
+            from pycket.prims.set import w_in_set
+            return w_in_set
+        return None
+
+    def equal_set(self, other, env, cont):
+        """ Pass to cont whether self and other are equal?: sets of the same
+        kind with the same elements. """
+        from pycket.interpreter import return_value
+        if not self.same_kind(other) or self.length() != other.length():
+            return return_value(values.w_false, env, cont)
+        return set_subset_loop(self.elements(), 0, other, env, cont)
+
+    def tostring(self):
+        name = KIND_NAMES[self.kind]
+        if self.mutable:
+            name = "mutable-" + name
+        elems = [w_elem.tostring() for w_elem in self.elements()]
+        if not elems:
+            return "#<%s:>" % name
+        return "#<%s: %s>" % (name, " ".join(elems))
+
+@loop_label
+def set_subset_loop(elems, idx, w_set, env, cont):
+    """ Pass to cont whether all of elems are in w_set. """
+    from pycket.interpreter import return_value
+    if idx >= len(elems):
+        return return_value(values.w_true, env, cont)
+    return w_set.table.hash_ref(elems[idx], env,
+            set_subset_cont(elems, idx, w_set, env, cont))
+
+@continuation
+def set_subset_cont(elems, idx, w_set, env, cont, _vals):
+    from pycket.interpreter import check_one_val, return_value
+    if check_one_val(_vals) is w_missing:
+        return return_value(values.w_false, env, cont)
+    return set_subset_loop(elems, idx + 1, w_set, env, cont)
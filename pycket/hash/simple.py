@@ -34,25 +34,26 @@ def make_simple_mutable_table_assocs(cls, assocs, who):
 
 @specialize.arg(0)
 def make_simple_immutable_table(cls, keys=None, vals=None):
-    table = cls.EMPTY
-    if keys is not None and vals is not None:
-        assert len(keys) == len(vals)
-        for i, k in enumerate(keys):
-            table = table.assoc(k, vals[i])
-    return table
+    if keys is None or vals is None:
+        return cls.EMPTY
+    assert len(keys) == len(vals)
+    builder = cls.transient()
+    for i, k in enumerate(keys):
+        builder.assoc(k, vals[i])
+    return builder.persistent()
 
 @specialize.arg(0)
 def make_simple_immutable_table_assocs(cls, assocs, who):
     if not assocs.is_proper_list():
         raise SchemeException("%s: not given proper list" % who)
-    table = cls.EMPTY
+    builder = cls.transient()
     while isinstance(assocs, values.W_Cons):
         entry, assocs = assocs.car(), assocs.cdr()
         if not isinstance(entry, values.W_Cons):
             raise SchemeException("%s: expected list of pairs" % who)
         key, val = entry.car(), entry.cdr()
-        table = table.assoc(key, val)
-    return table
+        builder.assoc(key, val)
+    return builder.persistent()
 
 class W_SimpleMutableHashTable(W_MutableHashTable):
     _attrs_ = ['data']
@@ -72,6 +73,9 @@ class W_SimpleMutableHashTable(W_MutableHashTable):
     def make_copy(self):
         raise NotImplementedError("abstract method")
 
+    def make_mutable_copy(self):
+        return self.make_copy()
+
     def hash_items(self):
         return self.data.items()
 
@@ -86,7 +90,8 @@ class W_SimpleMutableHashTable(W_MutableHashTable):
 
     def hash_remove_inplace(self, k, env, cont):
         from pycket.interpreter import return_value
-        del self.data[k]
+        if k in self.data:
+            del self.data[k]
         return return_value(values.w_void, env, cont)
 
     def hash_ref(self, k, env, cont):
@@ -102,7 +107,7 @@ class W_EqvMutableHashTable(W_SimpleMutableHashTable):
         return make_simple_mutable_table(W_EqvMutableHashTable)
 
     def make_copy(self):
-        return W_EqvMutableHashTable(self.data.copy(), immutable=False)
+        return W_EqvMutableHashTable(self.data.copy())
 
     @staticmethod
     def hash_value(k):
@@ -160,12 +165,22 @@ class __extend__(W_EqvImmutableHashTable):
     def length(self):
         return len(self)
 
+    def hash_items(self):
+        return self.items()
+
     def make_copy(self):
         return self
 
     def make_empty(self):
         return W_EqvImmutableHashTable.EMPTY
 
+    def make_mutable_copy(self):
+        data = r_dict(W_EqvMutableHashTable.cmp_value,
+                      W_EqvMutableHashTable.hash_value, force_non_null=True)
+        for k, v in self.iteritems():
+            data[k] = v
+        return W_EqvMutableHashTable(data)
+
     def hash_ref(self, k, env, cont):
         from pycket.interpreter import return_value
         result = self.val_at(k, w_missing)
@@ -190,12 +205,22 @@ class __extend__(W_EqImmutableHashTable):
     def length(self):
         return len(self)
 
+    def hash_items(self):
+        return self.items()
+
     def make_copy(self):
         return self
 
     def make_empty(self):
         return W_EqImmutableHashTable.EMPTY
 
+    def make_mutable_copy(self):
+        data = r_dict(W_EqMutableHashTable.cmp_value,
+                      W_EqMutableHashTable.hash_value, force_non_null=True)
+        for k, v in self.iteritems():
+            data[k] = v
+        return W_EqMutableHashTable(data)
+
     def hash_ref(self, key, env, cont):
         from pycket.interpreter import return_value
         result = self.val_at(key, w_missing)
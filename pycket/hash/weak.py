@@ -0,0 +1,332 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Weak hash tables, made by make-weak-hasheq and friends. A table holds its
+# keys through weak references and its values strongly, and an entry
+# disappears once its key has been collected.
+#
+# Dead keys are noticed lazily: lookups skip them, and after every major
+# collection (counted by the GC hooks in perf_stats) the next operation on a
+# table drops its dead entries, so hash-count shrinks and the values of dead
+# keys are released. The dropped entries keep their places in the iteration
+# order, so that a collection does not invalidate hash-iterate positions; the
+# order is only compacted when the table is changed, which may invalidate
+# them in Racket too. Fixnums and characters are immediate values in Racket
+# and never die, so they are held strongly.
+#
+# Ephemeron tables are weak tables whose values are conceptually held by
+# ephemerons on their keys. The GC has no ephemeron support, so they behave
+# like the weak tables: a value that refers to its own key keeps the entry.
+
+from pycket                   import values
+from pycket.cont              import continuation, loop_label
+from pycket.hash.base         import W_MutableHashTable, w_missing
+from pycket.hash.equal        import tagged_hash
+from pycket.hash.simple       import W_EqMutableHashTable, W_EqvMutableHashTable
+from pycket.perf_stats        import state as gc_state
+from rpython.rlib             import rweakref
+
+ACTION_REF    = 0
+ACTION_SET    = 1
+ACTION_REMOVE = 2
+
+class WeakEntry(object):
+    _attrs_ = ['w_key', 'key_ref', 'hash', 'w_value']
+
+    def __init__(self, w_key, hash, w_value):
+        if values.is_immediate(w_key):
+            self.w_key   = w_key
+            self.key_ref = rweakref.dead_ref
+        else:
+            self.w_key   = None
+            self.key_ref = rweakref.ref(w_key)
+        self.hash    = hash
+        self.w_value = w_value
+
+    def get_key(self):
+        """ The key, or None if it has been collected or the entry removed. """
+        if self.w_key is not None:
+            return self.w_key
+        return self.key_ref()
+
+    def is_alive(self):
+        return self.w_value is not None and self.get_key() is not None
+
+    def kill(self):
+        self.w_key   = None
+        self.key_ref = rweakref.dead_ref
+        self.w_value = None
+
+class W_WeakHashTable(W_MutableHashTable):
+    """
+    Base class of the weak tables. The entries are kept in insertion order,
+    which is what iteration positions index, and in buckets by the hash of
+    their keys. Removed and collected entries stay in the order, dead, until
+    it is compacted.
+    """
+    _attrs_ = ['buckets', 'entries', 'num_dead', 'swept_at']
+    is_ephemeron = False
+
+    def __init__(self):
+        self.buckets  = {}
+        self.entries  = []
+        self.num_dead = 0
+        self.swept_at = gc_state.major_collections
+
+    def hash_key(self, w_key):
+        raise NotImplementedError("abstract method")
+
+    def find(self, w_key, action, w_val, env, cont):
+        raise NotImplementedError("abstract method")
+
+    def make_table(self):
+        raise NotImplementedError("abstract method")
+
+    def make_empty(self):
+        return self.make_table()
+
+    def make_mutable_copy(self):
+        copy = self.make_table()
+        for entry in self.entries:
+            w_key = entry.get_key()
+            if w_key is not None and entry.w_value is not None:
+                copy.add_entry(w_key, entry.hash, entry.w_value)
+        return copy
+
+    def sweep_if_collected(self):
+        if self.swept_at != gc_state.major_collections:
+            self.sweep()
+
+    def sweep(self):
+        """ Drop the entries whose keys have died from the buckets and release
+        their values. They stay in the order, see compact. """
+        self.swept_at = gc_state.major_collections
+        for entry in self.entries:
+            if entry.w_value is not None and entry.get_key() is None:
+                self.unlink_entry(entry)
+
+    def compact_if_sparse(self):
+        if self.num_dead > len(self.entries) // 2:
+            self.compact()
+
+    def compact(self):
+        """ Drop the dead entries from the order, which renumbers the
+        iteration positions. Only done when the table is changed. """
+        entries = []
+        buckets = {}
+        for entry in self.entries:
+            if not entry.is_alive():
+                continue
+            entries.append(entry)
+            bucket = buckets.get(entry.hash, None)
+            if bucket is None:
+                buckets[entry.hash] = bucket = []
+            bucket.append(entry)
+        self.entries  = entries
+        self.buckets  = buckets
+        self.num_dead = 0
+
+    def get_bucket(self, hash):
+        return self.buckets.get(hash, None)
+
+    def add_entry(self, w_key, hash, w_val):
+        self.compact_if_sparse()
+        entry = WeakEntry(w_key, hash, w_val)
+        self.entries.append(entry)
+        bucket = self.buckets.get(hash, None)
+        if bucket is None:
+            self.buckets[hash] = bucket = []
+        bucket.append(entry)
+
+    def unlink_entry(self, entry):
+        bucket = self.buckets[entry.hash]
+        for i in range(len(bucket)):
+            if bucket[i] is entry:
+                del bucket[i]
+                break
+        if not bucket:
+            del self.buckets[entry.hash]
+        entry.kill()
+        self.num_dead += 1
+
+    def remove_entry(self, entry):
+        self.unlink_entry(entry)
+        self.compact_if_sparse()
+
+    def found(self, entry, action, w_val, env, cont):
+        from pycket.interpreter import return_value
+        if action == ACTION_REF:
+            return return_value(entry.w_value, env, cont)
+        if action == ACTION_SET:
+            entry.w_value = w_val
+        else:
+            self.remove_entry(entry)
+        return return_value(values.w_void, env, cont)
+
+    def not_found(self, w_key, hash, action, w_val, env, cont):
+        from pycket.interpreter import return_value
+        if action == ACTION_REF:
+            return return_value(w_missing, env, cont)
+        if action == ACTION_SET:
+            self.add_entry(w_key, hash, w_val)
+        return return_value(values.w_void, env, cont)
+
+    def hash_ref(self, k, env, cont):
+        self.sweep_if_collected()
+        return self.find(k, ACTION_REF, None, env, cont)
+
+    def hash_set(self, k, v, env, cont):
+        self.sweep_if_collected()
+        return self.find(k, ACTION_SET, v, env, cont)
+
+    def hash_remove_inplace(self, k, env, cont):
+        self.sweep_if_collected()
+        return self.find(k, ACTION_REMOVE, None, env, cont)
+
+    def length(self):
+        self.sweep_if_collected()
+        return len(self.entries) - self.num_dead
+
+    def hash_items(self):
+        items = []
+        for entry in self.entries:
+            w_key = entry.get_key()
+            if w_key is not None and entry.w_value is not None:
+                items.append((w_key, entry.w_value))
+        return items
+
+    def get_item(self, i):
+        if i >= len(self.entries):
+            raise IndexError
+        entry = self.entries[i]
+        w_key = entry.get_key()
+        if w_key is None or entry.w_value is None:
+            raise KeyError
+        return w_key, entry.w_value
+
+    def hash_iterate_next(self, pos):
+        i = pos.value + 1
+        while i < len(self.entries):
+            if self.entries[i].is_alive():
+                return values.wrap(i)
+            i += 1
+        return values.w_false
+
+    def hash_iterate_first(self):
+        for i in range(len(self.entries)):
+            if self.entries[i].is_alive():
+                return i
+        raise IndexError
+
+    def tostring(self):
+        lst = [values.W_Cons.make(k, v).tostring() for k, v in self.hash_items()]
+        return "#hash(%s)" % " ".join(lst)
+
+class W_WeakSimpleHashTable(W_WeakHashTable):
+    """ Weak tables comparing keys with eq? or eqv?, which need no
+    continuation. """
+    _attrs_ = []
+
+    def same_key(self, w_a, w_b):
+        raise NotImplementedError("abstract method")
+
+    def find(self, w_key, action, w_val, env, cont):
+        hash = self.hash_key(w_key)
+        bucket = self.get_bucket(hash)
+        if bucket is not None:
+            for entry in bucket:
+                w_other = entry.get_key()
+                if w_other is not None and self.same_key(w_other, w_key):
+                    return self.found(entry, action, w_val, env, cont)
+        return self.not_found(w_key, hash, action, w_val, env, cont)
+
+class W_WeakEqHashTable(W_WeakSimpleHashTable):
+    _attrs_ = []
+
+    def make_table(self):
+        return W_WeakEqHashTable()
+
+    def hash_key(self, w_key):
+        return W_EqMutableHashTable.hash_value(w_key)
+
+    def same_key(self, w_a, w_b):
+        return W_EqMutableHashTable.cmp_value(w_a, w_b)
+
+class W_WeakEqvHashTable(W_WeakSimpleHashTable):
+    _attrs_ = []
+
+    def make_table(self):
+        return W_WeakEqvHashTable()
+
+    def hash_key(self, w_key):
+        return W_EqvMutableHashTable.hash_value(w_key)
+
+    def same_key(self, w_a, w_b):
+        return W_EqvMutableHashTable.cmp_value(w_a, w_b)
+
+class W_WeakEqualHashTable(W_WeakHashTable):
+    _attrs_ = []
+
+    def make_table(self):
+        return W_WeakEqualHashTable()
+
+    def hash_key(self, w_key):
+        return tagged_hash(w_key)
+
+    def find(self, w_key, action, w_val, env, cont):
+        hash = self.hash_key(w_key)
+        bucket = self.get_bucket(hash)
+        if bucket is None:
+            return self.not_found(w_key, hash, action, w_val, env, cont)
+        return weak_equal_find_loop(self, bucket, 0, w_key, hash, action, w_val,
+                                    env, cont)
+
+@loop_label
+def weak_equal_find_loop(table, bucket, idx, w_key, hash, action, w_val, env, cont):
+    from pycket.prims.equal import equal_func_unroll_n, EqualInfo
+    while idx < len(bucket):
+        entry = bucket[idx]
+        w_other = entry.get_key()
+        if w_other is not None:
+            break
+        idx += 1
+    else:
+        return table.not_found(w_key, hash, action, w_val, env, cont)
+    info = EqualInfo.BASIC_SINGLETON
+    cont = weak_equal_find_cont(table, bucket, idx, entry, w_key, hash, action,
+                                w_val, env, cont)
+    return equal_func_unroll_n(w_other, w_key, info, env, cont, 5)
+
+@continuation
+def weak_equal_find_cont(table, bucket, idx, entry, w_key, hash, action, w_val, env, cont, _vals):
+    from pycket.interpreter import check_one_val
+    # equal? may have run code that removed entries or swept the table, which
+    # moves the entries of the bucket or replaces it
+    if (not entry.is_alive() or table.get_bucket(hash) is not bucket or
+            idx >= len(bucket) or bucket[idx] is not entry):
+        return table.find(w_key, action, w_val, env, cont)
+    if check_one_val(_vals) is not values.w_false:
+        return table.found(entry, action, w_val, env, cont)
+    return weak_equal_find_loop(table, bucket, idx + 1, w_key, hash, action,
+                                w_val, env, cont)
+
+class W_EphemeronEqHashTable(W_WeakEqHashTable):
+    _attrs_ = []
+    is_ephemeron = True
+
+    def make_table(self):
+        return W_EphemeronEqHashTable()
+
+class W_EphemeronEqvHashTable(W_WeakEqvHashTable):
+    _attrs_ = []
+    is_ephemeron = True
+
+    def make_table(self):
+        return W_EphemeronEqvHashTable()
+
+class W_EphemeronEqualHashTable(W_WeakEqualHashTable):
+    _attrs_ = []
+    is_ephemeron = True
+
+    def make_table(self):
+        return W_EphemeronEqualHashTable()
@@ -3,6 +3,7 @@
 
 from pycket.cont              import continuation, label, guarded_loop, call_cont, call_extra_cont
 from pycket.prims.expose      import make_call_method
+from pycket.base              import UnhashableType, equal_hash_state, start_equal_hash
 from pycket.error             import SchemeException
 from pycket.values            import UNROLLING_CUTOFF
 from pycket                   import values
@@ -19,6 +20,16 @@ def get_base_object(x):
         x = x.get_proxied()
     return x
 
+@jit.unroll_safe
+def only_chaperones(x):
+    """ Whether all the proxies around x are chaperones, which return what x
+    returns, so that the equal hash of x can stand for theirs. """
+    while x.is_proxy():
+        if not x.is_chaperone():
+            return False
+        x = x.get_proxied()
+    return True
+
 class ProxyMixin(object):
     def get_proxied(self):
         return self.inner
@@ -40,6 +51,18 @@ class ProxyMixin(object):
     def tostring(self):
         return get_base_object(self.inner).tostring()
 
+    # Chaperones hash as the proxied object, so equal? values that differ in
+    # chaperones get the same hash. Impersonators may change what they return,
+    # so their hash cannot be computed without calling their handlers.
+    def hash_equal(self, info=None):
+        return start_equal_hash(self)
+
+    def hash_equal_part(self):
+        if not only_chaperones(self):
+            raise UnhashableType
+        equal_hash_state.stable = False
+        return get_base_object(self.inner).hash_equal_part()
+
 class ChaperoneMixin(object):
     def is_chaperone(self):
         return True
@@ -1,5 +1,6 @@
 
 from pycket                   import values
+from pycket.base              import UnhashableType, equal_hash_state, start_equal_hash
 from pycket.cont              import continuation
 from pycket.error             import SchemeException
 from pycket.hidden_classes    import make_map_type, make_caching_map_type
@@ -159,6 +160,16 @@ w_impersonator_prop_application_mark = W_ImpPropertyDescriptor("impersonator-pro
 
 EMPTY_PROPERTY_MAP = make_caching_map_type("get_storage_index", W_ImpPropertyDescriptor).EMPTY
 
+@jit.unroll_safe
+def only_chaperones(x):
+    """ Whether all the proxies around x are chaperones, which return what x
+    returns, so that the equal hash of x can stand for theirs. """
+    while x.is_proxy():
+        if not x.is_chaperone():
+            return False
+        x = x.get_proxied()
+    return True
+
 class ProxyMixin(object):
 
     EMPTY_MAP = make_map_type("get_property_index", W_ImpPropertyDescriptor).EMPTY
@@ -205,6 +216,18 @@ class ProxyMixin(object):
     def tostring(self):
         return self.base.tostring()
 
+    # Chaperones hash as the proxied object, so equal? values that differ in
+    # chaperones get the same hash. Impersonators may change what they return,
+    # so their hash cannot be computed without calling their handlers.
+    def hash_equal(self, info=None):
+        return start_equal_hash(self)
+
+    def hash_equal_part(self):
+        if not only_chaperones(self):
+            raise UnhashableType
+        equal_hash_state.stable = False
+        return self.base.hash_equal_part()
+
 class InlineProxyMixin(object):
 
     _immutable_fields_ = ["inner", "base", "property_map"]
@@ -1,6 +1,7 @@
 #! /usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from pycket                   import alloc_profile
 from pycket                   import config
 from pycket                   import values, values_string, values_parameter
 from pycket                   import vector
@@ -401,13 +402,7 @@ class LetCont(Cont):
         if ast.counts[rhsindex] != len_vals:
             raise SchemeException("wrong number of values")
         if rhsindex == (len(ast.rhss) - 1):
-            prev = self.env
-            if ast.env_speculation_works:
-                # speculate moar!
-                if _env is self.env:
-                    prev = _env
-                elif not jit.we_are_jitted():
-                    ast.env_speculation_works = False
+            prev = self._body_env_prev(ast, _env)
             env = self._construct_env(ast, len_self, vals, len_vals, new_length, prev)
             return ast.make_begin_cont(env, self.prev)
         else:
@@ -424,6 +419,49 @@ class LetCont(Cont):
                     LetCont.make(vals_w, ast, rhsindex + 1,
                                  self.env, self.prev))
 
+    def _body_env_prev(self, ast, _env):
+        prev = self.env
+        if ast.env_speculation_works:
+            # speculate moar!
+            if _env is self.env:
+                prev = _env
+            elif not jit.we_are_jitted():
+                ast.env_speculation_works = False
+        return prev
+
+    def _binds_last_rhs(self, ast, rhsindex, len_vals):
+        """ Whether the values returned to this continuation are all that is
+        missing for the environment of the body. """
+        len_self = self._get_size_list()
+        jit.promote(len_self)
+        if len_self != 0 or rhsindex != (len(ast.rhss) - 1):
+            return False
+        if ast.counts[rhsindex] != len_vals:
+            raise SchemeException("wrong number of values")
+        return True
+
+    def plug_reduce_2(self, w_val1, w_val2, _env):
+        ast, rhsindex = self.counting_ast.unpack(Let)
+        assert isinstance(ast, Let)
+        if not self._binds_last_rhs(ast, rhsindex, 2):
+            return Cont.plug_reduce_2(self, w_val1, w_val2, _env)
+        prev = self._body_env_prev(ast, _env)
+        env = ConsEnv.make2(ast.wrap_value(w_val1, 0),
+                            ast.wrap_value(w_val2, 1), prev)
+        return ast.make_begin_cont(env, self.prev)
+
+    def plug_reduce_3(self, w_val1, w_val2, w_val3, _env):
+        ast, rhsindex = self.counting_ast.unpack(Let)
+        assert isinstance(ast, Let)
+        if not self._binds_last_rhs(ast, rhsindex, 3):
+            return Cont.plug_reduce_3(self, w_val1, w_val2, w_val3, _env)
+        prev = self._body_env_prev(ast, _env)
+        env = ConsEnv.make_n(3, prev)
+        env._set_list(0, ast.wrap_value(w_val1, 0))
+        env._set_list(1, ast.wrap_value(w_val2, 1))
+        env._set_list(2, ast.wrap_value(w_val3, 2))
+        return ast.make_begin_cont(env, self.prev)
+
     @jit.unroll_safe
     def _construct_env(self, ast, len_self, vals, len_vals, new_length, prev):
         assert isinstance(ast, Let)
@@ -797,10 +835,13 @@ class Require(AST):
 
     # Interpret the module and add it to the module environment
     def interpret_simple(self, env):
+        from pycket.hash.set import note_required_module
         module = self.find_module(env)
         top = env.toplevel_env()
         top.module_env.add_module(self.fname, module.root_module())
         module.interpret_mod(top)
+        if self.path is None:
+            note_required_module(self.fname, module)
         return values.w_void
 
     def collect_module_info(self, info):
@@ -840,6 +881,26 @@ def safe_return_multi_vals(vals, env, cont):
 def return_multi_vals_direct(vals, env, cont):
     return cont.plug_reduce(vals, env)
 
+def return_two_vals(w_val1, w_val2, env, cont):
+    """ like return_multi_vals with two values, without allocating a Values
+    object if the continuation takes the values apart itself """
+    if cont.return_safe:
+        return cont.plug_reduce_2(w_val1, w_val2, env)
+    return safe_return_two_vals(w_val1, w_val2, env, cont)
+
+@label
+def safe_return_two_vals(w_val1, w_val2, env, cont):
+    return cont.plug_reduce_2(w_val1, w_val2, env)
+
+def return_three_vals(w_val1, w_val2, w_val3, env, cont):
+    if cont.return_safe:
+        return cont.plug_reduce_3(w_val1, w_val2, w_val3, env)
+    return safe_return_three_vals(w_val1, w_val2, w_val3, env, cont)
+
+@label
+def safe_return_three_vals(w_val1, w_val2, w_val3, env, cont):
+    return cont.plug_reduce_3(w_val1, w_val2, w_val3, env)
+
 def return_void(env, cont):
     return return_value(values.w_void, env, cont)
 
@@ -1340,16 +1401,19 @@ class LexicalVar(Var):
         assert 0
 
 class ModuleVar(Var):
-    _immutable_fields_ = ["modenv?", "sym", "srcmod", "srcsym", "w_value?", "path[*]"]
+    _immutable_fields_ = ["modenv?", "sym", "srcmod", "srcsym", "w_value?", "path[*]", "native"]
     visitable = True
 
-    def __init__(self, sym, srcmod, srcsym, path=None):
+    def __init__(self, sym, srcmod, srcsym, path=None, native=False):
         Var.__init__(self, sym)
         self.srcmod = srcmod
         self.srcsym = srcsym
         self.path = path
         self.modenv = None
         self.w_value = None
+        # a set operation of racket/set that also has a native primitive, see
+        # is_native_set_operation in expand.py
+        self.native = native
 
     def _free_vars(self):
         return SymbolSet.EMPTY
@@ -1359,7 +1423,11 @@ class ModuleVar(Var):
         if w_res is None:
             if self.modenv is None:
                 self.modenv = env.toplevel_env().module_env
-            self.w_value = w_res = self._elidable_lookup()
+            w_res = self._elidable_lookup()
+            if self.native and type(w_res) is not values.W_Cell:
+                from pycket.prims.set import W_NativeSetProcedure
+                w_res = W_NativeSetProcedure(self._lookup_primitive(), w_res)
+            self.w_value = w_res
 
         if type(w_res) is values.W_Cell:
             return w_res.get_val()
@@ -1495,9 +1563,9 @@ def make_lambda(formals, rest, body, sourceinfo=None):
     the λ-expression.
     """
     body = remove_pure_ops(body)
-    args = SymList(formals + ([rest] if rest else []))
-    frees = SymList(free_vars_lambda(body, args).keys())
-    args = SymList(args.elems, frees)
+    args = SymList.make(formals + ([rest] if rest else []))
+    frees = SymList.make(free_vars_lambda(body, args).keys())
+    args = SymList.make(args.elems, frees)
     return Lambda(formals, rest, args, frees, body, sourceinfo=sourceinfo)
 
 def free_vars_lambda(body, args):
@@ -1712,6 +1780,43 @@ class Lambda(SequencedBodyAST):
         actuals[-1] = self.wrap_value(rest, -1)
         return actuals
 
+    @jit.unroll_safe
+    def match_args_spread(self, args, w_list):
+        """ Like match_args, for args followed by the elements of the proper
+        list w_list, but without building the list of all the arguments: the
+        elements for the formals are taken from the list directly, and a rest
+        argument gets the remaining tail of w_list itself. """
+        fmls_len = len(self.formals)
+        args_len = len(args)
+        if args_len > fmls_len and self.rest is None:
+            return None
+        if self.rest is None:
+            numargs = fmls_len
+        else:
+            numargs = fmls_len + 1
+        actuals = [None] * numargs
+        if args_len > fmls_len:
+            for i in range(fmls_len):
+                actuals[i] = self.wrap_value(args[i], i)
+            rest = w_list
+            for i in range(args_len - 1, fmls_len - 1, -1):
+                rest = values.W_Cons.make(args[i], rest)
+            actuals[-1] = self.wrap_value(rest, -1)
+            return actuals
+        for i in range(args_len):
+            actuals[i] = self.wrap_value(args[i], i)
+        for i in range(args_len, fmls_len):
+            if not isinstance(w_list, values.W_Cons):
+                return None
+            actuals[i] = self.wrap_value(w_list.car(), i)
+            w_list = w_list.cdr()
+        if self.rest is None:
+            if w_list is not values.w_null:
+                return None
+        else:
+            actuals[-1] = self.wrap_value(w_list, -1)
+        return actuals
+
     def raise_nice_error(self, args):
         fmls_len = len(self.formals)
         args_len = len(args)
@@ -1889,7 +1994,7 @@ def _make_symlist_counts(varss):
         counts.append(len(vars))
         argsl.extend(vars)
     argsl = argsl[:] # copy to make fixed-size
-    return SymList(argsl), counts
+    return SymList.make(argsl), counts
 
 def make_let(varss, rhss, body):
     if not varss:
@@ -1931,7 +2036,7 @@ def make_let_singlevar(sym, rhs, body):
                 body  = b.body
                 return make_let(varss, rhss, body)
     body = remove_pure_ops(body)
-    return Let(SymList([sym]), [1], [rhs], body)
+    return Let(SymList.make([sym]), [1], [rhs], body)
 
 def _make_let_direct(varss, rhss, body):
     symlist, counts = _make_symlist_counts(varss)
@@ -2091,13 +2196,21 @@ class DefineValues(AST):
             self.display_names, self.rhs.tostring())
 
 
+def source_location_prefix(ast):
+    """ The source location of the lambda surrounding ast, in the form
+    utils/traceviewer.py looks for at the start of a printable location. """
+    lam = ast.surrounding_lambda
+    if lam is None or lam.sourceinfo is None:
+        return ''
+    return '[' + lam.sourceinfo.tostring() + '] '
+
 def get_printable_location_two_state(green_ast, came_from):
     if green_ast is None:
         return 'Green_Ast is None'
-    surrounding = green_ast.surrounding_lambda
+    prefix = source_location_prefix(green_ast)
     if green_ast.should_enter:
-        return green_ast.tostring() + ' from ' + came_from.tostring()
-    return green_ast.tostring()
+        return prefix + green_ast.tostring() + ' from ' + came_from.tostring()
+    return prefix + green_ast.tostring()
 
 driver_two_state = jit.JitDriver(reds=["env", "cont"],
                                  greens=["ast", "came_from"],
@@ -2110,6 +2223,8 @@ def inner_interpret_two_state(ast, env, cont):
     config = env.pycketconfig()
     while True:
         driver_two_state.jit_merge_point(ast=ast, came_from=came_from, env=env, cont=cont)
+        if config.allocation_profiling:
+            alloc_profile.enter_ast(ast)
         came_from = ast if isinstance(ast, App) else came_from
         t = type(ast)
         # Manual conditionals to force specialization in translation
@@ -2129,7 +2244,7 @@ def inner_interpret_two_state(ast, env, cont):
 def get_printable_location_one_state(green_ast ):
     if green_ast is None:
         return 'Green_Ast is None'
-    return green_ast.tostring()
+    return source_location_prefix(green_ast) + green_ast.tostring()
 
 driver_one_state = jit.JitDriver(reds=["env", "cont"],
                        greens=["ast"],
@@ -2140,6 +2255,8 @@ driver_one_state = jit.JitDriver(reds=["env", "cont"],
 def inner_interpret_one_state(ast, env, cont):
     while True:
         driver_one_state.jit_merge_point(ast=ast, env=env, cont=cont)
+        if config.allocation_profiling:
+            alloc_profile.enter_ast(ast)
         ast, env, cont = ast.interpret(env, cont)
         if ast.should_enter:
             driver_one_state.can_enter_jit(ast=ast, env=env, cont=cont)
@@ -2147,7 +2264,11 @@ def inner_interpret_one_state(ast, env, cont):
 def interpret_one(ast, env=None):
     if env is None:
         env = ToplevelEnv()
-    if env.pycketconfig().two_state:
+    pycketconfig = env.pycketconfig()
+    if pycketconfig.direct_interpretation:
+        from pycket.direct_interpreter import inner_interpret_direct
+        inner_interpret = inner_interpret_direct
+    elif pycketconfig.two_state:
         inner_interpret = inner_interpret_two_state
     else:
         inner_interpret = inner_interpret_one_state
@@ -0,0 +1,175 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Exact-counting lambda profiler, enabled with the lambda_profiling translation
+# option. Every closure call records an invocation of the called Lambda, and a
+# LambdaProfileCont is pushed on the continuation to measure the time until the
+# body returns. A tail call replaces the profile frame of its caller instead of
+# stacking a new one, so tail-recursive loops still run in constant space.
+#
+# Inclusive time is the time from entering the body until its continuation is
+# invoked; self time is the inclusive time minus the inclusive time of calls
+# made from the body. Frames abandoned by escaping continuations are not
+# accounted for.
+
+import time
+
+from pycket.cont              import Cont
+from rpython.rlib             import jit
+from rpython.rlib.objectmodel import specialize
+
+REPORT_LIMIT = 20
+
+class LambdaProfile(object):
+    _attrs_ = ['lam', 'calls', 'inclusive_time', 'self_time', 'active']
+
+    def __init__(self, lam):
+        self.lam            = lam
+        self.calls          = 0
+        self.inclusive_time = 0.0
+        self.self_time      = 0.0
+        # number of frames of this lambda currently on the stack, used to
+        # avoid counting the inclusive time of recursive calls twice
+        self.active         = 0
+
+class CaseLambdaProfile(object):
+    _attrs_ = ['caselam', 'clause_counts']
+
+    def __init__(self, caselam):
+        self.caselam       = caselam
+        self.clause_counts = [0] * len(caselam.lams)
+
+class ProfilerState(object):
+    def __init__(self):
+        self.lambdas     = {}
+        self.caselambdas = {}
+        self.current     = None
+
+state = ProfilerState()
+
+def get_profile(lam):
+    profile = state.lambdas.get(lam, None)
+    if profile is None:
+        profile = state.lambdas[lam] = LambdaProfile(lam)
+    return profile
+
+@jit.dont_look_inside
+def record_clause(caselam, index):
+    profile = state.caselambdas.get(caselam, None)
+    if profile is None:
+        profile = state.caselambdas[caselam] = CaseLambdaProfile(caselam)
+    profile.clause_counts[index] += 1
+
+@jit.dont_look_inside
+def enter_lambda(lam, env, cont):
+    """ Record a call of lam and return the continuation its body should be
+    run with. """
+    profile = get_profile(lam)
+    profile.calls += 1
+    now = time.clock()
+    if isinstance(cont, LambdaProfileCont):
+        # tail call: the calling body is done, take over its return point
+        cont.finish(now)
+        parent = cont.parent
+        cont = cont.prev
+    else:
+        parent = state.current
+    frame = LambdaProfileCont(profile, now, parent, env, cont)
+    profile.active += 1
+    state.current = frame
+    return frame
+
+class LambdaProfileCont(Cont):
+    _attrs_ = ['profile', 'start', 'child_time', 'parent']
+    _immutable_fields_ = ['profile', 'start', 'parent']
+
+    def __init__(self, profile, start, parent, env, prev):
+        Cont.__init__(self, env, prev)
+        self.profile    = profile
+        self.start      = start
+        self.child_time = 0.0
+        self.parent     = parent
+
+    def _clone(self):
+        result = LambdaProfileCont(self.profile, self.start, self.parent,
+                                   self.env, self.prev)
+        result.child_time = self.child_time
+        return result
+
+    def get_ast(self):
+        return self.prev.get_ast()
+
+    def get_next_executed_ast(self):
+        return self.prev.get_next_executed_ast()
+
+    def finish(self, now):
+        elapsed = now - self.start
+        profile = self.profile
+        profile.active -= 1
+        if profile.active <= 0:
+            profile.active = 0
+            profile.inclusive_time += elapsed
+        profile.self_time += elapsed - self.child_time
+        parent = self.parent
+        if parent is not None:
+            parent.child_time += elapsed
+        if state.current is self:
+            state.current = parent
+
+    @jit.dont_look_inside
+    def plug_reduce(self, vals, env):
+        from pycket.interpreter import return_multi_vals
+        self.finish(time.clock())
+        return return_multi_vals(vals, self.env, self.prev)
+
+def format_location(lam):
+    info = lam.sourceinfo
+    if info is None:
+        return "<unknown>"
+    return info.tostring()
+
+def _by_calls(profile):
+    return profile.calls
+
+def _by_self_time(profile):
+    return profile.self_time
+
+@specialize.arg(1)
+def _sort_descending(profiles, key):
+    # insertion sort, the number of profiled lambdas is usually small and this
+    # keeps the code RPython
+    result = []
+    for profile in profiles:
+        i = len(result)
+        result.append(profile)
+        while i > 0 and key(result[i - 1]) < key(profile):
+            result[i] = result[i - 1]
+            i -= 1
+        result[i] = profile
+    return result[:REPORT_LIMIT]
+
+def print_report():
+    profiles = state.lambdas.values()
+    if not profiles:
+        return
+    print "=== lambda profile: top %d by call count ===" % REPORT_LIMIT
+    print "%12s %12s %12s  %s" % ("calls", "incl ms", "self ms", "location")
+    for profile in _sort_descending(profiles, _by_calls):
+        _print_profile(profile)
+    print "=== lambda profile: top %d by self time ===" % REPORT_LIMIT
+    print "%12s %12s %12s  %s" % ("calls", "incl ms", "self ms", "location")
+    for profile in _sort_descending(profiles, _by_self_time):
+        _print_profile(profile)
+    caseprofiles = state.caselambdas.values()
+    if caseprofiles:
+        print "=== case-lambda clause selection ==="
+        for caseprofile in caseprofiles:
+            caselam = caseprofile.caselam
+            counts = [str(n) for n in caseprofile.clause_counts]
+            print "%s: %s" % (format_location(caselam.lams[0]), " ".join(counts))
+
+def _print_profile(profile):
+    print "%12d %12d %12d  %s" % (profile.calls,
+                                  int(profile.inclusive_time * 1000),
+                                  int(profile.self_time * 1000),
+                                  format_location(profile.lam))
@@ -0,0 +1,203 @@
+from pycket.ast_visitor import ASTVisitor
+from pycket.interpreter import (
+    App,
+    Begin0,
+    CaseLambda,
+    Cell,
+    DefineValues,
+    If,
+    Lambda,
+    Let,
+    Letrec,
+    Module,
+    ModuleVar,
+    SequencedBodyAST,
+    SetBang,
+    Var,
+    WithContinuationMark,
+)
+
+class LoopHeaderVisitor(ASTVisitor):
+    """
+    Marks the loop headers that are visible in the AST before it runs:
+    functions bound by the same letrec (or named let, or module level
+    definitions) which tail call each other in a cycle. For every such cycle
+    one of the functions gets enable_jitting, so tracing can start without
+    waiting for the callgraph to observe the calls, and independent of whether
+    the callgraph is enabled at all.
+
+    The visitor does not rebuild the AST, every visit method returns the node
+    it was given.
+    """
+
+    def visit_cell(self, ast):
+        assert isinstance(ast, Cell)
+        ast.expr.visit(self)
+        return ast
+
+    def visit_with_continuation_mark(self, ast):
+        assert isinstance(ast, WithContinuationMark)
+        ast.key.visit(self)
+        ast.value.visit(self)
+        ast.body.visit(self)
+        return ast
+
+    def visit_app(self, ast):
+        assert isinstance(ast, App)
+        ast.rator.visit(self)
+        for rand in ast.rands:
+            rand.visit(self)
+        return ast
+
+    def visit_begin0(self, ast):
+        assert isinstance(ast, Begin0)
+        ast.first.visit(self)
+        self.visit_body(ast)
+        return ast
+
+    def visit_begin(self, ast):
+        self.visit_body(ast)
+        return ast
+
+    def visit_set_bang(self, ast):
+        assert isinstance(ast, SetBang)
+        ast.rhs.visit(self)
+        return ast
+
+    def visit_if(self, ast):
+        assert isinstance(ast, If)
+        ast.tst.visit(self)
+        ast.thn.visit(self)
+        ast.els.visit(self)
+        return ast
+
+    def visit_case_lambda(self, ast):
+        assert isinstance(ast, CaseLambda)
+        sym = ast.recursive_sym
+        if sym is not None:
+            # a named let or a letrec with a single function, converted by
+            # make_letrec
+            mark_loops({sym: ast}, [sym], False)
+        for lam in ast.lams:
+            lam.visit(self)
+        return ast
+
+    def visit_lambda(self, ast):
+        self.visit_body(ast)
+        return ast
+
+    def visit_letrec(self, ast):
+        assert isinstance(ast, Letrec)
+        group = {}
+        order = []
+        for i, rhs in enumerate(ast.rhss):
+            if ast.counts[i] == 1 and isinstance(rhs, CaseLambda):
+                sym = ast.args.elems[ast.total_counts[i]]
+                group[sym] = rhs
+                order.append(sym)
+        mark_loops(group, order, False)
+        for rhs in ast.rhss:
+            rhs.visit(self)
+        self.visit_body(ast)
+        return ast
+
+    def visit_let(self, ast):
+        assert isinstance(ast, Let)
+        for rhs in ast.rhss:
+            rhs.visit(self)
+        self.visit_body(ast)
+        return ast
+
+    def visit_define_values(self, ast):
+        assert isinstance(ast, DefineValues)
+        ast.rhs.visit(self)
+        return ast
+
+    def visit_module(self, ast):
+        assert isinstance(ast, Module)
+        group = {}
+        order = []
+        for b in ast.body:
+            if (isinstance(b, DefineValues) and len(b.names) == 1 and
+                    isinstance(b.rhs, CaseLambda)):
+                sym = b.names[0]
+                group[sym] = b.rhs
+                order.append(sym)
+        mark_loops(group, order, True)
+        for b in ast.body:
+            b.visit(self)
+        return ast
+
+    def visit_body(self, ast):
+        assert isinstance(ast, SequencedBodyAST)
+        for b in ast.body:
+            b.visit(self)
+
+def called_sym(rator, module_level):
+    """ The name a call through rator refers to, if it can be one of the
+    functions in a group. """
+    if module_level:
+        if isinstance(rator, ModuleVar) and rator.srcmod is None and rator.path is None:
+            return rator.srcsym
+        return None
+    if isinstance(rator, Var) and not isinstance(rator, ModuleVar):
+        return rator.sym
+    return None
+
+def collect_tail_calls(ast, group, module_level, result):
+    """ Adds to result the functions of group called in tail position of
+    ast. """
+    while True:
+        if isinstance(ast, App):
+            sym = called_sym(ast.rator, module_level)
+            if sym is not None and sym in group:
+                result[sym] = None
+            return
+        elif isinstance(ast, If):
+            collect_tail_calls(ast.thn, group, module_level, result)
+            ast = ast.els
+        elif isinstance(ast, WithContinuationMark):
+            ast = ast.body
+        elif isinstance(ast, SequencedBodyAST) and not isinstance(ast, Begin0) \
+                and not isinstance(ast, Lambda):
+            ast = ast.body[-1]
+        else:
+            return
+
+def reaches(edges, start, target):
+    todo = edges[start].keys()
+    visited = {}
+    while todo:
+        sym = todo.pop()
+        if sym is target:
+            return True
+        if sym in visited:
+            continue
+        visited[sym] = None
+        todo.extend(edges[sym].keys())
+    return False
+
+def mark_loops(group, order, module_level):
+    """ Enable jitting for one function of every cycle of tail calls in group,
+    the first one in order. """
+    if not group:
+        return
+    edges = {}
+    for sym in order:
+        called = {}
+        for lam in group[sym].lams:
+            collect_tail_calls(lam.body[-1], group, module_level, called)
+        edges[sym] = called
+    headers = []
+    for sym in order:
+        if not reaches(edges, sym, sym):
+            continue
+        for header in headers:
+            if reaches(edges, sym, header) and reaches(edges, header, sym):
+                break
+        else:
+            headers.append(sym)
+            group[sym].enable_jitting()
+
+def mark_loop_headers(ast):
+    return ast.visit(LoopHeaderVisitor())
@@ -42,6 +42,7 @@ def print_help(argv):
   -c <file> : run pycket with complete expansion, expanding every dependent module and put everything into one single json. <file> can also be a json pre-generated with -c option, in this case pycket doesn't need to expand anything at all.
  Configuration options:
   --stdlib: Use Pycket's version of stdlib (only applicable for -e)
+  --stats: Print garbage collector and JIT statistics on exit
  Meta options:
   --jit <jitargs> : Set RPython JIT options may be 'default', 'off',
                     or 'param=value,param=value' list
@@ -149,6 +150,9 @@ def parse_args(argv):
         elif argv[i] == '--save-callgraph':
             config['save-callgraph'] = True
 
+        elif argv[i] == '--stats':
+            config['stats'] = True
+
         else:
             if 'file' in names:
                 break
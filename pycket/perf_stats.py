@@ -0,0 +1,136 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Garbage collector and JIT statistics behind current-gc-milliseconds,
+# current-memory-use, vector-set-performance-stats! and time-apply, and the
+# report printed at exit with --stats.
+#
+# Collections are counted by GC hooks (installed by get_gchooks in the entry
+# point), which report their duration in read_timestamp ticks. When the ticks
+# are not nanoseconds they are converted by comparing the ticks and the wall
+# clock time elapsed since startup. The JIT counters are the ones the JIT keeps
+# for PYPYLOG, read through jit_hooks; the tracing time is only measured with
+# --stats. Heap sizes are only known to the translated GC; untranslated, they
+# are reported as zero.
+
+import time
+
+from rpython.memory.gc.hook   import GcHooks
+from rpython.rlib             import jit_hooks, rgc, rtimer
+from rpython.rlib.jit         import Counters
+from rpython.rlib.objectmodel import we_are_translated
+
+# set by target() before annotation, the jit_hooks functions only exist in
+# builds with a JIT
+JIT_AVAILABLE = False
+
+class PerfStats(object):
+    def __init__(self):
+        self.minor_collections = 0
+        self.major_collections = 0
+        self.gc_ticks          = 0
+        self.start_time        = time.time()
+        self.start_ticks       = rtimer.read_timestamp()
+
+    def startup(self):
+        self.start_time  = time.time()
+        self.start_ticks = rtimer.read_timestamp()
+
+    def enable_jit_stats(self):
+        # the JIT only measures time spent tracing in debug mode, which costs
+        # in every compiled loop, so it is only turned on with --stats
+        if JIT_AVAILABLE:
+            jit_hooks.stats_set_debug(None, True)
+
+    def ticks_to_ms(self, ticks):
+        if rtimer.get_timestamp_unit() == rtimer.UNIT_NS:
+            return float(ticks) / 1000000.0
+        elapsed_ticks = rtimer.read_timestamp() - self.start_ticks
+        elapsed_ms = (time.time() - self.start_time) * 1000.0
+        if elapsed_ticks <= 0:
+            return 0.0
+        return float(ticks) * elapsed_ms / float(elapsed_ticks)
+
+state = PerfStats()
+
+class PycketGcHooks(GcHooks):
+    def is_gc_minor_enabled(self):
+        return True
+
+    def is_gc_collect_step_enabled(self):
+        return True
+
+    def is_gc_collect_enabled(self):
+        return True
+
+    def on_gc_minor(self, duration, total_memory_used, pinned_objects):
+        state.minor_collections += 1
+        state.gc_ticks += duration
+
+    def on_gc_collect_step(self, duration, oldstate, newstate):
+        state.gc_ticks += duration
+
+    def on_gc_collect(self, num_major_collects,
+                      arenas_count_before, arenas_count_after,
+                      arenas_bytes, rawmalloc_bytes_before,
+                      rawmalloc_bytes_after):
+        state.major_collections += 1
+
+gchooks = PycketGcHooks()
+
+def gc_milliseconds():
+    return int(state.ticks_to_ms(state.gc_ticks))
+
+def gc_count():
+    return state.minor_collections + state.major_collections
+
+def _gc_stat(what):
+    if not we_are_translated():
+        return 0
+    return rgc.get_stats(what)
+
+def memory_use():
+    return _gc_stat(rgc.TOTAL_MEMORY)
+
+def peak_memory_use():
+    return _gc_stat(rgc.PEAK_MEMORY)
+
+def cumulative_memory_use():
+    # every minor collection empties the nursery, so everything allocated so
+    # far is (at least) a full nursery per minor collection plus what is live
+    return state.minor_collections * _gc_stat(rgc.NURSERY_SIZE) + memory_use()
+
+def _jit_counter(counter):
+    if not JIT_AVAILABLE or not we_are_translated():
+        return 0
+    return jit_hooks.stats_get_counter_value(None, counter)
+
+def compiled_loops():
+    return _jit_counter(Counters.TOTAL_COMPILED_LOOPS)
+
+def compiled_bridges():
+    return _jit_counter(Counters.TOTAL_COMPILED_BRIDGES)
+
+def trace_aborts():
+    return (_jit_counter(Counters.ABORT_TOO_LONG) +
+            _jit_counter(Counters.ABORT_BRIDGE) +
+            _jit_counter(Counters.ABORT_BAD_LOOP) +
+            _jit_counter(Counters.ABORT_ESCAPE) +
+            _jit_counter(Counters.ABORT_FORCE_QUASIIMMUT))
+
+def tracing_milliseconds():
+    if not JIT_AVAILABLE or not we_are_translated():
+        return 0
+    return int(jit_hooks.stats_get_times_value(None, Counters.TRACING) * 1000)
+
+def print_report():
+    print "=== performance statistics ==="
+    print "%-24s %d" % ("minor collections", state.minor_collections)
+    print "%-24s %d" % ("major collections", state.major_collections)
+    print "%-24s %d" % ("gc ms", gc_milliseconds())
+    print "%-24s %d" % ("memory use", memory_use())
+    print "%-24s %d" % ("peak memory use", peak_memory_use())
+    print "%-24s %d" % ("compiled loops", compiled_loops())
+    print "%-24s %d" % ("compiled bridges", compiled_bridges())
+    print "%-24s %d" % ("trace aborts", trace_aborts())
+    print "%-24s %d" % ("tracing ms", tracing_milliseconds())
@@ -41,25 +41,18 @@ class DynamicWindValueCont(Cont):
 def call_handler_cont(proc, args, env, cont, _vals):
     return proc.call(args, env, cont)
 
-@continuation
-def post_build_exception(env, cont, _vals):
-    from pycket.interpreter import check_one_val
-    barrier = values.w_true
-    val = check_one_val(_vals)
-    return raise_exception(val, barrier, env, cont)
-
 def convert_runtime_exception(exn, env, cont):
-    from pycket               import values_string
-    from pycket.prims.general import exn_fail, exn_fail_user
-    from pycket.values        import W_ContinuationMarkSet
-    from pycket.prims.control import raise_exception
-    message = values_string.W_String.fromstr_utf8(exn.msg)
-    marks   = W_ContinuationMarkSet(cont, values.w_default_continuation_prompt_tag)
-    cont    = post_build_exception(env, cont)
+    from pycket.prims.general import exn_fail, exn_fail_contract, exn_fail_user
+    from pycket.values_struct import W_LazyExnStruct
     if exn.is_user():
-        return exn_fail_user.constructor.call([message, marks], env, cont)
+        struct_type = exn_fail_user
+    elif exn.is_contract():
+        struct_type = exn_fail_contract
     else:
-        return exn_fail.constructor.call([message, marks], env, cont)
+        struct_type = exn_fail
+    # the message and the marks are only built if the handler looks at them
+    w_exn = W_LazyExnStruct(struct_type, exn, cont)
+    return raise_exception(w_exn, values.w_true, env, cont)
 
 @jit.unroll_safe
 def scan_continuation(curr, prompt_tag, look_for=None, escape=False):
@@ -112,34 +105,86 @@ def find_merge_point(c1, c2):
     while i >= 0 and j >= 0 and c1[i] is c2[j]:
         i -= 1
         j -= 1
-    unwind = []
-    rewind = []
-
     r1 = c1[-1] if i == len(c1) - 1 else c1[i+1]
     r2 = c2[-1] if j == len(c2) - 1 else c2[j+1]
+    return r1, r2
 
-    while i >= 0:
-        if isinstance(c1[i], DynamicWindValueCont):
-            unwind.append(c1[i])
-        i -= 1
-    while j >= 0:
-        if isinstance(c2[j], DynamicWindValueCont):
-            rewind.append(c2[j])
-        j -= 1
-    return r1, r2, unwind, rewind
-
+@jit.dont_look_inside
+def merge_continuations(c1, c2, prompt_tag):
+    """
+    Like scan_continuation on both continuations followed by find_merge_point,
+    but walks the two continuations alternately and stops at the first frame
+    they share, so the cost depends only on the frames that differ.
+    """
+    seen1 = {}
+    seen2 = {}
+    last1 = last2 = None
+    curr1 = c1
+    curr2 = c2
+    while isinstance(curr1, Cont) or isinstance(curr2, Cont):
+        if isinstance(curr1, Cont):
+            if curr1 in seen2:
+                return curr1, curr1
+            seen1[curr1] = None
+            last1 = curr1
+            if isinstance(curr1, Prompt) and curr1.tag is prompt_tag:
+                curr1 = None
+            else:
+                curr1 = curr1.prev
+        if isinstance(curr2, Cont):
+            if curr2 in seen1:
+                return curr2, curr2
+            seen2[curr2] = None
+            last2 = curr2
+            if isinstance(curr2, Prompt) and curr2.tag is prompt_tag:
+                curr2 = None
+            else:
+                curr2 = curr2.prev
+    return last1, last2
+
+# This walks all the frames between cont and bound, not only the dynamic-wind
+# ones. Indexing the dynamic-wind frames by depth would find them without
+# visiting the other frames, but the index has to be stored on the frames, and
+# frames copied by Cont.append or relinked by one-shot continuations keep the
+# index of the chain they were captured from. The walk is bounded by the merge
+# point, so it only visits the frames in which the two continuations differ.
 @jit.elidable
-def find_handlers(cont, target):
+def winders_between(cont, bound):
+    """ The dynamic-wind frames from cont up to, but excluding, bound (one of
+    the frames after it, or None for all of them), innermost first. """
     result = None
-    while cont is not target:
-        assert isinstance(cont, Cont)
+    while isinstance(cont, Cont) and cont is not bound:
         if isinstance(cont, DynamicWindValueCont):
-            if not result:
+            if result is None:
                 result = []
             result.append(cont)
         cont = cont.prev
     return result
 
+def find_winders(c1, c2, r1, r2):
+    """
+    The dynamic-wind frames to unwind when leaving c1 and to rewind when
+    entering c2, where r1 and r2 are their merge point as computed by
+    find_merge_point: the frame they share, or the last frames (the prompts)
+    of the two if they do not share one. Both lists are innermost first.
+    The frames are found by walking the continuations themselves: frames
+    copied by Cont.append keep the marks of the originals, which lead back
+    into the continuation they were captured from.
+    """
+    if r1 is r2:
+        return winders_between(c1, r1), winders_between(c2, r2)
+    return winders_between(c1, frame_after(r1)), winders_between(c2, frame_after(r2))
+
+def frame_after(cont):
+    if isinstance(cont, Cont):
+        return cont.prev
+    return None
+
+def find_handlers(cont, target):
+    """ The dynamic-wind frames to unwind when returning from cont to target,
+    which it extends, innermost first. """
+    return winders_between(cont, target)
+
 @jit.unroll_safe
 def install_continuation_fast_path(current_cont, args, has_handlers, env, cont):
     from pycket.interpreter import return_multi_vals, return_void
@@ -149,16 +194,16 @@ def install_continuation_fast_path(current_cont, args, has_handlers, env, cont):
         return return_multi_vals(args, env, cont)
 
     unwind = find_handlers(current_cont, cont)
+    if not unwind:
+        args = values.Values.make(args)
+        return return_multi_vals(args, env, cont)
     cont = return_args_cont(args, env, cont)
-    unwind = [x for x in reversed(unwind)]
     cont = do_unwind_cont(unwind, env, cont)
     return return_void(env, cont)
 
 
 @jit.unroll_safe
 def install_continuation(cont, prompt_tag, args, env, current_cont, extend=False, escape=False):
-    from pycket.interpreter import return_multi_vals, return_void
-
     # Find the common merge point for two continuations
     # The extend option controls whether or not we remove frames from the
     # existing continuation, or simply stack the new continuation on top.
@@ -174,11 +219,30 @@ def install_continuation(cont, prompt_tag, args, env, current_cont, extend=False
         if head1 is None:
             return install_continuation_fast_path(current_cont, args, handlers, env, cont)
         head2, _ = scan_continuation(cont, prompt_tag)
-        base, stop, unwind, rewind = find_merge_point(head1, head2)
+        base, stop = find_merge_point(head1, head2)
+        unwind, rewind = find_winders(current_cont, cont, base, stop)
 
     # Append the continuations at the appropriate prompt
     if base is not None:
         cont = cont.append(base, stop=stop, upto=prompt_tag)
+    return wind_and_return(cont, args, unwind, rewind, env)
+
+def install_one_shot_continuation(cont, prompt_tag, args, env, current_cont):
+    """
+    Reinstate a continuation that can only be reinstated once: as nothing
+    else will reinstate its frames, they are reused wherever their tail stays
+    the same, and only the frames that differ from the current continuation
+    are visited.
+    """
+    base, stop = merge_continuations(current_cont, cont, prompt_tag)
+    unwind, rewind = find_winders(current_cont, cont, base, stop)
+    if base is not None:
+        cont = cont.append(base, stop=stop, upto=prompt_tag, share=True)
+    return wind_and_return(cont, args, unwind, rewind, env)
+
+@jit.unroll_safe
+def wind_and_return(cont, args, unwind, rewind, env):
+    from pycket.interpreter import return_multi_vals, return_void
 
     # Fast path if no unwinding is required (avoids continuation allocation)
     if not unwind and not rewind:
@@ -192,7 +256,6 @@ def install_continuation(cont, prompt_tag, args, env, current_cont, extend=False
     if rewind:
         cont = do_rewind_cont(rewind, env, cont)
     if unwind:
-        unwind = [x for x in reversed(unwind)]
         cont = do_unwind_cont(unwind, env, cont)
     return return_void(env, cont)
 
@@ -292,6 +355,41 @@ def callcc(proc, prompt_tag, env, cont, extra_call_info):
     kont = [values.W_Continuation(cont, prompt_tag)]
     return proc.call_with_extra_info(kont, env, cont, extra_call_info)
 
+@expose(["call/1cc", "call-with-one-shot-continuation"],
+        [procedure, default(values.W_ContinuationPromptTag, None)],
+        simple=False, extra_info=True)
+def call_with_one_shot_continuation(proc, prompt_tag, env, cont, extra_call_info):
+    # A call/1cc in tail position of the procedure of another one shares its
+    # frame, so loops through call/1cc run in constant space.
+    if not isinstance(cont, OneShotReturnCont):
+        cont = OneShotReturnCont(OneShotState(), env, cont)
+    w_kont = values.W_OneShotContinuation(cont, cont.state, prompt_tag)
+    return proc.call_with_extra_info([w_kont], env, cont, extra_call_info)
+
+class OneShotState(object):
+    """ Whether the procedures of the call/1cc calls sharing a
+    OneShotReturnCont have returned, which uses up their continuations. """
+    def __init__(self):
+        self.returned = False
+
+@add_copy_method(copy_method="_clone")
+class OneShotReturnCont(Cont):
+    """ Returning normally from the procedure of call/1cc goes through the
+    frames of its continuation, which may get new marks on the way, so that
+    uses it up as well. Reinstating it afterwards would reuse frames that have
+    changed. """
+
+    _immutable_fields_ = ['state']
+
+    def __init__(self, state, env, cont):
+        Cont.__init__(self, env, cont)
+        self.state = state
+
+    def plug_reduce(self, _vals, env):
+        from pycket.interpreter import return_multi_vals
+        self.state.returned = True
+        return return_multi_vals(_vals, env, self.prev)
+
 @continuation
 def call_with_escape_continuation_cont(env, cont, _vals):
     # Does not do anything currently. Solely to ensure call/ec does not invoke
@@ -396,14 +494,10 @@ def raise_exception(v, barrier, env, cont):
     # TODO: Handle case where barrier is not #t
     assert barrier is values.w_true
 
-    handler = None
-    while cont is not None:
-        handler, _ = cont.find_cm(values.exn_handler_key)
-        if handler is not None:
-            break
-        cont = cont.get_previous_continuation()
-    else:
+    cont = cont.find_mark_frame(values.exn_handler_key)
+    if cont is None:
         raise SchemeException("uncaught exception:\n %s" % v.tostring())
+    handler, _ = cont.find_cm(values.exn_handler_key)
 
     if not handler.iscallable():
         raise SchemeException("provided handler is not callable")
@@ -6,6 +6,7 @@ from pycket              import values_struct
 from pycket              import values_string
 from pycket.cont         import continuation, label, loop_label
 from pycket.error        import SchemeException
+from pycket.hash.set     import W_HashSet
 from pycket.prims.expose import expose, procedure
 from rpython.rlib        import jit, objectmodel
 
@@ -184,6 +185,9 @@ def equal_func_impl(a, b, info, env, cont, n):
             b = values_struct.struct2vector(b, immutable=b_imm)
             return equal_func_unroll_n(a, b, info, env, cont, n)
 
+    if isinstance(a, W_HashSet) and isinstance(b, W_HashSet):
+        return a.equal_set(b, env, cont)
+
     if for_chaperone == EqualInfo.BASIC and a.is_proxy() and b.is_proxy():
         return equal_func_unroll_n(a.get_proxied(), b.get_proxied(), info, env, cont, n)
 
@@ -203,6 +207,71 @@ def equal_hash_args(w_prop):
         return lst[0], lst[1], lst[2]
     raise SchemeException("invalid prop:equal+hash arg " + w_prop.tostring())
 
+EQUAL_FALSE   = 0
+EQUAL_TRUE    = 1
+EQUAL_UNKNOWN = 2
+
+def equal_without_cont(a, b, fuel):
+    """
+    Decides equal? for values whose comparison cannot run Racket code, in at
+    most fuel steps. Returns EQUAL_UNKNOWN if the values contain impersonators
+    or chaperones or structs with prop:equal+hash, or if fuel runs out, in
+    which case equal_func has to be used.
+    """
+    todo_a = [a]
+    todo_b = [b]
+    while todo_a:
+        fuel -= 1
+        if fuel < 0:
+            return EQUAL_UNKNOWN
+        a = todo_a.pop()
+        b = todo_b.pop()
+        if a.eqv(b):
+            continue
+        if a.is_proxy() or b.is_proxy():
+            return EQUAL_UNKNOWN
+        if isinstance(a, values.W_Cons) and isinstance(b, values.W_Cons):
+            todo_a.append(a.cdr())
+            todo_b.append(b.cdr())
+            todo_a.append(a.car())
+            todo_b.append(b.car())
+            continue
+        if isinstance(a, values.W_MCons) and isinstance(b, values.W_MCons):
+            todo_a.append(a.cdr())
+            todo_b.append(b.cdr())
+            todo_a.append(a.car())
+            todo_b.append(b.car())
+            continue
+        if isinstance(a, values.W_MBox) and isinstance(b, values.W_MBox):
+            todo_a.append(a.value)
+            todo_b.append(b.value)
+            continue
+        if isinstance(a, values.W_IBox) and isinstance(b, values.W_IBox):
+            todo_a.append(a.value)
+            todo_b.append(b.value)
+            continue
+        if isinstance(a, values_struct.W_RootStruct) and isinstance(b, values_struct.W_RootStruct):
+            a_type = a.struct_type()
+            b_type = b.struct_type()
+            if a_type.read_prop(values_struct.w_prop_equal_hash):
+                return EQUAL_UNKNOWN
+            if not a_type.isopaque and not b_type.isopaque:
+                a = values_struct.struct2vector(a)
+                b = values_struct.struct2vector(b)
+        if isinstance(a, values_vector.W_Vector) and isinstance(b, values_vector.W_Vector):
+            if a.length() != b.length():
+                return EQUAL_FALSE
+            for i in range(a.length()):
+                todo_a.append(a.ref(i))
+                todo_b.append(b.ref(i))
+            continue
+        if (isinstance(a, values.W_Box) or isinstance(a, values.W_MVector) or
+                isinstance(a, W_HashSet)):
+            return EQUAL_UNKNOWN
+        if not a.equal(b):
+            return EQUAL_FALSE
+    return EQUAL_TRUE
+
 def eqp_logic(a, b):
     if a is b:
         return True
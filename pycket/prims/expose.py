@@ -1,6 +1,6 @@
 
 from rpython.rlib import jit, unroll
-from pycket.error import SchemeException
+from pycket.error import ContractException, SchemeException
 from pycket.arity import Arity
 
 prim_env = {}
@@ -72,7 +72,11 @@ def unwrap_procedure(w_arg):
 
 procedure = procedure()
 
-def _make_arg_unwrapper(func, argstypes, funcname, has_self=False, simple=False):
+def _make_arg_unwrapper(func, argstypes, funcname, has_self=False, simple=False,
+                        cps=False):
+    """ cps: func takes env and cont after its arguments, and errors in the
+    arguments are raised to the Racket exception handlers of cont instead of
+    as SchemeExceptions, which only simple primitives convert. """
     argtype_tuples = []
     min_arg = 0
     isdefault = False
@@ -102,7 +106,8 @@ def _make_arg_unwrapper(func, argstypes, funcname, has_self=False, simple=False)
             func, min_arg, unroll_argtypes, errormsg_arity)
     else:
         func_arg_unwrap = make_list_arg_unwrapper(
-            func, has_self, min_arg, max_arity, unroll_argtypes, errormsg_arity)
+            func, has_self, min_arg, max_arity, unroll_argtypes, errormsg_arity,
+            cps)
         call1 = call2 = None
     _arity = Arity.oneof(*range(min_arg, max_arity+1))
     return func_arg_unwrap, _arity, call1, call2
@@ -130,7 +135,7 @@ def make_direct_arg_unwrapper(func, num_args, unroll_argtypes, errormsg_arity):
         def func_direct_unwrap(arg1, *rest):
             typed_arg1 = unwrapper(arg1)
             if typed_arg1 is None:
-                raise SchemeException(type_errormsg + arg1.tostring())
+                raise ContractException(type_errormsg, arg1)
             return func(typed_arg1, *rest)
         func_direct_unwrap.func_name = "%s_fast1" % (func.func_name, )
         return func_arg_unwrap, func_direct_unwrap, None
@@ -153,12 +158,12 @@ def make_direct_arg_unwrapper(func, num_args, unroll_argtypes, errormsg_arity):
             else:
                 type_errormsg = type_errormsg1
                 arg = arg1
-            raise SchemeException(type_errormsg + arg.tostring())
+            raise ContractException(type_errormsg, arg)
         func_direct_unwrap.func_name = "%s_fast2" % (func.func_name, )
         return func_arg_unwrap, None, func_direct_unwrap
 
 
-def make_list_arg_unwrapper(func, has_self, min_arg, max_arity, unroll_argtypes, errormsg_arity):
+def make_list_arg_unwrapper(func, has_self, min_arg, max_arity, unroll_argtypes, errormsg_arity, cps):
     def func_arg_unwrap(*allargs):
         from pycket import values
         if has_self:
@@ -172,7 +177,10 @@ def make_list_arg_unwrapper(func, has_self, min_arg, max_arity, unroll_argtypes,
             typed_args = ()
         lenargs = len(args)
         if not min_arg <= lenargs <= max_arity:
-            raise SchemeException(errormsg_arity + str(lenargs))
+            exn = SchemeException(errormsg_arity + str(lenargs))
+            if cps:
+                return convert_arg_error(exn, rest)
+            raise exn
         type_errormsg = None
         for i, unwrapper, default, default_value, type_errormsg in unroll_argtypes:
             if i >= min_arg and i >= lenargs:
@@ -189,10 +197,19 @@ def make_list_arg_unwrapper(func, has_self, min_arg, max_arity, unroll_argtypes,
             return func(*typed_args)
         # reachable only by break when the type check fails
         assert type_errormsg is not None
-        raise SchemeException(type_errormsg + arg.tostring())
+        exn = ContractException(type_errormsg, arg)
+        if cps:
+            return convert_arg_error(exn, rest)
+        raise exn
     func_arg_unwrap.func_name = "%s_arg_unwrap" % (func.func_name, )
     return func_arg_unwrap
 
+def convert_arg_error(exn, rest):
+    """ Raise exn to the handlers of the continuation in rest, the env and cont
+    (and possibly the calling app) passed after the arguments. """
+    from pycket.prims.control import convert_runtime_exception
+    return convert_runtime_exception(exn, rest[0], rest[1])
+
 def _make_result_handling_func(func_arg_unwrap, simple):
     if simple:
         def func_result_handling(*args):
@@ -223,7 +240,8 @@ def make_procedure(n="<procedure>", argstypes=None, simple=True, arity=None):
         names = [n] if isinstance(n, str) else n
         name = names[0]
         if argstypes is not None:
-            func_arg_unwrap, _arity, _, _ = _make_arg_unwrapper(func, argstypes, name, simple=simple)
+            func_arg_unwrap, _arity, _, _ = _make_arg_unwrapper(
+                    func, argstypes, name, simple=simple, cps=not simple)
             if arity is not None:
                 _arity = arity
         else:
@@ -243,7 +261,8 @@ def make_remove_extra_info(func):
     remove_extra_info.__name__ += func.__name__
     return remove_extra_info
 
-def expose(n, argstypes=None, simple=True, arity=None, nyi=False, extra_info=False):
+def expose(n, argstypes=None, simple=True, arity=None, nyi=False, extra_info=False,
+           simple_n=None):
     """
     n:          names that the function should be exposed under
     argstypes:  if None, the list of args is passed directly to the function
@@ -257,6 +276,10 @@ def expose(n, argstypes=None, simple=True, arity=None, nyi=False, extra_info=Fal
                 do with it is to pass it into a w_value.call_with_extra_info as
                 the last argument. This will ensure that the call graph
                 information stays correct.
+    simple_n:   for a primitive that is not simple, a function taking the same
+                arguments without env and cont and returning the result the
+                way a simple primitive does. It becomes the simple_n of the
+                primitive, so the direct interpreter can still call it.
     """
     def wrapper(func):
         from pycket import values
@@ -264,6 +287,8 @@ def expose(n, argstypes=None, simple=True, arity=None, nyi=False, extra_info=Fal
         name = names[0]
         if extra_info:
             assert not simple
+        if simple_n is not None:
+            assert not simple
         call1 = call2 = None
         if nyi:
             def func_arg_unwrap(*args):
@@ -272,7 +297,7 @@ def expose(n, argstypes=None, simple=True, arity=None, nyi=False, extra_info=Fal
             _arity = arity or Arity.unknown
         elif argstypes is not None:
             func_arg_unwrap, _arity, call1, call2 = _make_arg_unwrapper(
-                    func, argstypes, name, simple=simple)
+                    func, argstypes, name, simple=simple, cps=not simple)
             if arity is not None:
                 _arity = arity
         else:
@@ -282,9 +307,17 @@ def expose(n, argstypes=None, simple=True, arity=None, nyi=False, extra_info=Fal
         if not extra_info:
             func_result_handling = make_remove_extra_info(func_result_handling)
         result_arity = Arity.ONE if simple else None
+        # simple primitives can also be called with just the argument list,
+        # returning their result (used by the direct interpreter)
+        if simple:
+            direct = func_arg_unwrap
+        elif simple_n is not None and argstypes is not None:
+            direct, _, _, _ = _make_arg_unwrapper(simple_n, argstypes, name)
+        else:
+            direct = simple_n
         p = values.W_Prim(name, func_result_handling,
                           arity=_arity, result_arity=result_arity,
-                          simple1=call1, simple2=call2)
+                          simple1=call1, simple2=call2, simple_n=direct)
         for nam in names:
             sym = values.W_Symbol.make(nam)
             if sym in prim_env:
@@ -298,7 +331,7 @@ def make_call_method(argstypes=None, arity=None, simple=True, name="<method>"):
     def wrapper(func):
         if argstypes is not None:
             func_arg_unwrap, _, _, _ = _make_arg_unwrapper(
-                func, argstypes, name, has_self=True)
+                func, argstypes, name, has_self=True, cps=not simple)
         else:
             func_arg_unwrap = func
         return _make_result_handling_func(func_arg_unwrap, simple)
@@ -4,14 +4,15 @@ import os
 import sys
 import time
 from pycket import impersonators as imp
+from pycket import perf_stats
 from pycket import values, values_string
-from pycket.cont import continuation, loop_label, call_cont
+from pycket.cont import continuation, loop_label, CallValuesCont
 from pycket.arity import Arity
 from pycket import values_parameter
 from pycket import values_struct
 from pycket import values_regex
 from pycket import vector as values_vector
-from pycket.error import SchemeException, UserException
+from pycket.error import ContractException, SchemeException, UserException
 from pycket.foreign import W_CPointer, W_CType
 from pycket.hash.base import W_HashTable
 from pycket.hash.simple import (W_EqImmutableHashTable, make_simple_immutable_table)
@@ -36,6 +37,7 @@ from pycket.prims import numeric
 from pycket.prims import parameter
 from pycket.prims import random
 from pycket.prims import regexp
+from pycket.prims import set as set_prims
 from pycket.prims import string
 from pycket.prims import struct_structinfo
 from pycket.prims import undefined
@@ -112,7 +114,6 @@ for args in [
         ("hash-eq?", W_HashTable),
         ("hash-eqv?", W_HashTable),
         ("hash-equal?", W_HashTable),
-        ("hash-weak?", W_HashTable),
         ("cpointer?", W_CPointer),
         ("ctype?", W_CType),
         ("continuation-prompt-tag?", values.W_ContinuationPromptTag),
@@ -628,30 +629,40 @@ def is_module_path(v):
 def module_pathp(v):
     return values.W_Bool.make(is_module_path(v))
 
-@expose("values")
-def do_values(args_w):
-    return values.Values.make(args_w)
+@expose("values", simple=False, simple_n=values.Values.make)
+def do_values(args_w, env, cont):
+    from pycket.interpreter import (return_multi_vals, return_three_vals,
+                                    return_two_vals)
+    if len(args_w) == 2:
+        return return_two_vals(args_w[0], args_w[1], env, cont)
+    if len(args_w) == 3:
+        return return_three_vals(args_w[0], args_w[1], args_w[2], env, cont)
+    return return_multi_vals(values.Values.make(args_w), env, cont)
 
 @expose("call-with-values", [procedure] * 2, simple=False, extra_info=True)
 def call_with_values (producer, consumer, env, cont, extra_call_info):
     # FIXME: check arity
-    return producer.call_with_extra_info([], env, call_cont(consumer, env, cont), extra_call_info)
+    return producer.call_with_extra_info([], env, CallValuesCont(consumer, env, cont), extra_call_info)
 
 @continuation
-def time_apply_cont(initial, env, cont, vals):
+def time_apply_cont(initial, initial_real, initial_gc, env, cont, vals):
     from pycket.interpreter import return_multi_vals
-    final = time.clock()
-    ms = values.W_Fixnum(int((final - initial) * 1000))
+    ms = values.W_Fixnum(int((time.clock() - initial) * 1000))
+    real_ms = values.W_Fixnum(int((time.time() - initial_real) * 1000))
+    gc_ms = values.W_Fixnum(perf_stats.gc_milliseconds() - initial_gc)
     vals_w = vals.get_all_values()
     results = values.Values.make([values.to_list(vals_w),
-                                  ms, ms, values.W_Fixnum.ZERO])
+                                  ms, real_ms, gc_ms])
     return return_multi_vals(results, env, cont)
 
 @expose("time-apply", [procedure, values.W_List], simple=False, extra_info=True)
 def time_apply(a, args, env, cont, extra_call_info):
     initial = time.clock()
+    initial_real = time.time()
+    initial_gc = perf_stats.gc_milliseconds()
     return  a.call_with_extra_info(values.from_list(args),
-                                   env, time_apply_cont(initial, env, cont),
+                                   env, time_apply_cont(initial, initial_real,
+                                                        initial_gc, env, cont),
                                    extra_call_info)
 
 @expose("apply", simple=False, extra_info=True)
@@ -662,6 +673,17 @@ def apply(args, env, cont, extra_call_info):
     if not fn.iscallable():
         raise SchemeException("apply expected a procedure, got something else")
     lst = args[-1]
+    args_len = len(args) - 1
+    assert args_len >= 0
+    if lst.is_proper_list():
+        # closures take the elements for their formals straight from the
+        # list, and the list itself (or its tail) as the rest argument
+        if isinstance(fn, values.W_PromotableClosure):
+            return fn.call_spread(args[1:args_len], lst, env, cont, extra_call_info)
+        if isinstance(fn, values.W_Closure):
+            return fn.call_spread(args[1:args_len], lst, env, cont, extra_call_info)
+        if isinstance(fn, values.W_Closure1AsEnv):
+            return fn.call_spread(args[1:args_len], lst, env, cont, extra_call_info)
     try:
         fn_arity = fn.get_arity(promote=True)
         if fn_arity is Arity.unknown or fn_arity.at_least == -1:
@@ -674,8 +696,6 @@ def apply(args, env, cont, extra_call_info):
     except SchemeException:
         raise SchemeException(
             "apply expected a list as the last argument, got something else")
-    args_len = len(args) - 1
-    assert args_len >= 0
     others = args[1:args_len]
     new_args = others + rest
     return fn.call_with_extra_info(new_args, env, cont, extra_call_info)
@@ -765,12 +785,14 @@ def make_list_eater(name):
         else:
             assert False, "Bad list eater specification"
 
+    errormsg = "%s: expected %s given " % (name, contract)
+
     @expose(name, [values.W_Object])
     def process_list(_lst):
         lst = _lst
         for letter in unrolled:
             if not isinstance(lst, values.W_Cons):
-                raise SchemeException("%s: expected %s given %s" % (name, contract, _lst))
+                raise ContractException(errormsg, _lst)
             if letter == 'a':
                 lst = lst.car()
             elif letter == 'd':
@@ -1173,8 +1195,8 @@ def unsafe_mcdr(p):
 
 @expose("port-next-location", [values.W_Object], simple=False)
 def port_next_loc(p, env, cont):
-    from pycket.interpreter import return_multi_vals
-    return return_multi_vals(values.Values.make([values.w_false] * 3),
+    from pycket.interpreter import return_three_vals
+    return return_three_vals(values.w_false, values.w_false, values.w_false,
                              env, cont)
 
 @expose("port-writes-special?", [values.W_Object])
@@ -1358,6 +1380,62 @@ def do_collect_garbage():
     rgc.collect()
     return values.w_void
 
+@expose("current-gc-milliseconds", [])
+@jit.dont_look_inside
+def current_gc_milliseconds():
+    return values.W_Fixnum(perf_stats.gc_milliseconds())
+
+@expose("current-process-milliseconds", [default(values.W_Object, values.w_false)])
+def current_process_milliseconds(w_thread):
+    return values.W_Fixnum(int(time.clock() * 1000))
+
+@expose("current-milliseconds", [])
+def current_milliseconds():
+    return values.W_Fixnum(int(time.time() * 1000))
+
+w_cumulative_sym = values.W_Symbol.make("cumulative")
+w_peak_sym = values.W_Symbol.make("peak")
+
+@expose("current-memory-use", [default(values.W_Object, values.w_false)])
+@jit.dont_look_inside
+def current_memory_use(w_mode):
+    if w_mode is w_cumulative_sym:
+        return values.W_Fixnum(perf_stats.cumulative_memory_use())
+    if w_mode is w_peak_sym:
+        return values.W_Fixnum(perf_stats.peak_memory_use())
+    return values.W_Fixnum(perf_stats.memory_use())
+
+@expose("vector-set-performance-stats!",
+        [values_vector.W_Vector, default(values.W_Object, values.w_false)])
+@jit.dont_look_inside
+def vector_set_performance_stats(w_vector, w_thread):
+    """ Fills the slots Racket defines for the global statistics, followed by
+    pycket's JIT statistics: compiled loops, compiled bridges, trace aborts and
+    milliseconds spent tracing. Slots beyond the length of the vector are
+    skipped. """
+    if w_vector.immutable():
+        raise SchemeException("vector-set-performance-stats!: given immutable vector")
+    stats = [int(time.clock() * 1000),            # process milliseconds
+             int(time.time() * 1000),             # real milliseconds
+             perf_stats.gc_milliseconds(),
+             perf_stats.gc_count(),
+             0,                                   # thread context switches
+             0,                                   # stack overflows
+             0,                                   # threads scheduled
+             0,                                   # syntax objects read
+             0,                                   # hash table searches
+             0,                                   # extra hash slot searches
+             0,                                   # machine code bytes
+             perf_stats.peak_memory_use(),
+             perf_stats.compiled_loops(),
+             perf_stats.compiled_bridges(),
+             perf_stats.trace_aborts(),
+             perf_stats.tracing_milliseconds()]
+    n = min(len(stats), w_vector.length())
+    for i in range(n):
+        w_vector.set(i, values.W_Fixnum(stats[i]))
+    return values.w_void
+
 @continuation
 def vec2val_cont(vals, vec, n, s, l, env, cont, new_vals):
     from pycket.interpreter import return_multi_vals, check_one_val
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 from pycket              import impersonators as imp
 from pycket              import values
+from pycket.base         import UnhashableType
 from pycket.hash.base    import W_HashTable, W_ImmutableHashTable, w_missing
 from pycket.hash.simple  import (
     W_EqvMutableHashTable, W_EqMutableHashTable,
@@ -9,8 +10,11 @@ from pycket.hash.simple  import (
     make_simple_mutable_table, make_simple_mutable_table_assocs,
     make_simple_immutable_table, make_simple_immutable_table_assocs)
 from pycket.hash.equal   import W_EqualHashTable
+from pycket.hash.weak    import (
+    W_WeakHashTable, W_WeakEqHashTable, W_WeakEqvHashTable, W_WeakEqualHashTable,
+    W_EphemeronEqHashTable, W_EphemeronEqvHashTable, W_EphemeronEqualHashTable)
 from pycket.cont         import continuation, loop_label
-from pycket.error        import SchemeException
+from pycket.error        import ContractException, SchemeException
 from pycket.prims.expose import default, expose, procedure, define_nyi
 from rpython.rlib        import jit, objectmodel
 
@@ -19,8 +23,20 @@ _VALUE = 1
 _KEY_AND_VALUE = 2
 _PAIR = 3
 
+# the bindings of the Racket library implemented here, which the loader
+# resolves to these primitives, see expand.py
+NATIVE_HASH_NAMES = dict.fromkeys([
+    "hash-ref!", "hash-update!", "hash-update", "hash-set*"])
+
 PREFIXES = ["unsafe-mutable", "unsafe-immutable"]
 
+def hash_error(msg, env, cont):
+    """ Raise an exn:fail with msg to the handlers of cont. The errors of the
+    primitives that are not simple, and of continuations, are not converted
+    from SchemeExceptions. """
+    from pycket.prims.control import convert_runtime_exception
+    return convert_runtime_exception(SchemeException(msg), env, cont)
+
 def prefix_hash_names(base):
     result = [base]
     for pre in PREFIXES:
@@ -31,7 +47,10 @@ def prefix_hash_names(base):
 def hash_iterate_first(ht):
     if ht.length() == 0:
         return values.w_false
-    return values.W_Fixnum.ZERO
+    try:
+        return values.wrap(ht.hash_iterate_first())
+    except IndexError:
+        return values.w_false
 
 @expose(prefix_hash_names("hash-iterate-next"), [W_HashTable, values.W_Fixnum])
 def hash_iterate_next(ht, pos):
@@ -39,7 +58,7 @@ def hash_iterate_next(ht, pos):
 
 @objectmodel.specialize.arg(4)
 def hash_iter_ref(ht, n, env, cont, returns):
-    from pycket.interpreter import return_value, return_multi_vals
+    from pycket.interpreter import return_value, return_two_vals
     try:
         w_key, w_val = ht.get_item(n)
         if returns == _KEY:
@@ -47,8 +66,7 @@ def hash_iter_ref(ht, n, env, cont, returns):
         if returns == _VALUE:
             return return_value(w_val, env, cont)
         if returns == _KEY_AND_VALUE:
-            vals = values.Values._make2(w_key, w_val)
-            return return_multi_vals(vals, env, cont)
+            return return_two_vals(w_key, w_val, env, cont)
         if returns == _PAIR:
             vals = values.W_Cons.make(w_key, w_val)
             return return_value(vals, env, cont)
@@ -78,9 +96,27 @@ def hash_iterate_key_value(ht, pos, env, cont):
 def hash_iterate_pair(ht, pos, env, cont):
     return hash_iter_ref(ht, pos.value, env, cont, returns=_PAIR)
 
+# The entries of plain tables are taken from their storage in one go, only
+# the entries of impersonated tables are fetched one by one.
+
 @expose("hash-for-each", [W_HashTable, procedure], simple=False)
 def hash_for_each(ht, f, env, cont):
-    return hash_for_each_loop(ht, f, 0, env, cont)
+    if isinstance(ht, imp.W_InterposeHashTable):
+        return hash_for_each_loop(ht, f, 0, env, cont)
+    return hash_for_each_items_loop(ht.hash_items(), f, 0, env, cont)
+
+@loop_label
+def hash_for_each_items_loop(items, f, index, env, cont):
+    from pycket.interpreter import return_value
+    if index >= len(items):
+        return return_value(values.w_void, env, cont)
+    w_key, w_value = items[index]
+    return f.call([w_key, w_value], env,
+            hash_for_each_items_cont(items, f, index, env, cont))
+
+@continuation
+def hash_for_each_items_cont(items, f, index, env, cont, _vals):
+    return hash_for_each_items_loop(items, f, index + 1, env, cont)
 
 @loop_label
 def hash_for_each_loop(ht, f, index, env, cont):
@@ -102,6 +138,8 @@ def hash_for_each_cont(ht, f, index, env, cont, _vals):
 def hash_map(h, f, env, cont):
     from pycket.interpreter import return_value
     acc = values.w_null
+    if not isinstance(h, imp.W_InterposeHashTable):
+        return hash_map_items_loop(f, h.hash_items(), 0, acc, env, cont)
     return hash_map_loop(f, h, 0, acc, env, cont)
     # f.enable_jitting()
     # return return_value(w_missing, env,
@@ -126,6 +164,22 @@ def hash_map_cont(f, ht, index, w_acc, env, cont, _vals):
     w_acc = values.W_Cons.make(w_val, w_acc)
     return hash_map_loop(f, ht, index + 1, w_acc, env, cont)
 
+@loop_label
+def hash_map_items_loop(f, items, index, w_acc, env, cont):
+    from pycket.interpreter import return_value
+    if index >= len(items):
+        return return_value(w_acc, env, cont)
+    w_key, w_value = items[index]
+    after = hash_map_items_cont(f, items, index, w_acc, env, cont)
+    return f.call([w_key, w_value], env, after)
+
+@continuation
+def hash_map_items_cont(f, items, index, w_acc, env, cont, _vals):
+    from pycket.interpreter import check_one_val
+    w_val = check_one_val(_vals)
+    w_acc = values.W_Cons.make(w_val, w_acc)
+    return hash_map_items_loop(f, items, index + 1, w_acc, env, cont)
+
 @jit.elidable
 def from_assocs(assocs, fname):
     if not assocs.is_proper_list():
@@ -140,21 +194,83 @@ def from_assocs(assocs, fname):
         vals.append(val.cdr())
     return keys[:], vals[:]
 
-@expose("make-weak-hasheq", [])
-def make_weak_hasheq():
-    # FIXME: not actually weak
-    return make_simple_mutable_table(W_EqvMutableHashTable, None, None)
-
-@expose(["make-weak-hash", "make-late-weak-hasheq"], [default(values.W_List, None)])
-def make_weak_hash(assocs):
-    if assocs is None:
-        return W_EqualHashTable([], [], immutable=False)
-    return W_EqualHashTable(*from_assocs(assocs, "make-weak-hash"), immutable=False)
+@continuation
+def fill_table_cont(table, assocs, fname, env, cont, _vals):
+    return fill_table_loop(table, assocs, fname, env, cont)
 
-@expose("make-immutable-hash", [default(values.W_List, values.w_null)])
-def make_immutable_hash(assocs):
-    keys, vals = from_assocs(assocs, "make-immutable-hash")
-    return W_EqualHashTable(keys, vals, immutable=True)
+@loop_label
+def fill_table_loop(table, assocs, fname, env, cont):
+    from pycket.interpreter import return_value
+    if not isinstance(assocs, values.W_Cons):
+        return return_value(table, env, cont)
+    val, assocs = assocs.car(), assocs.cdr()
+    if not isinstance(val, values.W_Cons):
+        return hash_error("%s: expected list of pairs" % fname, env, cont)
+    after = fill_table_cont(table, assocs, fname, env, cont)
+    return table.hash_set(val.car(), val.cdr(), env, after)
+
+def make_weak_table(table, assocs, fname, env, cont):
+    if not assocs.is_proper_list():
+        return hash_error("%s: expected proper list" % fname, env, cont)
+    return fill_table_loop(table, assocs, fname, env, cont)
+
+@expose("make-weak-hasheq", [default(values.W_List, values.w_null)], simple=False)
+def make_weak_hasheq(assocs, env, cont):
+    return make_weak_table(W_WeakEqHashTable(), assocs, "make-weak-hasheq", env, cont)
+
+@expose("make-weak-hasheqv", [default(values.W_List, values.w_null)], simple=False)
+def make_weak_hasheqv(assocs, env, cont):
+    return make_weak_table(W_WeakEqvHashTable(), assocs, "make-weak-hasheqv", env, cont)
+
+@expose("make-weak-hash", [default(values.W_List, values.w_null)], simple=False)
+def make_weak_hash(assocs, env, cont):
+    return make_weak_table(W_WeakEqualHashTable(), assocs, "make-weak-hash", env, cont)
+
+# Late-weak tables differ from weak ones only in when finalization happens
+# relative to clearing the keys, which makes no difference here.
+@expose("make-late-weak-hasheq", [default(values.W_List, values.w_null)], simple=False)
+def make_late_weak_hasheq(assocs, env, cont):
+    return make_weak_table(W_WeakEqHashTable(), assocs, "make-late-weak-hasheq", env, cont)
+
+@expose("make-late-weak-hash", [default(values.W_List, values.w_null)], simple=False)
+def make_late_weak_hash(assocs, env, cont):
+    return make_weak_table(W_WeakEqualHashTable(), assocs, "make-late-weak-hash", env, cont)
+
+@expose("make-ephemeron-hasheq", [default(values.W_List, values.w_null)], simple=False)
+def make_ephemeron_hasheq(assocs, env, cont):
+    return make_weak_table(W_EphemeronEqHashTable(), assocs, "make-ephemeron-hasheq", env, cont)
+
+@expose("make-ephemeron-hasheqv", [default(values.W_List, values.w_null)], simple=False)
+def make_ephemeron_hasheqv(assocs, env, cont):
+    return make_weak_table(W_EphemeronEqvHashTable(), assocs, "make-ephemeron-hasheqv", env, cont)
+
+@expose("make-ephemeron-hash", [default(values.W_List, values.w_null)], simple=False)
+def make_ephemeron_hash(assocs, env, cont):
+    return make_weak_table(W_EphemeronEqualHashTable(), assocs, "make-ephemeron-hash", env, cont)
+
+@expose("hash-weak?", [values.W_Object])
+def hash_weak_p(obj):
+    return values.W_Bool.make(isinstance(obj, W_WeakHashTable) and not obj.is_ephemeron)
+
+@expose("hash-ephemeron?", [values.W_Object])
+def hash_ephemeron_p(obj):
+    return values.W_Bool.make(isinstance(obj, W_WeakHashTable) and obj.is_ephemeron)
+
+# Immutable equal tables are built in one go when no two keys can be equal?
+# without being eqv?. Otherwise they are filled through hash_set, which compares
+# the keys with equal? and so finds the duplicates among lists and structs.
+@expose("make-immutable-hash", [default(values.W_List, values.w_null)], simple=False)
+def make_immutable_hash(assocs, env, cont):
+    from pycket.interpreter import return_value
+    from pycket.prims.control import convert_runtime_exception
+    try:
+        keys, vals = from_assocs(assocs, "make-immutable-hash")
+    except SchemeException, exn:
+        return convert_runtime_exception(exn, env, cont)
+    table = W_EqualHashTable([], [], immutable=True)
+    if table.set_many(keys, vals):
+        return return_value(table, env, cont)
+    return fill_table_loop(table, assocs, "make-immutable-hash", env, cont)
 
 @expose("make-immutable-hasheq", [default(values.W_List, values.w_null)])
 def make_immutable_hasheq(assocs):
@@ -164,13 +280,30 @@ def make_immutable_hasheq(assocs):
 def make_immutable_hasheqv(assocs):
     return make_simple_immutable_table_assocs(W_EqvImmutableHashTable, assocs, "make-immutable-hasheq")
 
-@expose("hash")
-def hash(args):
+@continuation
+def fill_table_args_cont(table, args, idx, env, cont, _vals):
+    return fill_table_args_loop(table, args, idx, env, cont)
+
+@loop_label
+def fill_table_args_loop(table, args, idx, env, cont):
+    from pycket.interpreter import return_value
+    if idx >= len(args):
+        return return_value(table, env, cont)
+    after = fill_table_args_cont(table, args, idx + 2, env, cont)
+    return table.hash_set(args[idx], args[idx + 1], env, after)
+
+@expose("hash", simple=False)
+def hash(args, env, cont):
+    from pycket.interpreter import return_value
     if len(args) % 2 != 0:
-        raise SchemeException("hash: key does not have a corresponding value")
+        return hash_error("hash: key does not have a corresponding value",
+                          env, cont)
     keys = [args[i] for i in range(0, len(args), 2)]
     vals = [args[i] for i in range(1, len(args), 2)]
-    return W_EqualHashTable(keys, vals, immutable=True)
+    table = W_EqualHashTable([], [], immutable=True)
+    if table.set_many(keys, vals):
+        return return_value(table, env, cont)
+    return fill_table_args_loop(table, args, 0, env, cont)
 
 @expose("hasheq")
 def hasheq(args):
@@ -217,12 +350,14 @@ def return_table_cont(table, env, cont, _vals):
     from pycket.interpreter import return_value
     return return_value(table, env, cont)
 
-@expose("hash-set", [W_HashTable, values.W_Object, values.W_Object], simple=False)
 def hash_set(table, key, val, env, cont):
     from pycket.interpreter import return_value
     if not table.immutable():
         raise SchemeException("hash-set: not given an immutable table")
 
+    if isinstance(table, W_EqualHashTable):
+        return table.hash_assoc(key, val, env, cont)
+
     # Fast path
     if isinstance(table, W_ImmutableHashTable):
         new_table = table.assoc(key, val)
@@ -231,6 +366,46 @@ def hash_set(table, key, val, env, cont):
     return hash_copy(table, env,
             hash_set_cont(key, val, env, cont))
 
+expose("hash-set", [W_HashTable, values.W_Object, values.W_Object], simple=False)(hash_set)
+
+@continuation
+def hash_set_star_cont(args, idx, env, cont, _vals):
+    from pycket.interpreter import check_one_val
+    table = check_one_val(_vals)
+    assert isinstance(table, W_HashTable)
+    return hash_set_star_loop(table, args, idx, env, cont)
+
+@loop_label
+def hash_set_star_loop(table, args, idx, env, cont):
+    from pycket.interpreter import return_value
+    if idx >= len(args):
+        return return_value(table, env, cont)
+    after = hash_set_star_cont(args, idx + 2, env, cont)
+    return hash_set(table, args[idx], args[idx + 1], env, after)
+
+@expose("hash-set*", simple=False)
+def hash_set_star(args, env, cont):
+    from pycket.interpreter import return_value
+    if not args:
+        return hash_error("hash-set*: expected at least 1 argument", env, cont)
+    table = args[0]
+    if not isinstance(table, W_HashTable) or not table.immutable():
+        return hash_error("hash-set*: expected an immutable hash table",
+                          env, cont)
+    if len(args) % 2 != 1:
+        return hash_error("hash-set*: key does not have a corresponding value",
+                          env, cont)
+    keys = [args[i] for i in range(1, len(args), 2)]
+    vals = [args[i] for i in range(2, len(args), 2)]
+    if isinstance(table, W_EqualHashTable):
+        copy = table.make_copy()
+        if copy.set_many(keys, vals):
+            return return_value(copy, env, cont)
+        return fill_table_args_loop(copy, args, 1, env, cont)
+    if isinstance(table, W_ImmutableHashTable):
+        return return_value(table.assoc_many(keys, vals), env, cont)
+    return hash_set_star_loop(table, args, 1, env, cont)
+
 @continuation
 def hash_ref_cont(default, k, env, cont, _vals):
     from pycket.interpreter import return_value, check_one_val
@@ -238,7 +413,9 @@ def hash_ref_cont(default, k, env, cont, _vals):
     if val is not w_missing:
         return return_value(val, env, cont)
     if default is None:
-        raise SchemeException("key %s not found"%k.tostring())
+        from pycket.prims.control import convert_runtime_exception
+        exn = ContractException("key ", k, " not found")
+        return convert_runtime_exception(exn, env, cont)
     if default.iscallable():
         return default.call([], env, cont)
     return return_value(default, env, cont)
@@ -247,6 +424,102 @@ def hash_ref_cont(default, k, env, cont, _vals):
 def hash_ref(ht, k, default, env, cont):
     return ht.hash_ref(k, env, hash_ref_cont(default, k, env, cont))
 
+# hash-ref!, hash-update! and hash-update look the key up once. For equal
+# tables the lookup finds the slot of the key, which the store reuses unless
+# the table changed while the default or the updater ran. The other tables
+# are simple enough that a second lookup for the store is cheap.
+
+_REF_BANG    = 0
+_UPDATE_BANG = 1
+_UPDATE      = 2
+
+_UPDATE_NAMES = ["hash-ref!", "hash-update!", "hash-update"]
+
+@continuation
+def hash_slot_found_cont(table, key, action, updater, default, env, cont, _vals):
+    assert _vals.num_values() == 2
+    val = _vals.get_value(0)
+    w_pos = _vals.get_value(1)
+    assert isinstance(w_pos, values.W_Fixnum)
+    assert isinstance(table, W_EqualHashTable)
+    pos = w_pos.value
+    return hash_slot_value(table, pos, table.strategy, table.slot_token(), key,
+                           val, action, updater, default, env, cont)
+
+@continuation
+def hash_slot_ref_cont(table, key, action, updater, default, env, cont, _vals):
+    from pycket.interpreter import check_one_val
+    val = check_one_val(_vals)
+    return hash_slot_value(table, -1, None, 0, key, val, action, updater,
+                           default, env, cont)
+
+def hash_slot_value(table, pos, strategy, token, key, val, action, updater,
+                    default, env, cont):
+    from pycket.interpreter import return_value
+    store = hash_slot_store_cont(table, pos, strategy, token, key, action, env, cont)
+    if val is not w_missing:
+        if action == _REF_BANG:
+            return return_value(val, env, cont)
+        return updater.call([val], env, store)
+    if default is None:
+        from pycket.prims.control import convert_runtime_exception
+        exn = ContractException(
+            "%s: no value found for key: " % _UPDATE_NAMES[action], key)
+        return convert_runtime_exception(exn, env, cont)
+    if action != _REF_BANG:
+        store = hash_slot_update_cont(updater, env, store)
+    if default.iscallable():
+        return default.call([], env, store)
+    return return_value(default, env, store)
+
+@continuation
+def hash_slot_update_cont(updater, env, cont, _vals):
+    from pycket.interpreter import check_one_val
+    return updater.call([check_one_val(_vals)], env, cont)
+
+@continuation
+def hash_slot_store_cont(table, pos, strategy, token, key, action, env, cont, _vals):
+    from pycket.interpreter import check_one_val
+    val = check_one_val(_vals)
+    if action == _UPDATE:
+        return hash_set(table, key, val, env, cont)
+    if action == _REF_BANG:
+        cont = return_table_cont(val, env, cont)
+    if strategy is not None:
+        assert isinstance(table, W_EqualHashTable)
+        return table.slot_set(pos, strategy, token, key, val, env, cont)
+    return table.hash_set(key, val, env, cont)
+
+def hash_slot_find(table, key, action, updater, default, env, cont):
+    if isinstance(table, W_EqualHashTable) and action != _UPDATE:
+        return table.find_slot(key, env,
+                hash_slot_found_cont(table, key, action, updater, default, env, cont))
+    return table.hash_ref(key, env,
+            hash_slot_ref_cont(table, key, action, updater, default, env, cont))
+
+@expose("hash-ref!", [W_HashTable, values.W_Object, values.W_Object], simple=False)
+def hash_ref_bang(ht, k, default, env, cont):
+    if ht.immutable():
+        return hash_error("hash-ref!: given immutable table", env, cont)
+    return hash_slot_find(ht, k, _REF_BANG, None, default, env, cont)
+
+@expose("hash-update!",
+        [W_HashTable, values.W_Object, procedure, default(values.W_Object, None)],
+        simple=False)
+def hash_update_bang(ht, k, updater, default, env, cont):
+    if ht.immutable():
+        return hash_error("hash-update!: given immutable table", env, cont)
+    return hash_slot_find(ht, k, _UPDATE_BANG, updater, default, env, cont)
+
+@expose("hash-update",
+        [W_HashTable, values.W_Object, procedure, default(values.W_Object, None)],
+        simple=False)
+def hash_update(ht, k, updater, default, env, cont):
+    if not ht.immutable():
+        return hash_error("hash-update: not given an immutable table",
+                                 env, cont)
+    return hash_slot_find(ht, k, _UPDATE, updater, default, env, cont)
+
 @expose("hash-remove!", [W_HashTable, values.W_Object], simple=False)
 def hash_remove_bang(ht, k, env, cont):
     return ht.hash_remove_inplace(k, env, cont)
@@ -286,19 +559,24 @@ def hash_copy_loop(keys, idx, src, new, env, cont):
 
 def hash_copy(src, env, cont):
     from pycket.interpreter import return_value
-    new = src.make_empty()
-    if isinstance(src, W_ImmutableHashTable):
+    new = src.make_mutable_copy()
+    if new is not None:
         return return_value(new, env, cont)
+    # impersonated tables, the entries have to go through their handlers
+    new = src.make_empty()
     if src.length() == 0:
         return return_value(new, env, cont)
     return hash_copy_loop(src.hash_items(), 0, src, new, env, cont)
 
 expose("hash-copy", [W_HashTable], simple=False)(hash_copy)
 
-# FIXME: not implemented
 @expose("equal-hash-code", [values.W_Object])
 def equal_hash_code(v):
-    return values.W_Fixnum.ZERO
+    try:
+        return values.W_Fixnum(v.hash_equal())
+    except UnhashableType:
+        # FIXME: structs with prop:equal+hash should use their hash procedure
+        return values.W_Fixnum.ZERO
 
 @expose("equal-secondary-hash-code", [values.W_Object])
 def equal_secondary_hash_code(v):
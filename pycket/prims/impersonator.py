@@ -346,10 +346,10 @@ def chaperone(x):
 
 @expose("make-impersonator-property", [values.W_Symbol], simple=False)
 def make_imp_prop(sym, env, cont):
-    from pycket.interpreter import return_multi_vals
+    from pycket.interpreter import return_three_vals
     name = sym.utf8value
     prop = imp.W_ImpPropertyDescriptor(name)
     pred = imp.W_ImpPropertyPredicate(prop)
     accs = imp.W_ImpPropertyAccessor(prop)
-    return return_multi_vals(values.Values.make([prop, pred, accs]), env, cont)
+    return return_three_vals(prop, pred, accs, env, cont)
 
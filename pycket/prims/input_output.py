@@ -560,11 +560,10 @@ def _split_path(path):
 
 @expose("split-path", [values.W_Object], simple=False)
 def split_path(w_path, env, cont):
-    from pycket.interpreter import return_multi_vals
+    from pycket.interpreter import return_three_vals
     path = extract_path(w_path)
     base, name, must_be_dir = _split_path(path)
-    result = values.Values.make([base, name, must_be_dir])
-    return return_multi_vals(result, env, cont)
+    return return_three_vals(base, name, must_be_dir, env, cont)
 
 @expose("build-path")
 def build_path(args):
@@ -132,10 +132,21 @@ def exactp(n):
 def inexactp(n):
     return values.W_Bool.make(is_inexact(n))
 
-@expose("quotient/remainder", [values.W_Integer, values.W_Integer])
-def quotient_remainder(a, b):
+def quotient_remainder_values(a, b):
     return values.Values._make2(a.arith_quotient(b), a.arith_mod(b)) #FIXME
 
+@expose("quotient/remainder", [values.W_Integer, values.W_Integer],
+        simple=False, simple_n=quotient_remainder_values)
+def quotient_remainder(a, b, env, cont):
+    from pycket.interpreter   import return_two_vals
+    from pycket.prims.control import convert_runtime_exception
+    try:
+        w_quotient = a.arith_quotient(b)
+        w_remainder = a.arith_mod(b) #FIXME
+    except SchemeException, exn:
+        return convert_runtime_exception(exn, env, cont)
+    return return_two_vals(w_quotient, w_remainder, env, cont)
+
 def make_binary_arith(name, methname):
     @expose(name, [values.W_Number, values.W_Number], simple=True)
     def do(a, b):
@@ -161,7 +161,7 @@ RMPE_ARGS = [
 @expose("regexp-match-positions/end", RMPE_ARGS, simple=False)
 @jit.unroll_safe
 def rmpe(pat, input, inp_start, inp_end, output_port, prefix, count, env, cont):
-    from pycket.interpreter import return_multi_vals
+    from pycket.interpreter import return_multi_vals, return_two_vals
 
     start = inp_start.value
     if inp_end is values.w_false:
@@ -195,8 +195,7 @@ def rmpe(pat, input, inp_start, inp_end, output_port, prefix, count, env, cont):
         raise SchemeException("regexp-match-positions/end: unsupported input type")
 
     bytes = values.W_Bytes.from_charlist(bytestring, immutable=False)
-    result = values.Values._make2(acc, bytes)
-    return return_multi_vals(result, env, cont)
+    return return_two_vals(acc, bytes, env, cont)
 
 @expose("regexp-match?", [values.W_Object, values.W_Object])
 def regexp_matchp(w_r, w_o):
@@ -0,0 +1,501 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The hash set operations of racket/set on native sets, see pycket/hash/set.py.
+# The bulk operations add or remove all the elements at once where the table
+# allows it, and only go element by element through the continuation for
+# tables that compare keys with equal? and may have to run Racket code.
+
+from pycket              import values
+from pycket.cont         import continuation, loop_label
+from pycket.error        import SchemeException
+from pycket.hash.base    import W_HashTable, W_ImmutableHashTable, w_missing
+from pycket.hash.equal   import W_EqualHashTable
+from pycket.hash.set     import (
+    W_HashSet, KIND_EQUAL, KIND_EQV, KIND_EQ, set_subset_loop)
+from pycket.prims.expose import expose, procedure
+from pycket.prims.hash   import hash_error
+
+# the bindings of racket/set implemented here, which the loader resolves to
+# these primitives with the native_sets option, see expand.py
+NATIVE_SET_NAMES = dict.fromkeys([
+    "set", "seteqv", "seteq", "mutable-set", "mutable-seteqv", "mutable-seteq",
+    "list->set", "list->seteqv", "list->seteq", "list->mutable-set",
+    "list->mutable-seteqv", "list->mutable-seteq",
+    "set?", "set-mutable?", "set-weak?", "set-equal?", "set-eqv?", "set-eq?",
+    "set-empty?", "set-count", "set-member?", "set-first", "set-rest",
+    "set->list", "in-set", "set->stream", "set-copy", "set-copy-clear", "set-clear",
+    "set-clear!", "set-add", "set-add!", "set-remove", "set-remove!",
+    "set-union", "set-union!", "set-subtract", "set-subtract!",
+    "set-intersect", "set-intersect!", "subset?", "proper-subset?", "set=?",
+    "set-for-each", "set-map"])
+
+# the operations among them that take a set as their first argument. Their
+# bindings stay those of racket/set and dispatch on the first argument, see
+# W_NativeSetProcedure, so that they still work on the other generic sets
+NATIVE_SET_OPERATIONS = dict.fromkeys([
+    "set-empty?", "set-count", "set-member?", "set-first", "set-rest",
+    "set->list", "in-set", "set->stream", "set-copy", "set-copy-clear", "set-clear",
+    "set-clear!", "set-add", "set-add!", "set-remove", "set-remove!",
+    "set-union", "set-union!", "set-subtract", "set-subtract!",
+    "set-intersect", "set-intersect!", "subset?", "proper-subset?", "set=?",
+    "set-for-each", "set-map"])
+
+class W_NativeSetProcedure(values.W_Procedure):
+    """ A set operation of racket/set: the primitive for native sets, the
+    binding of racket/set for everything else. """
+    _attrs_ = _immutable_fields_ = ["w_prim", "w_fallback"]
+
+    def __init__(self, w_prim, w_fallback):
+        self.w_prim = w_prim
+        self.w_fallback = w_fallback
+
+    def get_arity(self, promote=False):
+        return self.w_fallback.get_arity(promote)
+
+    def call_with_extra_info(self, args, env, cont, calling_app):
+        if args and isinstance(args[0], W_HashSet):
+            return self.w_prim.call_with_extra_info(args, env, cont, calling_app)
+        return self.w_fallback.call_with_extra_info(args, env, cont, calling_app)
+
+    def tostring(self):
+        return self.w_fallback.tostring()
+
+def set_error(msg, env, cont):
+    """ Raise an exn:fail with msg to the handlers of cont, see hash_error. """
+    return hash_error(msg, env, cont)
+
+INCOMPATIBLE = "%s: set arguments have incompatible equivalence predicates"
+
+def check_others(name, w_set, args):
+    """ The sets after the first one of a bulk operation, which must be of the
+    same kind. """
+    others = []
+    for i in range(1, len(args)):
+        w_other = args[i]
+        if not isinstance(w_other, W_HashSet):
+            raise SchemeException("%s: expected a set" % name)
+        if not w_set.same_kind(w_other):
+            raise SchemeException(INCOMPATIBLE % name)
+        others.append(w_other)
+    return others
+
+def first_set(name, args, mutable):
+    if not args or not isinstance(args[0], W_HashSet):
+        raise SchemeException("%s: expected a set" % name)
+    w_set = args[0]
+    assert isinstance(w_set, W_HashSet)
+    if w_set.mutable != mutable:
+        if mutable:
+            raise SchemeException("%s: expected a mutable set" % name)
+        raise SchemeException("%s: expected an immutable set" % name)
+    return w_set
+
+def all_elements(others):
+    elems = []
+    for w_other in others:
+        elems.extend(w_other.elements())
+    return elems
+
+# adding and removing many elements
+
+def set_add_all(w_set, elems, env, cont):
+    """ Pass to cont the set with elems added, w_set itself if it is
+    mutable. """
+    from pycket.interpreter import return_value
+    table = w_set.table
+    if not elems:
+        return return_value(w_set, env, cont)
+    if w_set.mutable:
+        return set_add_loop(table, elems, 0, w_set, env, cont)
+    trues = [values.w_true] * len(elems)
+    if isinstance(table, W_EqualHashTable):
+        copy = table.make_copy()
+        w_result = w_set.with_table(copy)
+        if copy.set_many(elems, trues):
+            return return_value(w_result, env, cont)
+        return set_add_loop(copy, elems, 0, w_result, env, cont)
+    assert isinstance(table, W_ImmutableHashTable)
+    return return_value(w_set.with_table(table.assoc_many(elems, trues)), env, cont)
+
+@loop_label
+def set_add_loop(table, elems, idx, w_result, env, cont):
+    from pycket.interpreter import return_value
+    if idx >= len(elems):
+        return return_value(w_result, env, cont)
+    return table.hash_set(elems[idx], values.w_true, env,
+            set_add_cont(table, elems, idx, w_result, env, cont))
+
+@continuation
+def set_add_cont(table, elems, idx, w_result, env, cont, _vals):
+    return set_add_loop(table, elems, idx + 1, w_result, env, cont)
+
+def set_remove_all(w_set, elems, env, cont):
+    """ Pass to cont the set without elems, w_set itself if it is mutable. """
+    from pycket.interpreter import return_value
+    table = w_set.table
+    if not elems:
+        return return_value(w_set, env, cont)
+    if w_set.mutable:
+        return set_remove_bang_loop(table, elems, 0, w_set, env, cont)
+    if isinstance(table, W_ImmutableHashTable):
+        for w_elem in elems:
+            table = table.without(w_elem)
+        return return_value(w_set.with_table(table), env, cont)
+    return set_remove_loop(w_set, table, elems, 0, env, cont)
+
+@loop_label
+def set_remove_bang_loop(table, elems, idx, w_result, env, cont):
+    from pycket.interpreter import return_value
+    if idx >= len(elems):
+        return return_value(w_result, env, cont)
+    return table.hash_remove_inplace(elems[idx], env,
+            set_remove_bang_cont(table, elems, idx, w_result, env, cont))
+
+@continuation
+def set_remove_bang_cont(table, elems, idx, w_result, env, cont, _vals):
+    return set_remove_bang_loop(table, elems, idx + 1, w_result, env, cont)
+
+@loop_label
+def set_remove_loop(w_set, table, elems, idx, env, cont):
+    from pycket.interpreter import return_value
+    if idx >= len(elems):
+        return return_value(w_set.with_table(table), env, cont)
+    return table.hash_remove(elems[idx], env,
+            set_remove_cont(w_set, elems, idx, env, cont))
+
+@continuation
+def set_remove_cont(w_set, elems, idx, env, cont, _vals):
+    from pycket.interpreter import check_one_val
+    table = check_one_val(_vals)
+    assert isinstance(table, W_HashTable)
+    return set_remove_loop(w_set, table, elems, idx + 1, env, cont)
+
+# constructors
+
+def make_set(kind, mutable, elems, env, cont):
+    return set_add_all(W_HashSet.make_empty(kind, mutable), elems, env, cont)
+
+def make_list_set(name, kind, mutable, w_list, env, cont):
+    if not w_list.is_proper_list():
+        return set_error("%s: expected a list" % name, env, cont)
+    elems = []
+    while isinstance(w_list, values.W_Cons):
+        elems.append(w_list.car())
+        w_list = w_list.cdr()
+    return make_set(kind, mutable, elems, env, cont)
+
+@expose("set", simple=False)
+def make_equal_set(args, env, cont):
+    return make_set(KIND_EQUAL, False, args, env, cont)
+
+@expose("seteqv", simple=False)
+def make_eqv_set(args, env, cont):
+    return make_set(KIND_EQV, False, args, env, cont)
+
+@expose("seteq", simple=False)
+def make_eq_set(args, env, cont):
+    return make_set(KIND_EQ, False, args, env, cont)
+
+@expose("mutable-set", simple=False)
+def make_mutable_equal_set(args, env, cont):
+    return make_set(KIND_EQUAL, True, args, env, cont)
+
+@expose("mutable-seteqv", simple=False)
+def make_mutable_eqv_set(args, env, cont):
+    return make_set(KIND_EQV, True, args, env, cont)
+
+@expose("mutable-seteq", simple=False)
+def make_mutable_eq_set(args, env, cont):
+    return make_set(KIND_EQ, True, args, env, cont)
+
+@expose("list->set", [values.W_Object], simple=False)
+def list_to_set(w_list, env, cont):
+    return make_list_set("list->set", KIND_EQUAL, False, w_list, env, cont)
+
+@expose("list->seteqv", [values.W_Object], simple=False)
+def list_to_seteqv(w_list, env, cont):
+    return make_list_set("list->seteqv", KIND_EQV, False, w_list, env, cont)
+
+@expose("list->seteq", [values.W_Object], simple=False)
+def list_to_seteq(w_list, env, cont):
+    return make_list_set("list->seteq", KIND_EQ, False, w_list, env, cont)
+
+@expose("list->mutable-set", [values.W_Object], simple=False)
+def list_to_mutable_set(w_list, env, cont):
+    return make_list_set("list->mutable-set", KIND_EQUAL, True, w_list, env, cont)
+
+@expose("list->mutable-seteqv", [values.W_Object], simple=False)
+def list_to_mutable_seteqv(w_list, env, cont):
+    return make_list_set("list->mutable-seteqv", KIND_EQV, True, w_list, env, cont)
+
+@expose("list->mutable-seteq", [values.W_Object], simple=False)
+def list_to_mutable_seteq(w_list, env, cont):
+    return make_list_set("list->mutable-seteq", KIND_EQ, True, w_list, env, cont)
+
+# predicates and accessors
+
+@expose("set?", [values.W_Object])
+def set_p(v):
+    return values.W_Bool.make(isinstance(v, W_HashSet))
+
+@expose("set-mutable?", [values.W_Object])
+def set_mutable_p(v):
+    return values.W_Bool.make(isinstance(v, W_HashSet) and v.mutable)
+
+@expose("set-weak?", [values.W_Object])
+def set_weak_p(v):
+    return values.w_false
+
+@expose("set-equal?", [values.W_Object])
+def set_equal_p(v):
+    return values.W_Bool.make(isinstance(v, W_HashSet) and v.kind == KIND_EQUAL)
+
+@expose("set-eqv?", [values.W_Object])
+def set_eqv_p(v):
+    return values.W_Bool.make(isinstance(v, W_HashSet) and v.kind == KIND_EQV)
+
+@expose("set-eq?", [values.W_Object])
+def set_eq_p(v):
+    return values.W_Bool.make(isinstance(v, W_HashSet) and v.kind == KIND_EQ)
+
+@expose("set-empty?", [W_HashSet])
+def set_empty_p(w_set):
+    return values.W_Bool.make(w_set.length() == 0)
+
+@expose("set-count", [W_HashSet])
+def set_count(w_set):
+    return values.W_Fixnum(w_set.length())
+
+@continuation
+def set_member_cont(env, cont, _vals):
+    from pycket.interpreter import check_one_val, return_value
+    return return_value(values.W_Bool.make(check_one_val(_vals) is not w_missing),
+                        env, cont)
+
+@expose("set-member?", [W_HashSet, values.W_Object], simple=False)
+def set_member_p(w_set, w_elem, env, cont):
+    return w_set.table.hash_ref(w_elem, env, set_member_cont(env, cont))
+
+@expose("set-first", [W_HashSet])
+def set_first(w_set):
+    if w_set.length() == 0:
+        raise SchemeException("set-first: expected a non-empty set")
+    try:
+        w_elem, _ = w_set.table.get_item(w_set.table.hash_iterate_first())
+    except KeyError:
+        # the first position of some tables can be a removed entry
+        w_elem = w_set.elements()[0]
+    return w_elem
+
+@expose("set-rest", [W_HashSet], simple=False)
+def set_rest(w_set, env, cont):
+    if w_set.mutable:
+        return set_error("set-rest: expected an immutable set", env, cont)
+    if w_set.length() == 0:
+        return set_error("set-rest: expected a non-empty set", env, cont)
+    return set_remove_all(w_set, [set_first(w_set)], env, cont)
+
+# lists are streams, and sequences
+@expose(["set->list", "in-set", "set->stream"], [W_HashSet])
+def set_to_list(w_set):
+    return values.to_list(w_set.elements())
+
+# what prop:sequence gives for a set, see W_HashSet.builtin_prop
+w_in_set = set_to_list.w_prim
+
+@expose("set-copy", [W_HashSet])
+def set_copy(w_set):
+    if not w_set.mutable:
+        return w_set
+    table = w_set.table.make_mutable_copy()
+    assert table is not None
+    return W_HashSet(table, w_set.kind, True)
+
+@expose("set-copy-clear", [W_HashSet])
+def set_copy_clear(w_set):
+    return W_HashSet.make_empty(w_set.kind, w_set.mutable)
+
+@expose("set-clear", [W_HashSet])
+def set_clear(w_set):
+    if w_set.mutable:
+        raise SchemeException("set-clear: expected an immutable set")
+    return W_HashSet.make_empty(w_set.kind, False)
+
+@expose("set-clear!", [W_HashSet], simple=False)
+def set_clear_bang(w_set, env, cont):
+    if not w_set.mutable:
+        return set_error("set-clear!: expected a mutable set", env, cont)
+    return set_remove_bang_loop(w_set.table, w_set.elements(), 0, values.w_void,
+                                env, cont)
+
+# adding and removing elements
+
+@continuation
+def return_void_cont(env, cont, _vals):
+    from pycket.interpreter import return_value
+    return return_value(values.w_void, env, cont)
+
+@expose("set-add", [W_HashSet, values.W_Object], simple=False)
+def set_add(w_set, w_elem, env, cont):
+    if w_set.mutable:
+        return set_error("set-add: expected an immutable set", env, cont)
+    return set_add_all(w_set, [w_elem], env, cont)
+
+@expose("set-add!", [W_HashSet, values.W_Object], simple=False)
+def set_add_bang(w_set, w_elem, env, cont):
+    if not w_set.mutable:
+        return set_error("set-add!: expected a mutable set", env, cont)
+    return w_set.table.hash_set(w_elem, values.w_true, env, cont)
+
+@expose("set-remove", [W_HashSet, values.W_Object], simple=False)
+def set_remove(w_set, w_elem, env, cont):
+    if w_set.mutable:
+        return set_error("set-remove: expected an immutable set", env, cont)
+    return set_remove_all(w_set, [w_elem], env, cont)
+
+@expose("set-remove!", [W_HashSet, values.W_Object], simple=False)
+def set_remove_bang(w_set, w_elem, env, cont):
+    if not w_set.mutable:
+        return set_error("set-remove!: expected a mutable set", env, cont)
+    return w_set.table.hash_remove_inplace(w_elem, env, cont)
+
+# bulk operations
+
+@expose("set-union", simple=False)
+def set_union(args, env, cont):
+    try:
+        w_set = first_set("set-union", args, False)
+        others = check_others("set-union", w_set, args)
+    except SchemeException as e:
+        return set_error(e.msg, env, cont)
+    if len(others) == 1 and others[0].length() > w_set.length():
+        # add the smaller set to the larger one, the result is the same
+        w_set, others[0] = others[0], w_set
+    return set_add_all(w_set, all_elements(others), env, cont)
+
+@expose("set-union!", simple=False)
+def set_union_bang(args, env, cont):
+    try:
+        w_set = first_set("set-union!", args, True)
+        others = check_others("set-union!", w_set, args)
+    except SchemeException as e:
+        return set_error(e.msg, env, cont)
+    return set_add_all(w_set, all_elements(others), env, return_void_cont(env, cont))
+
+@expose("set-subtract", simple=False)
+def set_subtract(args, env, cont):
+    try:
+        w_set = first_set("set-subtract", args, False)
+        others = check_others("set-subtract", w_set, args)
+    except SchemeException as e:
+        return set_error(e.msg, env, cont)
+    return set_remove_all(w_set, all_elements(others), env, cont)
+
+@expose("set-subtract!", simple=False)
+def set_subtract_bang(args, env, cont):
+    try:
+        w_set = first_set("set-subtract!", args, True)
+        others = check_others("set-subtract!", w_set, args)
+    except SchemeException as e:
+        return set_error(e.msg, env, cont)
+    return set_remove_all(w_set, all_elements(others), env, return_void_cont(env, cont))
+
+@loop_label
+def set_dropped_loop(w_set, elems, idx, others, j, dropped, env, cont):
+    """ Collect in dropped the elements of elems missing from one of others,
+    then remove them from w_set. """
+    while idx < len(elems):
+        if j < len(others):
+            return others[j].table.hash_ref(elems[idx], env,
+                    set_dropped_cont(w_set, elems, idx, others, j, dropped, env, cont))
+        idx += 1
+        j = 0
+    return set_remove_all(w_set, dropped, env, cont)
+
+@continuation
+def set_dropped_cont(w_set, elems, idx, others, j, dropped, env, cont, _vals):
+    from pycket.interpreter import check_one_val
+    if check_one_val(_vals) is w_missing:
+        dropped.append(elems[idx])
+        return set_dropped_loop(w_set, elems, idx + 1, others, 0, dropped, env, cont)
+    return set_dropped_loop(w_set, elems, idx, others, j + 1, dropped, env, cont)
+
+@expose("set-intersect", simple=False)
+def set_intersect(args, env, cont):
+    try:
+        w_set = first_set("set-intersect", args, False)
+        others = check_others("set-intersect", w_set, args)
+    except SchemeException as e:
+        return set_error(e.msg, env, cont)
+    return set_dropped_loop(w_set, w_set.elements(), 0, others, 0, [], env, cont)
+
+@expose("set-intersect!", simple=False)
+def set_intersect_bang(args, env, cont):
+    try:
+        w_set = first_set("set-intersect!", args, True)
+        others = check_others("set-intersect!", w_set, args)
+    except SchemeException as e:
+        return set_error(e.msg, env, cont)
+    return set_dropped_loop(w_set, w_set.elements(), 0, others, 0, [], env,
+                            return_void_cont(env, cont))
+
+# comparisons
+
+@expose("subset?", [W_HashSet, W_HashSet], simple=False)
+def subset_p(w_a, w_b, env, cont):
+    from pycket.interpreter import return_value
+    if not w_a.same_kind(w_b):
+        return set_error(INCOMPATIBLE % "subset?", env, cont)
+    if w_a.length() > w_b.length():
+        return return_value(values.w_false, env, cont)
+    return set_subset_loop(w_a.elements(), 0, w_b, env, cont)
+
+@expose("proper-subset?", [W_HashSet, W_HashSet], simple=False)
+def proper_subset_p(w_a, w_b, env, cont):
+    from pycket.interpreter import return_value
+    if not w_a.same_kind(w_b):
+        return set_error(INCOMPATIBLE % "proper-subset?", env, cont)
+    if w_a.length() >= w_b.length():
+        return return_value(values.w_false, env, cont)
+    return set_subset_loop(w_a.elements(), 0, w_b, env, cont)
+
+@expose("set=?", [W_HashSet, W_HashSet], simple=False)
+def set_equal(w_a, w_b, env, cont):
+    if not w_a.same_kind(w_b):
+        return set_error(INCOMPATIBLE % "set=?", env, cont)
+    return w_a.equal_set(w_b, env, cont)
+
+# iteration
+
+@expose("set-for-each", [W_HashSet, procedure], simple=False)
+def set_for_each(w_set, f, env, cont):
+    return set_for_each_loop(w_set.elements(), f, 0, env, cont)
+
+@loop_label
+def set_for_each_loop(elems, f, idx, env, cont):
+    from pycket.interpreter import return_value
+    if idx >= len(elems):
+        return return_value(values.w_void, env, cont)
+    return f.call([elems[idx]], env, set_for_each_cont(elems, f, idx, env, cont))
+
+@continuation
+def set_for_each_cont(elems, f, idx, env, cont, _vals):
+    return set_for_each_loop(elems, f, idx + 1, env, cont)
+
+@expose("set-map", [W_HashSet, procedure], simple=False)
+def set_map(w_set, f, env, cont):
+    return set_map_loop(w_set.elements(), f, 0, values.w_null, env, cont)
+
+@loop_label
+def set_map_loop(elems, f, idx, w_acc, env, cont):
+    from pycket.interpreter import return_value
+    if idx >= len(elems):
+        return return_value(w_acc, env, cont)
+    return f.call([elems[idx]], env, set_map_cont(elems, f, idx, w_acc, env, cont))
+
+@continuation
+def set_map_cont(elems, f, idx, w_acc, env, cont, _vals):
+    from pycket.interpreter import check_one_val
+    w_acc = values.W_Cons.make(check_one_val(_vals), w_acc)
+    return set_map_loop(elems, f, idx + 1, w_acc, env, cont)
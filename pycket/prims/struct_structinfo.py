@@ -36,13 +36,12 @@ def do_is_struct(v, env, cont):
 
 @expose("struct-info", [values.W_Object], simple=False)
 def do_struct_info(v, env, cont):
-    from pycket.interpreter import return_multi_vals
+    from pycket.interpreter import return_two_vals
     current_inspector = values_struct.current_inspector_param.get(cont)
     if (isinstance(v, values_struct.W_RootStruct) and
         current_inspector.has_control(v.struct_type())):
         return v.get_struct_info(env, cont)
-    return return_multi_vals(
-            values.Values.make([values.w_false, values.w_true]), env, cont)
+    return return_two_vals(values.w_false, values.w_true, env, cont)
 
 struct_info = do_struct_info.w_prim
 
@@ -159,22 +158,34 @@ def do_prefab_key(v):
 
 w_can_impersonate = values.W_Symbol.make("can-impersonate")
 
-@expose("make-struct-type-property", [values.W_Symbol,
-                                      default(values.W_Object, values.w_false),
-                                      default(values.W_List, values.w_null),
-                                      default(values.W_Object, values.w_false)])
-def mk_stp(sym, guard, supers, _can_imp):
+def make_struct_property(sym, guard, supers, _can_imp):
     can_imp = False
     if guard is w_can_impersonate:
         guard = values.w_false
         can_imp = True
     if _can_imp is not values.w_false:
         can_imp = True
-    prop = values_struct.W_StructProperty(sym, guard, supers, can_imp)
+    return values_struct.W_StructProperty(sym, guard, supers, can_imp)
+
+def mk_stp_values(sym, guard, supers, _can_imp):
+    prop = make_struct_property(sym, guard, supers, _can_imp)
     return values.Values.make([prop,
                                values_struct.W_StructPropertyPredicate(prop),
                                values_struct.W_StructPropertyAccessor(prop)])
 
+@expose("make-struct-type-property", [values.W_Symbol,
+                                      default(values.W_Object, values.w_false),
+                                      default(values.W_List, values.w_null),
+                                      default(values.W_Object, values.w_false)],
+        simple=False, simple_n=mk_stp_values)
+def mk_stp(sym, guard, supers, _can_imp, env, cont):
+    from pycket.interpreter import return_three_vals
+    prop = make_struct_property(sym, guard, supers, _can_imp)
+    return return_three_vals(prop,
+                             values_struct.W_StructPropertyPredicate(prop),
+                             values_struct.W_StructPropertyAccessor(prop),
+                             env, cont)
+
 # Unsafe struct ops
 @expose("unsafe-struct-ref", [values.W_Object, unsafe(values.W_Fixnum)])
 def unsafe_struct_ref(v, k):
@@ -30,8 +30,32 @@ def test_symlist_depth():
     s = SymList([1, 2, 3, 4], SymList([], None))
     assert s.depth_and_size() == (2, 4)
 
+def test_symlist_interning():
+    from pycket.env import SymList
+    a = W_Symbol.make("a")
+    b = W_Symbol.make("b")
+    prev = SymList.make([a])
+    assert prev is SymList.make([a])
+    assert SymList.make([b], prev) is SymList.make([b], SymList.make([a]))
+    assert SymList.make([b], prev) is not SymList.make([b])
+    assert SymList.make([a, b]) is not SymList.make([b, a])
+    assert SymList.make([]) is SymList.make([])
+
+def test_symlist_table_bounded(monkeypatch):
+    from pycket import env
+    monkeypatch.setattr(env, "SYMLIST_TABLE_LIMIT", 2)
+    monkeypatch.setattr(env, "symlist_table", env.SymListTable())
+    a = W_Symbol.make("a")
+    b = W_Symbol.make("b")
+    first = env.SymList.make([a])
+    assert env.SymList.make([b]) is env.SymList.make([b])
+    assert len(env.symlist_table.symlists) == 2
+    env.SymList.make([a, b])
+    assert len(env.symlist_table.symlists) == 1
+    assert env.SymList.make([a]) is not first
+
 def test_mutvars():
-    p = expr_ast("(lambda (x) (set! x 2))")
+    p = expr_ast("(lambda (x) (set! x 2) (lambda () x))")
     assert len(p.mutated_vars()) == 0
     assert p.lams[0]._mutable_var_flags[0]
     p = expr_ast(("(lambda (y) (set! x 2))"))
@@ -136,7 +160,9 @@ def test_let_remove_num_envs_edge_case():
     """)
     assert type(m.defs[d]) is W_Fixnum and m.defs[d].value == 3
 
-def test_copy_to_env():
+def test_copy_to_env(monkeypatch):
+    from pycket import config
+    monkeypatch.setattr(config, "rebind_assignments", False)
     p = expr_ast("(let ([c 7]) (let ([b (+ c 1)]) (let ([a (b + 1)] [d (- c 5)]) (+ a b))))")
     inner_let = p.body[0].body[0]
     assert inner_let.remove_num_envs == [0, 0, 1, 2]
@@ -153,6 +179,18 @@ def test_copy_to_env():
     inner_let = p.body[0].body[0]
     assert inner_let._sequenced_remove_num_envs == [0, 1]
 
+def test_flat_env(monkeypatch):
+    from pycket import config
+    from pycket.test.testhelper import run_fix
+    monkeypatch.setattr(config, "flat_env", True)
+    expr = "(let ([c 7]) (let ([b (+ c 1)]) (let ([d (+ b 1)]) (+ c (+ b d)))))"
+    p = expr_ast(expr)
+    inner_let = p.body[0].body[0]
+    # c and b are copied into the frame of the innermost let
+    assert len(inner_let.args.elems) == 3
+    assert inner_let.remove_num_envs[-1] == 2
+    run_fix(expr, 24)
+
 def test_prune_sequenced_body():
     p = expr_ast("""
     (let ([c 7])
@@ -295,7 +333,9 @@ def test_flatten_nested_begins():
     val = p.w_val
     assert isinstance(val, W_Fixnum) and val.value == 7
 
-def test_anf_setbang():
+def test_anf_setbang(monkeypatch):
+    from pycket import config
+    monkeypatch.setattr(config, "rebind_assignments", False)
     p = expr_ast("(let ([x 0]) (set! x (+ 1 (+ x 3))))")
     assert isinstance(p, Let)
     p = p.body[0]
@@ -306,3 +346,29 @@ def test_anf_setbang():
     assert isinstance(p, SetBang)
     assert p.rhs.simple
 
+
+def test_rebind_assignments():
+    def count_setbangs(ast):
+        if isinstance(ast, SetBang):
+            return 1
+        return sum([count_setbangs(c) for c in ast.direct_children()])
+
+    p = expr_ast("(lambda (y) (set! y (+ y 1)) (set! y (* (+ y 1) 2)) y)")
+    assert count_setbangs(p) == 0
+    assert p.lams[0]._mutable_var_flags is None
+
+    p = expr_ast("(let ([y 1]) (set! y 2))")
+    assert count_setbangs(p) == 0
+
+    # a closure refers to the variable
+    p = expr_ast("(lambda (y) (set! y (+ y 1)) (lambda () y))")
+    assert count_setbangs(p) == 1
+    assert p.lams[0]._mutable_var_flags[0]
+
+    # the call before the set! could capture a continuation
+    p = expr_ast("(lambda (f y) (f) (set! y (+ y 1)) y)")
+    assert count_setbangs(p) == 1
+
+    # the set! is not an expression of the body binding the variable
+    p = expr_ast("(lambda (y) (if (zero? y) (set! y 1) (void)) y)")
+    assert count_setbangs(p) == 1
@@ -104,6 +104,29 @@ def test_let_values():
     run_fix("(let-values ([(a b c) (values 1 2 3)] [(d) 1] [(e f g h) (values 1 2 1 1)]) (+ a b c d e f g h))", 12)
     run_fix("(let-values ([(a b c) (values 1 2 3)]) (set! a (+ a 5)) (+ a b c))", 11)
     run_fix("(let-values ([() (values )]) 1)", 1)
+    run_fix("(let-values ([(a b) (values 1 2)]) (- a b))", -1)
+    run_fix("(let-values ([(a b) (values 1 2)] [(c d) (values 3 4)]) (+ a b c d))", 10)
+    run_fix("(let-values ([(a b) (begin0 (values 1 2) 3)]) (+ a b))", 3)
+    with pytest.raises(SchemeException):
+        run_fix("(let-values ([(a b c) (values 1 2)]) a)")
+    with pytest.raises(SchemeException):
+        run_fix("(let-values ([(a b) (values 1 2 3)]) a)")
+
+def test_multiple_value_prims():
+    from pycket.prims.expose import prim_env
+    run_fix("(call-with-values (lambda () (values 1 2)) -)", -1)
+    run_fix("(call-with-values (lambda () (values 1 2 3)) +)", 6)
+    run_fix("(call-with-values (lambda () (quotient/remainder 17 5)) -)", 1)
+    run_fix("(let-values ([(q r) (quotient/remainder 17 5)]) (+ (* 10 q) r))", 32)
+    run_fix("(with-handlers ([exn:fail? (lambda (e) 0)]) (let-values ([(q r) (quotient/remainder 1 0)]) q))", 0, stdlib=True)
+    run_fix("(let-values ([(prop pred acc) (make-struct-type-property 'p)]) (if (pred 1) 1 2))", 2)
+    # argument errors of these non-simple primitives are Racket exceptions
+    run_fix("(with-handlers ([exn:fail:contract? (lambda (e) 0)]) (let-values ([(q r) (quotient/remainder 'a 1)]) q))", 0, stdlib=True)
+    run_fix("(with-handlers ([exn:fail:contract? (lambda (e) 0)]) (let-values ([(p pred acc) (make-struct-type-property 5)]) 1))", 0, stdlib=True)
+    run_fix("(with-handlers ([exn:fail? (lambda (e) 0)]) (let-values ([(q r) (quotient/remainder 1)]) q))", 0, stdlib=True)
+    # the direct interpreter calls these without going through the CEK machine
+    for name in ["values", "quotient/remainder", "make-struct-type-property"]:
+        assert prim_env[W_Symbol.make(name)].simple_n is not None
 
 def test_letrec_values():
     run_fix("(letrec-values ([(a b c) (values 1 2 3)]) (+ a b c))", 6)
@@ -274,6 +297,23 @@ def test_apply():
     run_fix("(apply + 1 2 (list 3))", 6)
     run_fix("(apply + 1 2 3 (list))", 6)
 
+def test_apply_closure():
+    run_fix("(apply (lambda (a b c) (- a b c)) (list 10 2 3))", 5)
+    run_fix("(apply (lambda (a b c) (- a b c)) 10 (list 2 3))", 5)
+    run_fix("(apply (lambda (a . r) (length r)) (list 1 2 3))", 2)
+    run_fix("(apply (lambda (a . r) (length r)) 1 2 3 (list 4))", 3)
+    run_fix("(apply (lambda (a b . r) (+ a b (length r))) 1 (list 2))", 3)
+    run_fix("(apply (lambda r (apply + r)) 1 (list 2 3))", 6)
+    run_fix("(apply (case-lambda [(a) a] [(a b) (+ a b)] [r (length r)]) (list 1 2))", 3)
+    run_fix("(apply (case-lambda [(a) a] [(a b) (+ a b)] [r (length r)]) 1 (list 2 3))", 3)
+    run_fix("(let ([f (lambda (x y) (set! x (+ x y)) (lambda () x))]) ((apply f (list 1 2))))", 3)
+    with pytest.raises(SchemeException):
+        run_fix("(apply (lambda (a b) a) (list 1))")
+    with pytest.raises(SchemeException):
+        run_fix("(apply (lambda (a b) a) 1 (list 2 3))")
+    with pytest.raises(SchemeException):
+        run_fix("(apply (lambda (a . r) a) (list))")
+
 def test_setbang_recursive_lambda():
     run_fix("((letrec ([f (lambda (a) (set! f (lambda (a) 1)) (f a))]) f) 6)", 1)
 
@@ -651,6 +691,170 @@ def test_should_enter_downrecursion():
     assert f.body[0].should_enter
     assert f.body[0].els.body[0].body[0].should_enter
 
+def test_static_loop_headers():
+    from pycket.expand import expand_string, parse_module
+    str = """
+        #lang pycket
+        (define (count n) (if (= n 0) 0 (count (- n 1))))
+        (define (sum n) (if (= n 0) 0 (+ n (sum (- n 1)))))
+        (define (ev? n) (if (= n 0) #t (od? (- n 1))))
+        (define (od? n) (if (= n 0) #f (ev? (- n 1))))
+        (define (named n)
+          (let loop ([i n] [acc 0])
+            (if (= i 0) acc (loop (- i 1) (+ acc i)))))
+        """
+
+    m = parse_module(expand_string(str))
+    lams = {}
+    for b in m.body:
+        if isinstance(b, DefineValues):
+            lams[b.names[0].utf8value] = b.rhs.lams[0]
+
+    # nothing has run, so these only come from the static analysis
+    assert lams["count"].body[0].should_enter
+    assert not lams["sum"].body[0].should_enter
+    assert lams["ev?"].body[0].should_enter
+    assert not lams["od?"].body[0].should_enter
+
+    loops = []
+    def find_loops(ast):
+        if isinstance(ast, CaseLambda) and ast.recursive_sym is not None:
+            loops.append(ast)
+        for child in ast.direct_children():
+            find_loops(child)
+    find_loops(lams["named"])
+    assert len(loops) == 1
+    assert loops[0].lams[0].body[0].should_enter
+
+def test_rebind_assignments():
+    run_fix("((lambda (y) (set! y (+ y 1)) (set! y (* y 2)) y) 3)", 8)
+    run_fix("(let ([x 1] [z 5]) (set! x (+ x (* z 2))) (set! z x) (+ x z))", 22)
+    # reentering the continuation after the set! must see the assigned value
+    run_fix("""
+    (let ([x 0] [k #f])
+      (call/cc (lambda (c) (set! k c)))
+      (set! x (+ x 1))
+      (if (< x 3) (k #f) x))""", 3)
+
+def test_lambda_profiling(monkeypatch):
+    from pycket.expand import expand_string, parse_module
+    from pycket        import config, lambda_profile
+    monkeypatch.setattr(config, "lambda_profiling", True)
+    monkeypatch.setattr(lambda_profile, "state", lambda_profile.ProfilerState())
+    str = """
+        #lang pycket
+        (define (loop n) (if (= n 0) 0 (loop (- n 1))))
+        (define (sum n) (if (= n 0) 0 (+ n (sum (- n 1)))))
+        (define f (case-lambda [(x) x] [(x y) y]))
+        (loop 100)
+        (sum 10)
+        (f 1) (f 1 2) (f 1 2)
+        """
+
+    ast = parse_module(expand_string(str))
+    env = ToplevelEnv(config.get_testing_config(**{"pycket.lambda_profiling":True}))
+    m = interpret_module(ast, env)
+    loop = m.defs[W_Symbol.make("loop")].closure.caselam.lams[0]
+    sum = m.defs[W_Symbol.make("sum")].closure.caselam.lams[0]
+    caselam = m.defs[W_Symbol.make("f")].closure.caselam
+
+    state = lambda_profile.state
+    assert state.lambdas[loop].calls == 101
+    assert state.lambdas[sum].calls == 11
+    assert state.lambdas[loop].active == 0
+    assert state.lambdas[sum].active == 0
+    assert state.caselambdas[caselam].clause_counts == [1, 2]
+    assert state.current is None
+
+def test_allocation_profiling(monkeypatch):
+    from pycket.expand import expand_string, parse_module
+    from pycket        import config, alloc_profile
+    from pycket.base   import W_ProtoObject
+    from pycket.cont   import BaseCont
+    monkeypatch.setattr(config, "allocation_profiling", True)
+    monkeypatch.setattr(alloc_profile, "state", alloc_profile.AllocProfilerState())
+    str = """
+        #lang pycket
+        (define (make n) (if (= n 0) '() (cons n (make (- n 1)))))
+        (define l (make 10))
+        (define (three n) (list n n n))
+        (define m (three 1))
+        """
+
+    ast = parse_module(expand_string(str))
+    # instrument_classes replaces the constructors for good, put them back
+    inits = []
+    for root in [W_ProtoObject, BaseCont]:
+        for cls in alloc_profile._all_subclasses(root):
+            if "__init__" in cls.__dict__:
+                inits.append((cls, cls.__dict__["__init__"]))
+    alloc_profile.instrument_classes()
+    try:
+        env = ToplevelEnv(config.get_testing_config(**{"pycket.allocation_profiling":True}))
+        m = interpret_module(ast, env)
+    finally:
+        for cls, init in inits:
+            cls.__init__ = init
+        for root in [W_ProtoObject, BaseCont]:
+            for cls in alloc_profile._all_subclasses(root):
+                if "_alloc_info" in cls.__dict__:
+                    del cls._alloc_info
+    state = alloc_profile.state
+    l_class = type(m.defs[W_Symbol.make("l")]).__name__
+    m_class = type(m.defs[W_Symbol.make("m")]).__name__
+    infos = {}
+    for info in state.classes:
+        infos[info.name] = info
+    assert infos[l_class].count >= 10
+    assert infos[m_class].count >= 3
+
+    # the pairs made by make are attributed to the application of cons
+    cons_sites = [site for site in state.ast_sites.values() if "cons" in site.name]
+    assert sum([site.per_class.get(l_class, 0) for site in cons_sites]) == 10
+    # the ones made by list to the primitive
+    list_sites = [site for w_prim, site in state.prim_sites.items()
+                       if w_prim.name.variable_name() == "list"]
+    assert len(list_sites) == 1
+    assert list_sites[0].count == 3
+    assert list_sites[0].per_class[m_class] == 3
+    assert list_sites[0].bytes == 3 * infos[m_class].size
+
+def test_direct_interpretation():
+    from pycket.expand import expand_string, parse_module
+    from pycket        import config
+    str = """
+        #lang pycket
+        (define (loop n) (if (= n 0) 0 (loop (- n 1))))
+        (define (sum n) (if (= n 0) 0 (+ n (sum (- n 1)))))
+        (define-values (q r) (let-values ([(q r) (quotient/remainder 17 5)]) (values q r)))
+        (define counter (let ([n 0]) (lambda () (set! n (+ n 1)) n)))
+        (define b0 (begin0 (counter) (counter)))
+        (define (even? n) (if (= n 0) #t (odd? (- n 1))))
+        (define (odd? n) (if (= n 0) #f (even? (- n 1))))
+        (define escaped (+ 1 (call/cc (lambda (k) (+ 100 (k 41))))))
+        (define handled (with-handlers ([exn:fail? (lambda (e) 'caught)]) (+ 1 (car 5))))
+        (define marks (with-continuation-mark 'key 'val (car (continuation-mark-set->list (current-continuation-marks) 'key))))
+        (define mapped (map (lambda (x) (* x x)) '(1 2 3)))
+        (define a (loop 100000))
+        (define s (sum 10000))
+        (define e (even? 1001))
+        """
+
+    ast = parse_module(expand_string(str))
+    env = ToplevelEnv(config.get_testing_config(**{"pycket.direct_interpretation":True}))
+    m = interpret_module(ast, env)
+    def get(name):
+        return m.defs[W_Symbol.make(name)]
+    assert get("a").value == 0
+    assert get("s").value == 50005000
+    assert get("q").value == 3 and get("r").value == 2
+    assert get("b0").value == 1
+    assert get("e") is w_false
+    assert get("escaped").value == 42
+    assert get("handled") is W_Symbol.make("caught")
+    assert get("marks") is W_Symbol.make("val")
+    assert get("mapped").tostring() == "(1 4 9)"
+
 def test_reader_graph(doctest):
     """
     ! (require racket/shared)
@@ -1,7 +1,9 @@
 import operator as op
 from pycket                          import values
 from pycket.hash.base                import ll_get_dict_item, get_dict_item
-from pycket.hash.equal               import MutableByteHashmapStrategy, StringHashmapStrategy
+from pycket.hash.equal               import (
+    MutableByteHashmapStrategy, StringHashmapStrategy, FlonumHashmapStrategy,
+    CharacterHashmapStrategy, FixnumPairHashmapStrategy)
 from pycket.hash.persistent_hash_map import make_persistent_hash_type, validate_persistent_hash
 from pycket.test.testhelper          import run_mod_expr, run_mod
 from rpython.rlib.rarithmetic        import r_uint
@@ -209,6 +211,42 @@ def test_hash_copy(doctest):
     #t
     """
 
+def test_hash_copy_kinds(doctest):
+    """
+    ! (define (copy-of h) (let ([c (hash-copy h)]) (list (immutable? c) (hash-count c) (hash-ref c 2 #f))))
+    > (copy-of (hasheq 1 'a 2 'b))
+    '(#f 2 b)
+    > (copy-of (hasheqv 1 'a 2 'b))
+    '(#f 2 b)
+    > (copy-of (hash 1 'a 2 'b))
+    '(#f 2 b)
+    > (copy-of (make-hash '((1 . a) (2 . b))))
+    '(#f 2 b)
+    ! (define h (make-hash (list (cons (list 1) 'a) (cons (list 2) 'b))))
+    ! (define c (hash-copy h))
+    ! (hash-set! c (list 3) 'c)
+    ! (hash-remove! c (list 1))
+    > (list (hash-count h) (hash-ref h (list 1)) (hash-ref h (list 3) #f))
+    '(2 a #f)
+    > (list (hash-count c) (hash-ref c (list 1) #f) (hash-ref c (list 3)))
+    '(2 #f c)
+    ! (define k (hash-copy (make-hasheq '((a . 1)))))
+    ! (hash-set! k 'b 2)
+    > (hash-count k)
+    2
+    """
+
+def test_hash_for_each_mutation(doctest):
+    """
+    ! (define h (make-hash '((1 . a) (2 . b) (3 . c))))
+    ! (define seen 0)
+    ! (hash-for-each h (lambda (k v) (set! seen (+ seen 1)) (hash-set! h (+ k 10) v)))
+    > (list seen (hash-count h))
+    '(3 6)
+    > (length (hash-map (hasheqv 1 2 3 4) cons))
+    2
+    """
+
 def test_use_equal(doctest):
     """
     ! (define ht (make-hash))
@@ -354,6 +392,74 @@ def test_whitebox_bytes(source):
     result = run_mod_expr(source)
     assert result.strategy is MutableByteHashmapStrategy.singleton
 
+def test_whitebox_flonum(source):
+    """
+    (let ([ht (make-hash)])
+        (hash-set! ht 1.5 'a)
+        (hash-set! ht +nan.0 'b)
+        (hash-set! ht 0.0 'c)
+        (hash-set! ht -0.0 'd)
+        (unless (and (eq? (hash-ref ht (/ 0.0 0.0)) 'b)
+                     (eq? (hash-ref ht 0.0) 'c)
+                     (= (hash-count ht) 4))
+          (error 'flonum-keys "wrong lookup"))
+        ht)
+    """
+    result = run_mod_expr(source)
+    assert result.strategy is FlonumHashmapStrategy.singleton
+
+def test_whitebox_character(source):
+    r"""
+    (let ([ht (make-hash)])
+        (hash-set! ht #\a 1)
+        (hash-set! ht #\b 2)
+        (hash-set! ht (string-ref "a" 0) 3)
+        (unless (= (hash-count ht) 2)
+          (error 'character-keys "wrong count"))
+        ht)
+    """
+    result = run_mod_expr(source)
+    assert result.strategy is CharacterHashmapStrategy.singleton
+
+def test_whitebox_fixnum_pair(source):
+    """
+    (let ([ht (make-hash)])
+        (hash-set! ht (cons 1 2) 'a)
+        (hash-set! ht (cons 2 1) 'b)
+        (hash-set! ht (cons 1 2) 'c)
+        (unless (and (= (hash-count ht) 2) (eq? (hash-ref ht (cons 1 2)) 'c))
+          (error 'fixnum-pair-keys "wrong lookup"))
+        ht)
+    """
+    result = run_mod_expr(source)
+    assert result.strategy is FixnumPairHashmapStrategy.singleton
+
+def test_fixnum_pair_keys_identity(doctest):
+    """
+    ! (define k (cons 1 2))
+    ! (define ht (make-hash))
+    ! (hash-set! ht k 'a)
+    ! (hash-set! ht (cons 3 4) 'b)
+    > (eq? (hash-iterate-key ht (hash-iterate-first ht)) k)
+    #t
+    > (for/and ([key (in-hash-keys ht)]) (or (eq? key k) (equal? key (cons 3 4))))
+    #t
+    > (and (memq k (hash-keys ht)) #t)
+    #t
+    """
+
+def test_fixnum_pair_switch(doctest):
+    """
+    ! (define ht (make-hash))
+    ! (hash-set! ht (cons 1 2) 'a)
+    > (hash-ref ht (cons 1 2.0) #f)
+    #f
+    > (begin (hash-set! ht (cons 1 (cons 2 3)) 'b) (hash-ref ht (cons 1 2)))
+    'a
+    > (hash-count ht)
+    2
+    """
+
 def test_hash_for(doctest):
     """
     ! (require racket/private/for)
@@ -367,6 +473,67 @@ def test_hash_for(doctest):
     6
     """
 
+def test_mutable_equal_object_keys(doctest):
+    """
+    ! (require racket/private/for)
+    ! (define ht (make-hash))
+    ! (for ([i 100]) (hash-set! ht (list i (number->string i)) i))
+    > (hash-count ht)
+    100
+    > (hash-ref ht (list 42 "42"))
+    42
+    > (begin (hash-set! ht (list 42 "42") 'x) (list (hash-count ht) (hash-ref ht (list 42 "42"))))
+    '(100 x)
+    > (begin (hash-remove! ht (list 7 "7")) (hash-remove! ht 'missing) (hash-count ht))
+    99
+    > (hash-ref ht (list 7 "7") #f)
+    #f
+    > (for/sum ([(k v) ht]) (if (number? v) v 0))
+    4901
+    > (define v (chaperone-vector (vector 1 2) (lambda (v i x) x) (lambda (v i x) x)))
+    > (begin (hash-set! ht v 'chaperoned) (hash-ref ht (vector 1 2)))
+    'chaperoned
+    > (begin (hash-remove! ht (vector 1 2)) (hash-ref ht v #f))
+    #f
+    > (let ([h (make-hash)]) (hash-set! h 1 'a) (hash-set! h 2 'b) (hash-remove! h 1) (hash-map h cons))
+    '((2 . b))
+    """
+
+def test_immutable_equal_hash(doctest):
+    """
+    ! (require racket/private/for)
+    > (define h (for/fold ([h (hash)]) ([i 100]) (hash-set h (list i (number->string i)) i)))
+    > (hash-count h)
+    100
+    > (hash-ref h (list 42 "42"))
+    42
+    > (define h2 (hash-set h (list 42 "42") 'x))
+    > (list (hash-count h2) (hash-ref h2 (list 42 "42")) (hash-ref h (list 42 "42")))
+    '(100 x 42)
+    > (define h3 (hash-remove h (list 7 "7")))
+    > (list (hash-count h3) (hash-ref h3 (list 7 "7") #f) (hash-ref h (list 7 "7")))
+    '(99 #f 7)
+    > (hash-count (hash-remove h3 (list 7 "7")))
+    99
+    > (for/sum ([(k v) h3]) v)
+    4943
+    > (hash-count (make-immutable-hash (list (cons (list 1) 'a) (cons (list 1) 'b))))
+    1
+    > (hash-ref (hash 1 'a (list 2) 'b (list 2) 'c) (list 2))
+    'c
+    > (hash-ref (hash-set (hash 1 'a 2 'b) (list 3) 'c) 1)
+    'a
+    """
+
+def test_immutable_equal_whitebox(source):
+    """
+    (hash-set (hash 1 'a 'b 2) "c" 3)
+    """
+    from pycket.hash.equal import PersistentObjectHashmapStrategy
+    result = run_mod_expr(source)
+    assert result.strategy is PersistentObjectHashmapStrategy.singleton
+    assert result.length() == 3
+
 def test_persistent_hash():
     HashTable = make_persistent_hash_type()
     acc = HashTable.EMPTY
@@ -432,6 +599,131 @@ def test_persistent_hash_collisions2():
     for k, v in acc.iteritems():
         assert acc.val_at(k, None) is v
 
+def test_transient_hash():
+    for hashfun in [lambda x: r_uint(hash(x)), lambda x: r_uint(hash(x)) % 8]:
+        HashTable = make_persistent_hash_type(hashfun=hashfun)
+        builder = HashTable.transient()
+        for i in range(2048):
+            builder.assoc(i % 128, i)
+        acc = builder.persistent()
+        validate_persistent_hash(acc)
+
+        assert len(acc) == 128
+        assert len(list(acc.iteritems())) == 128
+        for k, v in acc.iteritems():
+            assert v >= 1920
+            assert v % 128 == k
+            assert acc.val_at(k, None) is v
+
+        acc = acc.assoc_many(range(100, 300), range(200))
+        validate_persistent_hash(acc)
+        assert len(acc) == 300
+        assert acc.val_at(99, None) == 2019
+        assert acc.val_at(299, None) == 199
+
+def test_hash_set_star(doctest):
+    """
+    > (define h (hash-set* (hash 1 'a) 2 'b 3 'c 1 'd))
+    > (list (hash-count h) (hash-ref h 1) (hash-ref h 3))
+    '(3 d c)
+    > (hash-count (hash-set* (hash) (list 1) 'a (list 1) 'b (list 2) 'c))
+    2
+    > (hash-ref (hash-set* (hasheqv 1 'a) 1 'b 2 'c) 1)
+    'b
+    > (hash-count (make-immutable-hasheq (list (cons 'a 1) (cons 'b 2) (cons 'a 3))))
+    2
+    > (with-handlers ([exn:fail? (lambda (e) 'caught)]) (hash 1 2 3))
+    'caught
+    > (with-handlers ([exn:fail? (lambda (e) 'caught)]) (make-immutable-hash (list 1 2)))
+    'caught
+    > (with-handlers ([exn:fail? (lambda (e) 'caught)]) (make-immutable-hash 5))
+    'caught
+    > (with-handlers ([exn:fail? (lambda (e) 'caught)]) (hasheq 1))
+    'caught
+    > (with-handlers ([exn:fail? (lambda (e) 'caught)]) (hash-set* (hash) 1))
+    'caught
+    > (with-handlers ([exn:fail? (lambda (e) 'caught)]) (hash-set* (make-hash) 1 2))
+    'caught
+    """
+
+def test_hash_update(doctest):
+    """
+    ! (define h (make-hash))
+    ! (for ([k '(a b a c a (x) (x))]) (hash-update! h k add1 0))
+    > (list (hash-ref h 'a) (hash-ref h 'b) (hash-ref h '(x)))
+    '(3 1 2)
+    > (hash-update! h 'b (lambda (v) (* v 10)))
+    > (hash-ref h 'b)
+    10
+    E (hash-update! h 'd add1)
+    > (hash-ref! h "str" (lambda () (hash-set! h 'e 5) 'fresh))
+    'fresh
+    > (list (hash-ref h "str") (hash-ref h 'e) (hash-ref! h "str" 'other))
+    '(fresh 5 fresh)
+    > (hash-ref! (make-hasheq) 'k 1)
+    1
+    > (define ih (hash-update (hash 'a 1) 'a add1))
+    > (list (hash-ref ih 'a) (hash-ref (hash-update ih 'b add1 (lambda () 10)) 'b))
+    '(2 11)
+    E (hash-ref! (hash) 'a 1)
+    > (with-handlers ([exn:fail:contract? (lambda (e) 'caught)]) (hash-update! (make-hash) 'd add1))
+    'caught
+    > (with-handlers ([exn:fail? (lambda (e) 'caught)]) (hash-ref! (hash) 'a 1))
+    'caught
+    > (with-handlers ([exn:fail? (lambda (e) 'caught)]) (hash-update (make-hash) 'a add1 0))
+    'caught
+    """
+
+def test_hash_update_primitives(monkeypatch):
+    # hash-ref!, hash-update! and hash-update are defined in Racket by the
+    # library, the loader resolves them to the primitives
+    from pycket.expand import is_native_hash_binding
+    from pycket.prims import hash as hash_prims
+    assert is_native_hash_binding("/usr/racket/collects/racket/private/more-scheme.rkt", "hash-ref!")
+    assert not is_native_hash_binding("/home/user/more-scheme.rkt", "hash-ref!")
+    assert not is_native_hash_binding(None, "hash-ref!")
+    actions = []
+    hash_slot_find = hash_prims.hash_slot_find
+    def counting_slot_find(table, key, action, updater, default, env, cont):
+        actions.append(action)
+        return hash_slot_find(table, key, action, updater, default, env, cont)
+    monkeypatch.setattr(hash_prims, "hash_slot_find", counting_slot_find)
+    result = run_mod_expr("""
+        (let ([h (make-hash)])
+          (hash-ref! h 'a 1)
+          (hash-update! h 'a add1)
+          (+ (hash-ref h 'a) (hash-ref (hash-update (hash 'b 1) 'b add1) 'b)))""")
+    assert result.value == 4
+    assert actions == [hash_prims._REF_BANG, hash_prims._UPDATE_BANG,
+                       hash_prims._UPDATE]
+
+def test_hash_set_star_primitive(monkeypatch):
+    # hash-set* is defined in Racket by the library, the loader resolves it
+    # to the primitive, which adds all the keys to an eqv? table at once
+    from pycket.expand import is_native_hash_binding
+    from pycket.hash.simple import W_EqvImmutableHashTable
+    assert is_native_hash_binding("/usr/racket/collects/racket/private/more-scheme.rkt", "hash-set*")
+    sizes = []
+    assoc_many = W_EqvImmutableHashTable.assoc_many
+    def counting_assoc_many(self, keys, vals):
+        sizes.append(len(keys))
+        return assoc_many(self, keys, vals)
+    monkeypatch.setattr(W_EqvImmutableHashTable, "assoc_many", counting_assoc_many)
+    result = run_mod_expr("(hash-count (hash-set* (hasheqv 1 'a) 1 'b 2 'c 3 'd))")
+    assert result.value == 3
+    assert sizes == [3]
+
+def test_persistent_hash_items():
+    HashTable = make_persistent_hash_type()
+    acc = HashTable.EMPTY
+    assert acc.items() == []
+    for i in range(1000):
+        acc = acc.assoc(i, -i)
+    acc = acc.without(500)
+    items = acc.items()
+    assert items == [acc.get_item(i) for i in range(len(acc))]
+    assert sorted(items) == sorted((i, -i) for i in range(1000) if i != 500)
+
 def test_persistent_hash_removal():
     HashTable = make_persistent_hash_type()
     acc = HashTable.EMPTY
@@ -545,3 +837,201 @@ def test_hash_iterate_functions(doctest):
     > (hash-iterate-next equal-table3 (hash-iterate-first equal-table3))
     #f
     """
+
+def test_weak_hash(doctest):
+    """
+    ! (define ht (make-weak-hasheq))
+    ! (define k (list 1 2))
+    ! (hash-set! ht k 'a)
+    ! (hash-set! ht 3 'b)
+    ! (define wh (make-weak-hash (list (cons "x" 1))))
+    ! (hash-set! wh (string-append "x") 2)
+    > (hash-ref ht k)
+    'a
+    > (hash-ref ht (list 1 2) #f)
+    #f
+    > (hash-count ht)
+    2
+    > (hash-ref wh "x")
+    2
+    > (hash-count wh)
+    1
+    > (begin (hash-remove! ht k) (hash-count ht))
+    1
+    > (hash-weak? ht)
+    #t
+    > (hash-weak? (make-late-weak-hasheq))
+    #t
+    > (hash-weak? (make-hasheq))
+    #f
+    > (hash-ref (hash-copy wh) "x")
+    2
+    """
+
+def test_weak_hash_sweep():
+    import gc
+    from pycket.hash.weak import W_WeakEqHashTable
+    from pycket.perf_stats import gchooks
+    table = W_WeakEqHashTable()
+    keys = [values.W_Cons.make(values.W_Fixnum(i), values.w_null)
+            for i in range(10)]
+    for i, w_key in enumerate(keys):
+        table.add_entry(w_key, table.hash_key(w_key), values.W_Fixnum(i))
+    w_one = values.W_Fixnum(1)
+    table.add_entry(w_one, table.hash_key(w_one), values.w_true)
+    assert table.length() == 11
+    del keys[:5]
+    del w_key
+    gc.collect()
+    # the entries stay until the GC hooks report a major collection
+    assert len(table.entries) == 11
+    gchooks.on_gc_collect(0, 0, 0, 0, 0, 0)
+    assert table.length() == 6
+    # the positions of the live entries survive the collection
+    assert len(table.entries) == 11
+    assert table.get_item(10) == (w_one, values.w_true)
+    assert table.hash_iterate_first() == 5
+    # the order is compacted once the table is changed
+    w_two = values.W_Fixnum(2)
+    table.add_entry(w_two, table.hash_key(w_two), values.w_false)
+    assert table.length() == 7
+    assert len(table.entries) == 7
+    assert table.get_item(5) == (w_one, values.w_true)
+
+def test_make_weak_hash_errors(doctest):
+    """
+    > (with-handlers ([exn:fail? (lambda (e) 'caught)]) (make-weak-hash (list 1 2)))
+    'caught
+    > (with-handlers ([exn:fail? (lambda (e) 'caught)]) (make-weak-hasheq (cons (cons 1 2) 3)))
+    'caught
+    > (with-handlers ([exn:fail:contract? (lambda (e) 'caught)]) (make-ephemeron-hash 5))
+    'caught
+    """
+
+def test_weak_equal_hash_changed_during_equal(doctest):
+    """
+    ! (define wt (make-weak-hash))
+    ! (define armed #f)
+    ! (define-struct k (v) #:property prop:equal+hash (list (lambda (a b rec) (when armed (set! armed #f) (hash-remove! wt k1)) (= (k-v a) (k-v b))) (lambda (a rec) 1) (lambda (a rec) 1)))
+    ! (define k1 (make-k 1))
+    ! (define k2 (make-k 2))
+    ! (hash-set! wt k1 'a)
+    ! (hash-set! wt k2 'b)
+    ! (set! armed #t)
+    > (hash-ref wt (make-k 2) #f)
+    'b
+    > (hash-count wt)
+    1
+    """
+
+def test_ephemeron():
+    import gc
+    w_key = values.W_Cons.make(values.W_Fixnum(1), values.w_null)
+    w_value = values.W_Cons.make(values.W_Fixnum(2), values.w_null)
+    eph = values.W_Ephemeron(w_key, w_value)
+    assert eph.get() is w_value
+    imm = values.W_Ephemeron(values.W_Fixnum(1), w_value)
+    del w_key, w_value
+    gc.collect()
+    assert eph.get() is None
+    assert eph.w_value is None
+    assert imm.get() is not None
+
+def test_ephemeron_sweep():
+    import gc
+    from pycket.perf_stats import gchooks
+    w_key = values.W_Cons.make(values.W_Fixnum(1), values.w_null)
+    w_value = values.W_Cons.make(values.W_Fixnum(2), values.w_null)
+    eph = values.W_Ephemeron(w_key, w_value)
+    del w_key, w_value
+    gc.collect()
+    # the value is only dropped once the GC hooks report a major collection,
+    # by the next ephemeron made or read, without reading eph itself
+    values.W_Ephemeron(values.W_Fixnum(3), values.w_true)
+    assert eph.w_value is not None
+    gchooks.on_gc_collect(0, 0, 0, 0, 0, 0)
+    values.W_Ephemeron(values.W_Fixnum(3), values.w_true).get()
+    assert eph.w_value is None
+
+def test_ephemeron_hash():
+    import gc
+    from pycket.hash.weak import W_EphemeronEqualHashTable
+    from pycket.perf_stats import gchooks
+    table = W_EphemeronEqualHashTable()
+    assert table.is_ephemeron
+    assert isinstance(table.make_empty(), W_EphemeronEqualHashTable)
+    w_key = values.W_Cons.make(values.W_Fixnum(1), values.w_null)
+    table.add_entry(w_key, table.hash_key(w_key), values.w_true)
+    assert table.length() == 1
+    del w_key
+    gc.collect()
+    gchooks.on_gc_collect(0, 0, 0, 0, 0, 0)
+    assert table.length() == 0
+
+def test_equal_hash_code(doctest):
+    """
+    ! (struct posn (x y) #:transparent)
+    ! (struct opaque (x))
+    ! (define ht (make-hash))
+    ! (hash-set! ht (posn 1 (list 2 3)) 'posn)
+    ! (hash-set! ht (vector 1 "a") 'vector)
+    ! (hash-set! ht (box (list 1)) 'box)
+    ! (define o (opaque 1))
+    ! (hash-set! ht o 'opaque)
+    > (hash-ref ht (posn 1 (list 2 3)))
+    'posn
+    > (hash-ref ht (vector-immutable 1 "a"))
+    'vector
+    > (hash-ref ht (box-immutable (list 1)))
+    'box
+    > (hash-ref ht (opaque 1) #f)
+    #f
+    > (hash-ref ht o)
+    'opaque
+    > (= (equal-hash-code (posn 1 2)) (equal-hash-code (posn 1 2)))
+    #t
+    > (= (equal-hash-code (list 1 (vector 2))) (equal-hash-code (list 1 (vector 2))))
+    #t
+    > (= (equal-hash-code (mcons 1 2)) (equal-hash-code (mcons 1 2)))
+    #t
+    > (= (equal-hash-code (make-vector 10000 1)) (equal-hash-code (make-vector 10000 1)))
+    #t
+    """
+
+def test_equal_hash_cache():
+    from pycket.values_struct import W_Struct, W_StructType
+    from pycket.vector import W_Vector
+    w_sym = values.W_Symbol.make("posn")
+    w_type = W_StructType.make_simple(w_sym, values.w_false, 2, 0,
+            immutables=[0, 1])
+    w_a = W_Struct.make([values.W_Fixnum(1), values.W_Fixnum(2)], w_type)
+    w_b = W_Struct.make([values.W_Fixnum(1), values.W_Fixnum(2)], w_type)
+    assert w_a.hash_equal() == w_b.hash_equal()
+    assert w_a._hash == w_a.hash_equal()
+    # structs holding mutable values are not cached
+    w_vec = W_Vector.fromelements([values.W_Fixnum(1)])
+    w_c = W_Struct.make([w_vec, values.W_Fixnum(2)], w_type)
+    hash = w_c.hash_equal()
+    assert w_c._hash == 0
+    w_vec.set(0, values.W_Fixnum(5))
+    assert w_c.hash_equal() != hash
+    # neither are structs holding flvectors
+    from pycket.vector import W_FlVector
+    w_fv = W_FlVector.fromelements([values.W_Flonum(1.0)])
+    w_d = W_Struct.make([w_fv, values.W_Fixnum(2)], w_type)
+    hash = w_d.hash_equal()
+    assert w_d._hash == 0
+    w_fv.set(0, values.W_Flonum(5.0))
+    assert w_d.hash_equal() != hash
+
+def test_equal_hash_proxies(doctest):
+    """
+    ! (define ht (make-hash))
+    ! (define iv (impersonate-vector (vector 1 2) (lambda (v i x) (* x 10)) (lambda (v i x) x)))
+    > (begin (hash-set! ht iv 'imp) (hash-ref ht iv))
+    'imp
+    > (= (equal-hash-code (chaperone-vector (vector 1 2) (lambda (v i x) x) (lambda (v i x) x))) (equal-hash-code (vector 1 2)))
+    #t
+    > (= (equal-hash-code (chaperone-vector iv (lambda (v i x) x) (lambda (v i x) x))) (equal-hash-code (vector 1 2)))
+    #f
+    """
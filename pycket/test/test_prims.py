@@ -822,6 +822,183 @@ def test_dynamic_wind4():
     equal = m.defs[values.W_Symbol.make("equal")]
     assert equal is values.w_true
 
+def test_one_shot_continuation_merge():
+    from pycket.cont import Barrier, NilCont
+    from pycket.prims.control import (DynamicWindValueCont, find_winders,
+                                      merge_continuations)
+    shared = Barrier(None, Barrier(None, NilCont()))
+    c1 = DynamicWindValueCont(None, None, None, Barrier(None, shared))
+    c2 = Barrier(None, DynamicWindValueCont(None, None, None, shared))
+    base, stop = merge_continuations(c1, c2, None)
+    assert base is shared and stop is shared
+    assert find_winders(c1, c2, base, stop) == ([c1], [c2.prev])
+    # a one-shot continuation keeps its frames, others are copied
+    assert c2.append(base, stop=stop, share=True) is c2
+    copy = c2.append(base, stop=stop)
+    assert copy is not c2 and copy.prev is not c2.prev
+
+    base, stop = merge_continuations(c1, shared, None)
+    assert base is shared and stop is shared
+    assert find_winders(c1, shared, base, stop) == ([c1], None)
+
+def test_winders():
+    from pycket.cont import Barrier, NilCont, Prompt
+    from pycket.prims.control import (DynamicWindValueCont, find_handlers,
+                                      find_winders)
+    outer = DynamicWindValueCont(None, None, None, NilCont())
+    middle = DynamicWindValueCont(None, None, None, Barrier(None, outer))
+    inner = Barrier(None, Barrier(None, DynamicWindValueCont(None, None, None, middle)))
+    assert find_handlers(inner, middle.prev) == [inner.prev.prev, middle]
+    assert find_handlers(inner, inner.prev) is None
+    # without a shared frame, everything up to the prompts is unwound
+    p1 = Prompt(None, None, None, middle)
+    c1 = DynamicWindValueCont(None, None, None, p1)
+    p2 = Prompt(None, None, None, outer)
+    assert find_winders(c1, p2, p1, p2) == ([c1], None)
+
+def test_dynamic_wind_order():
+    m = run_mod(
+    """
+    #lang pycket
+    (define (wind name thunk l)
+      (dynamic-wind
+        (lambda () (set-box! l (cons (list 'in name) (unbox l))))
+        thunk
+        (lambda () (set-box! l (cons (list 'out name) (unbox l))))))
+    (define escape
+      (let ([l (box '())])
+        (let/ec esc
+          (wind 1 (lambda () (wind 2 (lambda () (esc 0)) l)) l))
+        (reverse (unbox l))))
+    (define reenter
+      (let ([l (box '())] [k #f])
+        (wind 1 (lambda () (wind 2 (lambda () (let/cc c (set! k c))) l)) l)
+        (when (< (length (unbox l)) 8)
+          (k 0))
+        (reverse (unbox l))))
+    ;; a composable continuation reinstated inside another dynamic-wind,
+    ;; then escaped from
+    (define composable
+      (let ([l (box '())] [k #f])
+        (call-with-continuation-prompt
+          (lambda ()
+            (wind 'a (lambda ()
+                       ((call-with-composable-continuation
+                          (lambda (c) (set! k c) void))))
+                  l)))
+        (let/ec esc
+          (wind 'b (lambda () (k (lambda () (esc 0)))) l))
+        (reverse (unbox l))))
+    (define equal
+      (and (equal? escape '((in 1) (in 2) (out 2) (out 1)))
+           (equal? reenter '((in 1) (in 2) (out 2) (out 1)
+                             (in 1) (in 2) (out 2) (out 1)))
+           (equal? composable '((in a) (out a) (in b) (in a) (out a) (out b)))))
+    """)
+    equal = m.defs[values.W_Symbol.make("equal")]
+    assert equal is values.w_true
+
+def test_one_shot_continuation():
+    m = run_mod(
+    """
+    #lang pycket
+    (define (search lst)
+      (call/1cc (lambda (k)
+        (for-each (lambda (x) (when (> x 2) (k x))) lst)
+        #f)))
+    (define a (list (search '(1 2 3 4)) (search '(1 2))))
+    ;; reentering once after escaping from the procedure
+    (define b
+      (let ([k #f] [n 0])
+        (let/ec out
+          (set! n (+ n (call/1cc (lambda (c) (set! k c) (out 0))))))
+        (when (= n 0) (k 10))
+        n))
+    (define (reinstate-error thunk)
+      (with-handlers ([exn:fail? (lambda (e) 'error)]) (thunk)))
+    ;; a second invocation is an error
+    (define c
+      (let ([k #f] [n 0])
+        (let/ec out
+          (call/1cc (lambda (c) (set! k c) (out 0)))
+          (set! n (+ n 1)))
+        (if (< n 2) (reinstate-error (lambda () (k #f))) n)))
+    ;; so is one after the procedure has returned
+    (define d
+      (let ([k (call/1cc (lambda (c) c))])
+        (if (procedure? k) (reinstate-error (lambda () (k 1))) k)))
+    ;; call/1cc in tail position of another shares its frame, returning
+    ;; from the inner one returns from both
+    (define (loop n) (if (= n 0) 'done (call/1cc (lambda (k) (loop (- n 1))))))
+    (define e
+      (let* ([k #f]
+             [v (call/1cc (lambda (c) (set! k c) (call/1cc (lambda (c2) (c2 5)))))])
+        (if (= v 5) (list (loop 100000) (reinstate-error (lambda () (k 0)))) v)))
+    (define equal (equal? (list a b c d e) '((3 #f) 10 error error (done error))))
+    """)
+    equal = m.defs[values.W_Symbol.make("equal")]
+    assert equal is values.w_true
+
+def test_cached_mark_lookup():
+    m = run_mod(
+    """
+    #lang pycket
+    (define x (make-parameter 0))
+    (define (sum n)
+      (if (= n 0)
+          0
+          (+ (x) (with-continuation-mark 'other n (sum (- n 1))))))
+    (define a (parameterize ([x 2]) (list (sum 50) (sum 50))))
+    (define (deep n)
+      (if (= n 0)
+          (raise 'deep)
+          (+ 1 (with-continuation-mark 'other n (deep (- n 1))))))
+    (define b
+      (with-handlers ([symbol? (lambda (e) e)])
+        (with-handlers ([symbol? (lambda (e) 'inner)]) (deep 20))))
+    (define c
+      (with-handlers ([symbol? (lambda (e) e)])
+        (with-handlers ([symbol? (lambda (e) 'inner)]) 1)
+        (deep 20)))
+    ;; the reentered continuation sees its own parameterization, not the one
+    ;; around the call to k
+    (define e
+      (let ([k #f] [seen '()])
+        (parameterize ([x 1])
+          (let ([v (+ (sum 2) (let/cc c (set! k c) 0))])
+            (set! seen (cons (+ v (x)) seen))))
+        (when (< (length seen) 2)
+          (parameterize ([x 5]) (k 10)))
+        seen))
+    (define equal (equal? (list a b c e) '((100 100) inner deep (13 3))))
+    """)
+    equal = m.defs[values.W_Symbol.make("equal")]
+    assert equal is values.w_true
+
+def test_mark_cache_invalidation():
+    from pycket.cont import NilCont, call_cont, cached_mark_index, mark_cache
+    handler = values.exn_handler_key
+    param = values.parameterization_key
+    bottom = NilCont()
+    bottom.update_cm(handler, values.W_Fixnum(1))
+    f1 = call_cont(values.w_void, None, bottom)
+    f1.update_cm(values.W_Symbol.make("other"), values.w_void)
+    f2 = call_cont(values.w_void, None, f1)
+    assert f2.get_mark_first(handler).value == 1
+
+    handler_epoch = mark_cache.epochs[cached_mark_index(handler)]
+    param_epoch = mark_cache.epochs[cached_mark_index(param)]
+    # no lookup has gone past a frame without marks of its own
+    f3 = call_cont(values.w_void, None, f2)
+    f3.update_cm(handler, values.W_Fixnum(3))
+    assert f3.get_mark_first(handler).value == 3
+    assert mark_cache.epochs[cached_mark_index(handler)] == handler_epoch
+    # the lookup from f2 went past f1
+    f1.update_cm(handler, values.W_Fixnum(2))
+    assert mark_cache.epochs[cached_mark_index(handler)] == handler_epoch + 1
+    assert mark_cache.epochs[cached_mark_index(param)] == param_epoch
+    assert f2.get_mark_first(handler).value == 2
+
 def test_bytes_conversions():
     m = run_mod(
     """
@@ -1039,6 +1216,24 @@ def test_raise_exception(doctest):
     13
     """
 
+def test_runtime_exception(doctest):
+    """
+    > (with-handlers ([exn:fail? (lambda (e) 'caught)]) (car 5))
+    'caught
+    > (with-handlers ([exn:fail? exn-message]) (hash-ref (make-hash) 'k))
+    "key k not found"
+    > (with-handlers ([exn:fail? exn-message]) (car 5))
+    "car: expected pair? given 5"
+    > (with-handlers ([exn:fail? (lambda (e) (continuation-mark-set? (exn-continuation-marks e)))]) (car 5))
+    #t
+    > (with-handlers ([exn? (lambda (e) (exn:fail:contract? e))]) (car 5))
+    #t
+    > (with-handlers ([exn? (lambda (e) (exn:fail:contract? e))]) (symbol->string 5))
+    #t
+    > (with-handlers ([exn? (lambda (e) (exn:fail:contract? e))]) (error 'f "no"))
+    #f
+    """
+
 def test_ctype_basetype(doctest):
     u"""
     ! (require '#%foreign)
@@ -1395,6 +1590,27 @@ def test_current_seconds(doctest):
     #t
     """
 
+def test_performance_stats(doctest):
+    """
+    ! (define v (make-vector 16 #f))
+    ! (vector-set-performance-stats! v)
+    > (andmap exact-nonnegative-integer? (vector->list v))
+    #t
+    ! (define short (make-vector 2 'x))
+    ! (vector-set-performance-stats! short)
+    > (exact-nonnegative-integer? (vector-ref short 1))
+    #t
+    > (exact-nonnegative-integer? (current-gc-milliseconds))
+    #t
+    > (exact-nonnegative-integer? (current-memory-use))
+    #t
+    > (exact-nonnegative-integer? (current-memory-use 'cumulative))
+    #t
+    ! (define-values (res cpu real gc) (time-apply (lambda () (collect-garbage) 1) '()))
+    > (and (equal? res '(1)) (exact-nonnegative-integer? gc))
+    #t
+    """
+
 def test_true_object(doctest):
     """
     ! (require '#%kernel)
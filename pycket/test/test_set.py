@@ -0,0 +1,106 @@
+import pytest
+
+from pycket          import config, values
+from pycket.hash.set import W_HashSet, KIND_EQUAL, KIND_EQ
+from pycket.hash.equal import (
+    FixnumHashmapStrategy, StringHashmapStrategy, ObjectHashmapStrategy)
+from pycket.test.testhelper import run_mod_expr
+
+@pytest.fixture
+def native_sets(monkeypatch):
+    monkeypatch.setattr(config, "native_sets", True)
+
+def run_set(expr):
+    return run_mod_expr(expr, extra="(require racket/set)")
+
+def test_native_set_values(native_sets):
+    w_set = run_set("(set 1 2 3 2)")
+    assert isinstance(w_set, W_HashSet)
+    assert w_set.kind == KIND_EQUAL and not w_set.mutable
+    assert w_set.length() == 3
+    w_set = run_set("(list->mutable-seteq '(a b))")
+    assert isinstance(w_set, W_HashSet)
+    assert w_set.kind == KIND_EQ and w_set.mutable
+
+def test_native_set_strategies(native_sets):
+    w_set = run_set("(mutable-set 1 2 3)")
+    assert w_set.table.strategy is FixnumHashmapStrategy.singleton
+    w_set = run_set("(let ([s (mutable-set)]) (set-add! s \"a\") (set-add! s \"b\") s)")
+    assert w_set.table.strategy is StringHashmapStrategy.singleton
+    w_set = run_set("(mutable-set (list 1) (list 2))")
+    assert w_set.table.strategy is ObjectHashmapStrategy.singleton
+
+def test_native_set_membership(native_sets):
+    assert run_set("(set-member? (set 1 2 3) 2)") is values.w_true
+    assert run_set("(set-member? (set (list 1 2)) (list 1 2))") is values.w_true
+    assert run_set("(set-member? (seteq (list 1 2)) (list 1 2))") is values.w_false
+    assert run_set("(set-count (set-remove (set 1 2 3) 2))").value == 2
+    assert run_set("""
+        (let ([s (mutable-set)])
+          (for ([i (in-range 10)]) (set-add! s (modulo i 4)))
+          (set-remove! s 0)
+          (set-remove! s 7)
+          (set-count s))""").value == 3
+
+def test_native_set_bulk(native_sets):
+    assert run_set("(set-count (set-union (set 1 2) (set 2 3) (set 4)))").value == 4
+    assert run_set("(set=? (set-intersect (set 1 2 3) (set 2 3 4) (set 3 2)) (set 2 3))") is values.w_true
+    assert run_set("(set=? (set-subtract (set 1 2 3 4) (set 2) (set 4 5)) (set 1 3))") is values.w_true
+    assert run_set("(subset? (set 1 2) (set 3 2 1))") is values.w_true
+    assert run_set("(proper-subset? (set 1 2) (set 2 1))") is values.w_false
+    assert run_set("""
+        (let ([s (mutable-set 1 2 3 4)])
+          (set-intersect! s (mutable-set 2 4 6))
+          (set-union! s (mutable-set 8))
+          (set-subtract! s (mutable-set 2))
+          (sort (set->list s) <))""").tostring() == "(4 8)"
+
+def test_native_set_equal(native_sets):
+    assert run_set("(equal? (set 1 2 (list 3)) (set (list 3) 2 1))") is values.w_true
+    assert run_set("(equal? (set 1 2) (seteqv 1 2))") is values.w_false
+    assert run_set("(equal? (set 1 2) (mutable-set 1 2))") is values.w_false
+    assert run_set("""
+        (let ([h (make-hash)])
+          (hash-set! h (set 1 2) 'a)
+          (hash-ref h (set 2 1) #f))""") is values.W_Symbol.make("a")
+
+def test_native_set_hash_order(native_sets):
+    # the hash of a set does not depend on the order of its elements, also
+    # when there are too many of them to hash each one completely
+    w_a = run_set("(for/fold ([s (set)]) ([i (in-range 150)]) (set-add s (list i i)))")
+    w_b = run_set("(for/fold ([s (set)]) ([i (in-range 149 -1 -1)]) (set-add s (list i i)))")
+    assert w_a.hash_equal() == w_b.hash_equal()
+    w_a = run_set("(let ([s (mutable-set)]) (for ([i (in-range 120)]) (set-add! s (list i))) s)")
+    w_b = run_set("(let ([s (mutable-set)]) (for ([i (in-range 119 -1 -1)]) (set-add! s (list i))) s)")
+    assert w_a.hash_equal() == w_b.hash_equal()
+    assert run_set("""
+        (let ([h (make-hash)])
+          (hash-set! h (for/fold ([s (set)]) ([i (in-range 150)]) (set-add s (list i))) 'a)
+          (hash-ref h (for/fold ([s (set)]) ([i (in-range 149 -1 -1)]) (set-add s (list i))) #f))""") is values.W_Symbol.make("a")
+
+def test_native_set_sequence(native_sets):
+    assert run_set("(for/sum ([x (in-set (set 1 2 3))]) x)").value == 6
+    assert run_set("(for/sum ([x (set 1 2 3)]) x)").value == 6
+    assert run_set("(for/sum ([x (mutable-seteq 1 2 3)]) x)").value == 6
+    assert run_set("(sequence? (set 1))") is values.w_true
+    from pycket.hash.set import sequence_property
+    assert sequence_property.w_prop is not None
+    # another property named sequence is not prop:sequence
+    assert run_set("""
+        (let-values ([(prop pred ref) (make-struct-type-property 'sequence)])
+          (pred (set 1)))""") is values.w_false
+
+def test_native_set_generic_sets(native_sets):
+    # the operations still work on the other generic sets of racket/set
+    assert run_set("(set-member? '(1 2 3) 2)") is values.w_true
+    assert run_set("(set-count '(1 2 3))").value == 3
+    assert run_set("(set-add '(1 2) 3)").tostring() == "(3 1 2)"
+    assert run_set("(set-count (set-union (set 1 2) (set 3)))").value == 3
+
+def test_native_set_errors(native_sets):
+    for expr in ["(set-union (set 1) '(2))", "(set-union (set 1) (seteq 2))",
+                 "(set-add! (set 1) 2)", "(set-add (mutable-set 1) 2)",
+                 "(subset? (set 1) (seteq 1))", "(list->set 5)",
+                 "(set-rest (set))", "(set-union! (set 1) (set 2))"]:
+        assert run_set("(with-handlers ([exn:fail? (lambda (e) 'caught)]) %s)" % expr) \
+            is values.W_Symbol.make("caught")
@@ -0,0 +1,76 @@
+import imp
+import os
+
+from StringIO import StringIO
+
+TRACEVIEWER = os.path.join(os.path.dirname(__file__), "..", "..", "utils",
+                           "traceviewer.py")
+traceviewer = imp.load_source("traceviewer", TRACEVIEWER)
+
+LOG = """\
+[1a2b3c4d5e] {jit-tracing
+debug_merge_point(0, 0, '[bar.rkt:1:0] (f x)')
+~~~ ABORTING TRACING ABORT_TOO_LONG
+[1a2b3c4d6f] jit-tracing}
+[1a2b3c4e00] {jit-log-opt-loop
+# Loop 0 (Lambda [foo.rkt:3:2] (let loop ...)) : loop with 42 ops
+[p0, p1]
++110: label(p0, p1, descr=TargetToken(140000))
+debug_merge_point(0, 0, '[foo.rkt:3:2] (let loop ...)')
++150: guard_true(i5, descr=<Guard0x7f01>) [p0, p1]
+debug_merge_point(0, 0, '[foo.rkt:4:6] (+ i 1)')
+debug_merge_point(0, 0, '[foo.rkt:3:2] (loop i)')
++200: jump(p0, p1, descr=TargetToken(140000))
+[1a2b3c4e11] jit-log-opt-loop}
+[1a2b3c4e22] {jit-log-opt-bridge
+# bridge out of Guard 0x7f01 with 10 ops
+debug_merge_point(0, 0, '[foo.rkt:5:4] (display i)')
++30: finish(p0, descr=<DoneWithThisFrameDescrRef>)
+[1a2b3c4e33] jit-log-opt-bridge}
+[1a2b3c4e44] {jit-backend-counts
+entry 0:1000
+TargetToken(140000):98765
+bridge 32513:300
+[1a2b3c4e55] jit-backend-counts}
+"""
+
+def parse_log():
+    log = traceviewer.JitLog()
+    log.parse(StringIO(LOG))
+    return log
+
+def test_traces():
+    log = parse_log()
+    assert len(log.traces) == 2
+    loop, bridge = log.traces
+    assert loop.name() == "loop 0 (loop)"
+    assert (loop.ops, loop.count, loop.entries) == (42, 98765, 1000)
+    assert loop.locations == {"foo.rkt:3:2": 2, "foo.rkt:4:6": 1}
+    assert bridge.name() == "bridge out of guard 0x7f01"
+    assert (bridge.ops, bridge.count) == (10, 300)
+    assert traceviewer.sorted_traces(log) == [loop, bridge]
+
+def test_guards():
+    log = parse_log()
+    loop, bridge = log.traces
+    [guard] = loop.guards
+    assert (guard.name, guard.ident, guard.location) == (
+        "guard_true", "0x7f01", "foo.rkt:3:2")
+    assert guard.bridge is bridge
+    assert log.failing_guards() == [guard]
+
+def test_aborts():
+    log = parse_log()
+    assert log.abort_summary() == [(("ABORT_TOO_LONG", "bar.rkt:1:0"), 1)]
+
+def test_render():
+    log = parse_log()
+    out = StringIO()
+    traceviewer.render_text(log, out)
+    text = out.getvalue()
+    assert "98765  loop 0 (loop), 42 ops, 1 guards, entered 1000 times" in text
+    assert "300  guard_true 0x7f01 at foo.rkt:3:2" in text
+    assert "ABORT_TOO_LONG at bar.rkt:1:0" in text
+    out = StringIO()
+    traceviewer.render_html(log, out)
+    assert "bridge out of guard 0x7f01" in out.getvalue()
@@ -3,10 +3,12 @@
 
 from pycket                   import config
 from pycket.arity             import Arity
-from pycket.base              import W_Object, W_ProtoObject, UnhashableType
+from pycket.base              import (W_Object, W_ProtoObject, UnhashableType,
+                                      equal_hash_state, start_equal_hash)
 from pycket.cont              import continuation, label, NilCont
 from pycket.env               import ConsEnv
 from pycket.error             import SchemeException
+from pycket.perf_stats        import state as gc_state
 from pycket.prims.expose      import make_call_method
 from pycket.small_list        import inline_small_list
 from pycket.util              import add_copy_method, memoize_constructor
@@ -310,12 +312,20 @@ class W_Cons(W_List):
         return True
 
     def hash_equal(self, info=None):
+        return start_equal_hash(self)
+
+    def hash_equal_part(self):
+        state = equal_hash_state
         x = 0x345678
-        while isinstance(self, W_Cons):
-            car, self = self.car(), self.cdr()
-            y = car.hash_equal(info=info)
+        w_curr = self
+        while isinstance(w_curr, W_Cons):
+            if state.fuel <= 0:
+                return x
+            state.fuel -= 1
+            car, w_curr = w_curr.car(), w_curr.cdr()
+            y = car.hash_equal_part()
             x = rarithmetic.intmask((1000003 * x) ^ y)
-        return x
+        return rarithmetic.intmask((1000003 * x) ^ w_curr.hash_equal_part())
 
     def equal(self, other):
         if not isinstance(other, W_Cons):
@@ -411,6 +421,9 @@ class W_Box(W_Object):
         raise NotImplementedError("abstract base class")
 
     def hash_equal(self, info=None):
+        return start_equal_hash(self)
+
+    def hash_equal_part(self):
         raise UnhashableType
 
     def unbox(self, env, cont):
@@ -434,15 +447,32 @@ class W_MBox(W_Box):
         self.value = val
         return return_value(w_void, env, cont)
 
+    def hash_equal_part(self):
+        equal_hash_state.stable = False
+        return hash_box_contents(self.value)
+
     def tostring(self):
         return "'#&%s" % self.value.tostring()
 
 class W_IBox(W_Box):
     errorname = "ibox"
-    _attrs_ = _immutable_fields_ = ["value"]
+    _attrs_ = ["value", "_hash"]
+    _immutable_fields_ = ["value"]
 
     def __init__(self, value):
         self.value = value
+        self._hash = 0
+
+    def hash_equal(self, info=None):
+        if self._hash == 0:
+            hash = start_equal_hash(self)
+            if not equal_hash_state.stable:
+                return hash
+            self._hash = hash
+        return self._hash
+
+    def hash_equal_part(self):
+        return hash_box_contents(self.value)
 
     def immutable(self):
         return True
@@ -457,6 +487,13 @@ class W_IBox(W_Box):
     def tostring(self):
         return "'#&%s" % self.value.tostring()
 
+def hash_box_contents(w_value):
+    state = equal_hash_state
+    if state.fuel <= 0:
+        return 0x2468ac
+    state.fuel -= 1
+    return rarithmetic.intmask((1000003 * 0x2468ac) ^ w_value.hash_equal_part())
+
 # A weak box does not test as a box for most operations and cannot be
 # chaperoned/impersonated, so we start it from W_Object rather than W_Box.
 class W_WeakBox(W_Object):
@@ -473,19 +510,70 @@ class W_WeakBox(W_Object):
     def tostring(self):
         return "#<weak-box>"
 
+def is_immediate(w_obj):
+    """ Fixnums and characters are immediate values in Racket, which are never
+    collected, so weak references to them must be strong. """
+    return isinstance(w_obj, W_Fixnum) or isinstance(w_obj, W_Character)
+
+# The value of an ephemeron is dropped once its key has been collected. The GC
+# has no ephemeron support, so a value that refers to its own key still keeps
+# the key alive. Like the entries of the weak tables, the values are dropped
+# lazily: after every major collection (counted by the GC hooks in perf_stats)
+# the next ephemeron made or read drops the values of all the ephemerons whose
+# keys have died.
+class EphemeronRegistry(object):
+    def __init__(self):
+        self.refs = []
+        self.swept_at = 0
+
+    def add(self, eph):
+        self.sweep_if_collected()
+        self.refs.append(weakref.ref(eph))
+
+    def sweep_if_collected(self):
+        if self.swept_at != gc_state.major_collections:
+            self.sweep()
+
+    def sweep(self):
+        self.swept_at = gc_state.major_collections
+        refs = []
+        for ref in self.refs:
+            eph = ref()
+            if eph is not None and eph.drop_if_collected():
+                refs.append(ref)
+        self.refs = refs
+
+ephemerons = EphemeronRegistry()
+
 class W_Ephemeron(W_Object):
     errorname = "ephemeron"
-    _attrs_ = _immutable_fields_ = ["key", "mapping"]
+    _attrs_ = ["w_key", "key_ref", "w_value"]
+    _immutable_fields_ = ["w_key", "key_ref"]
 
     def __init__(self, key, value):
         assert isinstance(key, W_Object)
         assert isinstance(value, W_Object)
-        self.key = weakref.ref(key)
-        self.mapping = weakref.RWeakKeyDictionary(W_Object, W_Object)
-        self.mapping.set(key, value)
+        if is_immediate(key):
+            self.w_key   = key
+            self.key_ref = weakref.dead_ref
+        else:
+            self.w_key   = None
+            self.key_ref = weakref.ref(key)
+        self.w_value = value
+        if self.w_key is None:
+            ephemerons.add(self)
+
+    def drop_if_collected(self):
+        """ Drop the value if the key has died. Returns whether it is alive. """
+        if self.w_key is None and self.key_ref() is None:
+            self.w_value = None
+            return False
+        return True
 
     def get(self):
-        return self.mapping.get(self.key())
+        ephemerons.sweep_if_collected()
+        self.drop_if_collected()
+        return self.w_value
 
     def tostring(self):
         return "#<ephemeron>"
@@ -528,6 +616,17 @@ class W_MCons(W_MList):
         self._car = a
     def set_cdr(self, d):
         self._cdr = d
+    def hash_equal(self, info=None):
+        return start_equal_hash(self)
+    def hash_equal_part(self):
+        state = equal_hash_state
+        state.stable = False
+        if state.fuel <= 0:
+            return 0x234567
+        state.fuel -= 1
+        x = self._car.hash_equal_part()
+        y = self._cdr.hash_equal_part()
+        return rarithmetic.intmask((1000003 * x) ^ y)
 
 class W_Number(W_Object):
     _attrs_ = []
@@ -1075,6 +1174,10 @@ class W_MutableBytes(W_Bytes):
     def immutable(self):
         return False
 
+    def hash_equal_part(self):
+        equal_hash_state.stable = False
+        return self.hash_equal()
+
     def set(self, n, v):
         l = len(self.value)
         if n < 0 or n >= l:
@@ -1266,9 +1369,9 @@ class W_ThunkProcCMK(W_Procedure):
 
 
 class W_Prim(W_Procedure):
-    _attrs_ = _immutable_fields_ = ["name", "code", "arity", "result_arity", "simple1", "simple2"]
+    _attrs_ = _immutable_fields_ = ["name", "code", "arity", "result_arity", "simple1", "simple2", "simple_n"]
 
-    def __init__ (self, name, code, arity=Arity.unknown, result_arity=None, simple1=None, simple2=None):
+    def __init__ (self, name, code, arity=Arity.unknown, result_arity=None, simple1=None, simple2=None, simple_n=None):
         self.name = W_Symbol.make(name)
         self.code = code
         assert isinstance(arity, Arity)
@@ -1276,6 +1379,7 @@ class W_Prim(W_Procedure):
         self.result_arity = result_arity
         self.simple1 = simple1
         self.simple2 = simple2
+        self.simple_n = simple_n
 
     def get_arity(self, promote=False):
         if promote:
@@ -1287,6 +1391,9 @@ class W_Prim(W_Procedure):
 
     def call_with_extra_info(self, args, env, cont, extra_call_info):
         jit.promote(self)
+        if config.allocation_profiling:
+            from pycket.alloc_profile import enter_prim
+            enter_prim(self)
         return self.code(args, env, cont, extra_call_info)
 
     def tostring(self):
@@ -1395,6 +1502,27 @@ class W_EscapeContinuation(W_Continuation):
     _attrs_ = []
     escape = True
 
+class W_OneShotContinuation(W_Continuation):
+    _attrs_ = ["shot", "state"]
+    _immutable_fields_ = ["state"]
+
+    def __init__(self, cont, state, prompt_tag=None):
+        W_Continuation.__init__(self, cont, prompt_tag)
+        self.shot = False
+        # whether the procedure of call/1cc has returned, see OneShotReturnCont
+        self.state = state
+
+    def call(self, args, env, cont):
+        from pycket.prims.control import (install_one_shot_continuation,
+                                          convert_runtime_exception)
+        if self.shot or self.state.returned:
+            exn = SchemeException(
+                "continuation application: attempt to reinstate a one-shot continuation")
+            return convert_runtime_exception(exn, env, cont)
+        self.shot = True
+        return install_one_shot_continuation(self.cont, self.prompt_tag, args,
+                                             env, cont)
+
 class W_ComposableContinuation(W_Procedure):
     errorname = "composable-continuation"
 
@@ -1454,34 +1582,66 @@ class W_Closure(W_Procedure):
         return self.caselam.get_arity()
 
     @jit.unroll_safe
-    def _find_lam(self, args):
+    def _find_lam(self, args, w_rest=None):
         jit.promote(self.caselam)
         for i, lam in enumerate(self.caselam.lams):
-            actuals = lam.match_args(args)
+            if w_rest is None:
+                actuals = lam.match_args(args)
+            else:
+                actuals = lam.match_args_spread(args, w_rest)
             if actuals is not None:
+                if config.lambda_profiling and len(self.caselam.lams) > 1:
+                    from pycket.lambda_profile import record_clause
+                    record_clause(self.caselam, i)
                 frees = self._get_list(i)
                 return actuals, frees, lam
+        if w_rest is not None:
+            return None, None, None
         if len(self.caselam.lams) == 1:
             single_lambda = self.caselam.lams[0]
             single_lambda.raise_nice_error(args)
         raise SchemeException("No matching arity in case-lambda")
 
-    def call_with_extra_info(self, args, env, cont, calling_app):
+    def prepare_call(self, args, env, calling_app, w_rest=None):
+        """ Select the lambda to run for args and build the environment its
+        body runs in. If w_rest is given, the arguments are args followed by
+        the elements of the proper list w_rest, and (None, None) is returned if
+        no lambda accepts them. """
         env_structure = None
         if calling_app is not None:
             env_structure = calling_app.env_structure
         jit.promote(self.caselam)
         jit.promote(env_structure)
-        (actuals, frees, lam) = self._find_lam(args)
-        if not jit.we_are_jitted() and env.pycketconfig().callgraph:
-            env.toplevel_env().callgraph.register_call(lam, calling_app, cont, env)
+        (actuals, frees, lam) = self._find_lam(args, w_rest)
+        if lam is None:
+            return None, None
         # specialize on the fact that often we end up executing in the
         # same environment.
         prev = lam.env_structure.prev.find_env_in_chain_speculate(
                 frees, env_structure, env)
-        return lam.make_begin_cont(
-            ConsEnv.make(actuals, prev),
-            cont)
+        return lam, ConsEnv.make(actuals, prev)
+
+    def call_with_extra_info(self, args, env, cont, calling_app):
+        lam, body_env = self.prepare_call(args, env, calling_app)
+        return self._enter_body(lam, body_env, env, cont, calling_app)
+
+    def call_spread(self, args, w_rest, env, cont, calling_app):
+        """ Call with args followed by the elements of the proper list w_rest,
+        the way apply does. """
+        lam, body_env = self.prepare_call(args, env, calling_app, w_rest)
+        if lam is None:
+            # reports the arity error
+            all_args = args + from_list(w_rest)
+            return self.call_with_extra_info(all_args, env, cont, calling_app)
+        return self._enter_body(lam, body_env, env, cont, calling_app)
+
+    def _enter_body(self, lam, body_env, env, cont, calling_app):
+        if not jit.we_are_jitted() and env.pycketconfig().callgraph:
+            env.toplevel_env().callgraph.register_call(lam, calling_app, cont, env)
+        if config.lambda_profiling:
+            from pycket.lambda_profile import enter_lambda
+            cont = enter_lambda(lam, env, cont)
+        return lam.make_begin_cont(body_env, cont)
 
     def call(self, args, env, cont):
         return self.call_with_extra_info(args, env, cont, None)
@@ -1522,25 +1682,52 @@ class W_Closure1AsEnv(ConsEnv):
             caselam = jit.promote(caselam)
         return caselam.get_arity()
 
-    def call_with_extra_info(self, args, env, cont, calling_app):
+    def prepare_call(self, args, env, calling_app, w_rest=None):
+        """ Check args against the lambda and build the environment its body
+        runs in. If w_rest is given, the arguments are args followed by the
+        elements of the proper list w_rest, and (None, None) is returned if the
+        lambda does not accept them. """
         env_structure = None
         if calling_app is not None:
             env_structure = calling_app.env_structure
         jit.promote(self.caselam)
         jit.promote(env_structure)
         lam = self.caselam.lams[0]
-        if not jit.we_are_jitted() and env.pycketconfig().callgraph:
-            env.toplevel_env().callgraph.register_call(lam, calling_app, cont, env)
-        actuals = lam.match_args(args)
-        if actuals is None:
-            lam.raise_nice_error(args)
+        if w_rest is None:
+            actuals = lam.match_args(args)
+            if actuals is None:
+                lam.raise_nice_error(args)
+        else:
+            actuals = lam.match_args_spread(args, w_rest)
+            if actuals is None:
+                return None, None
         # specialize on the fact that often we end up executing in the
         # same environment.
         prev = lam.env_structure.prev.find_env_in_chain_speculate(
                 self, env_structure, env)
-        return lam.make_begin_cont(
-            ConsEnv.make(actuals, prev),
-            cont)
+        return lam, ConsEnv.make(actuals, prev)
+
+    def call_with_extra_info(self, args, env, cont, calling_app):
+        lam, body_env = self.prepare_call(args, env, calling_app)
+        return self._enter_body(lam, body_env, env, cont, calling_app)
+
+    def call_spread(self, args, w_rest, env, cont, calling_app):
+        """ Call with args followed by the elements of the proper list w_rest,
+        the way apply does. """
+        lam, body_env = self.prepare_call(args, env, calling_app, w_rest)
+        if lam is None:
+            # reports the arity error
+            all_args = args + from_list(w_rest)
+            return self.call_with_extra_info(all_args, env, cont, calling_app)
+        return self._enter_body(lam, body_env, env, cont, calling_app)
+
+    def _enter_body(self, lam, body_env, env, cont, calling_app):
+        if not jit.we_are_jitted() and env.pycketconfig().callgraph:
+            env.toplevel_env().callgraph.register_call(lam, calling_app, cont, env)
+        if config.lambda_profiling:
+            from pycket.lambda_profile import enter_lambda
+            cont = enter_lambda(lam, env, cont)
+        return lam.make_begin_cont(body_env, cont)
 
     def call(self, args, env, cont):
         return self.call_with_extra_info(args, env, cont, None)
@@ -1597,6 +1784,10 @@ class W_PromotableClosure(W_Procedure):
         jit.promote(self)
         return self.closure.call_with_extra_info(args, env, cont, calling_app)
 
+    def call_spread(self, args, w_rest, env, cont, calling_app):
+        jit.promote(self)
+        return self.closure.call_spread(args, w_rest, env, cont, calling_app)
+
     def get_arity(self, promote=False):
         if promote:
             self = jit.promote(self)
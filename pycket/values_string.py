@@ -1,4 +1,4 @@
-from pycket.base import W_Object, SingletonMeta
+from pycket.base import W_Object, SingletonMeta, equal_hash_state
 from pycket.error import SchemeException
 from pycket import config
 
@@ -188,6 +188,10 @@ class W_MutableString(W_String):
     def immutable(self):
         return False
 
+    def hash_equal_part(self):
+        equal_hash_state.stable = False
+        return self.hash_equal()
+
     # mutation operations
 
     def setitem(self, index, unichar):
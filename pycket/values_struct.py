@@ -4,7 +4,8 @@ from pycket import config
 from pycket import values
 from pycket import vector as values_vector
 from pycket.arity import Arity
-from pycket.base import SingleResultMixin, UnhashableType
+from pycket.base import (SingleResultMixin, UnhashableType, equal_hash_state,
+                         start_equal_hash)
 from pycket.cont import continuation, label
 from pycket.error import SchemeException
 from pycket.prims.expose import default, make_call_method
@@ -12,7 +13,7 @@ from pycket.small_list import inline_small_list
 from pycket.util import strip_immutable_field_name
 from pycket.values_parameter import W_Parameter
 
-from rpython.rlib import jit
+from rpython.rlib import jit, rarithmetic
 from rpython.rlib.objectmodel import import_from_mixin
 from rpython.rlib.unroll import unrolling_iterable
 
@@ -602,15 +603,32 @@ class W_RootStruct(values.W_Object):
         raise NotImplementedError("abstract base class")
 
     def hash_equal(self, info=None):
+        return start_equal_hash(self)
+
+    def hash_equal_part(self):
         struct_type = self.struct_type()
         if struct_type.read_prop(w_prop_equal_hash):
             raise UnhashableType
-        return values.W_Object.hash_equal(self, info)
+        if struct_type.isopaque:
+            return values.W_Object.hash_equal(self)
+        # transparent and prefab structs are equal? when their names and
+        # fields are, see struct2vector
+        state = equal_hash_state
+        if not struct_type.all_fields_immutable():
+            state.stable = False
+        x = struct_type.name.hash_equal()
+        for w_val in self.vals():
+            if state.fuel <= 0:
+                break
+            state.fuel -= 1
+            x = rarithmetic.intmask((1000003 * x) ^ w_val.hash_equal_part())
+        return x
 
 @inline_small_list(immutable=True, attrname="storage", unbox_num=True)
 class W_Struct(W_RootStruct):
     errorname = "struct"
-    _attrs_ = _immutable_fields_ = ["_type"]
+    _attrs_ = ["_type", "_hash"]
+    _immutable_fields_ = ["_type"]
 
     @staticmethod
     @jit.unroll_safe
@@ -630,10 +648,19 @@ class W_Struct(W_RootStruct):
 
     def __init__(self, type):
         self._type = type
+        self._hash = 0
 
     def struct_type(self):
         return jit.promote(self._type)
 
+    def hash_equal(self, info=None):
+        if self._hash == 0:
+            hash = start_equal_hash(self)
+            if not equal_hash_state.stable:
+                return hash
+            self._hash = hash
+        return self._hash
+
     @jit.unroll_safe
     def vals(self):
         size = self._get_size_list()
@@ -695,9 +722,8 @@ class W_Struct(W_RootStruct):
             raise SchemeException("%s does not have arity" % self.tostring())
 
     def get_struct_info(self, env, cont):
-        from pycket.interpreter import return_multi_vals
-        vals = values.Values._make2(self.struct_type(), values.w_false)
-        return return_multi_vals(vals, env, cont)
+        from pycket.interpreter import return_two_vals
+        return return_two_vals(self.struct_type(), values.w_false, env, cont)
 
     # TODO: currently unused
     def tostring_proc(self, env, cont):
@@ -753,6 +779,44 @@ class W_Struct(W_RootStruct):
             self.tostring_values(fields=fields, w_type=w_type, is_super=False)
             return "(%s %s)" % (typename, self._string_from_list(fields))
 
+class W_LazyExnStruct(W_Struct):
+    """
+    An exn struct (of a type without fields beyond those of exn) for an
+    exception raised by the runtime. The message string and the continuation
+    mark set are only built when they are first accessed, so raising an
+    exception that is caught by a handler that only checks its type is cheap.
+    """
+    _attrs_ = ["exn", "cont", "w_message", "w_marks"]
+
+    def __init__(self, type, exn, cont):
+        W_Struct.__init__(self, type)
+        self.exn       = exn
+        self.cont      = cont
+        self.w_message = None
+        self.w_marks   = None
+
+    def _get_size_list(self):
+        return 2
+
+    def _get_list(self, i):
+        if i == 0:
+            if self.w_message is None:
+                from pycket.values_string import W_String
+                self.w_message = W_String.fromstr_utf8(self.exn.get_msg())
+            return self.w_message
+        if i == 1:
+            if self.w_marks is None:
+                self.w_marks = values.W_ContinuationMarkSet(
+                    self.cont, values.w_default_continuation_prompt_tag)
+            return self.w_marks
+        raise IndexError
+
+    def _get_full_list(self):
+        return [self._get_list(0), self._get_list(1)]
+
+    def _set_list(self, i, val):
+        raise SchemeException("exn: fields are immutable")
+
 """
 This method generates a new structure class with inline stored immutable #f
 values on positions from constant_false array. If a new structure instance get
@@ -1141,7 +1205,7 @@ class W_StructPropertyPredicate(values.W_Procedure):
     @jit.unroll_safe
     def call(self, arg):
         if not isinstance(arg, W_RootStruct):
-            return values.w_false
+            return values.W_Bool.make(arg.builtin_prop(self.property) is not None)
         w_val = arg.struct_type().read_prop_precise(self.property)
         if w_val is not None:
             return values.w_true
@@ -1166,7 +1230,10 @@ class W_StructPropertyAccessor(values.W_Procedure):
                 return return_value(w_val, env, cont)
         elif arg.struct_type() is not None:
             return arg.get_prop(self.property, env, cont)
-        elif fail is not None:
+        w_val = arg.builtin_prop(self.property)
+        if w_val is not None:
+            return return_value(w_val, env, cont)
+        if fail is not None:
             if fail.iscallable():
                 return fail.call_with_extra_info([], env, cont, app)
             return return_value(fail, env, cont)
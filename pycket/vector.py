@@ -1,6 +1,6 @@
 
 from pycket.values import W_MVector, W_VectorSuper, W_Fixnum, W_Flonum, W_Character, UNROLLING_CUTOFF, wrap
-from pycket.base import W_Object, SingletonMeta, UnhashableType
+from pycket.base import W_Object, SingletonMeta, equal_hash_state, start_equal_hash
 from pycket import config
 
 from rpython.rlib import debug, jit, objectmodel, rerased
@@ -136,14 +136,20 @@ class W_Vector(W_MVector):
         return self.strategy._copy_storage(self, immutable=immutable)
 
     def hash_equal(self, info=None):
-        raise UnhashableType
+        return start_equal_hash(self)
 
-    # def hash_equal(self, info=None):
-        # x = 0x456789
-        # for i in range(self.len):
-            # hash = self.ref(i).hash_equal(info=info)
-            # x = intmask((1000003 * x) ^ hash)
-        # return x
+    def hash_equal_part(self):
+        state = equal_hash_state
+        if not self.immutable():
+            state.stable = False
+        x = 0x456789
+        for i in range(self.len):
+            if state.fuel <= 0:
+                break
+            state.fuel -= 1
+            hash = self.ref(i).hash_equal_part()
+            x = intmask((1000003 * x) ^ hash)
+        return intmask(x ^ self.len)
 
     def equal(self, other):
         # XXX could be optimized using strategies
@@ -198,11 +204,21 @@ class W_FlVector(W_VectorSuper):
         return "(flvector %s)" % " ".join([obj.tostring() for obj in l])
 
     def hash_equal(self, info=None):
+        return start_equal_hash(self)
+
+    def hash_equal_part(self):
+        # flvectors are mutable, so the hashes of values containing them
+        # must not be cached
+        state = equal_hash_state
+        state.stable = False
         x = 0x567890
         for i in range(self.len):
-            hash = self.ref(i).hash_equal(info=info)
+            if state.fuel <= 0:
+                break
+            state.fuel -= 1
+            hash = self.ref(i).hash_equal_part()
             x = intmask((1000003 * x) ^ hash)
-        return x
+        return intmask(x ^ self.len)
 
     def equal(self, other):
         # XXX could be optimized more
@@ -0,0 +1,263 @@
+"""
+Summarize the JIT log of a pycket run in terms of Racket source locations.
+
+Run pycket with
+
+    PYPYLOG=jit-log-opt,jit-backend-counts,jit-tracing,jit-abort:pycket.log
+
+and then
+
+    python utils/traceviewer.py pycket.log
+    python utils/traceviewer.py --html report.html pycket.log
+
+For every loop and bridge the report lists the source locations it covers
+(taken from the debug_merge_points, whose printable locations start with the
+source location of the surrounding lambda), how often it was entered, and the
+bridges attached to its guards. Guards whose bridges run most often are the
+guards that fail most. Aborted traces are listed with their reason and the last
+location traced before the abort.
+"""
+
+import re
+import sys
+
+try:
+    from html import escape
+except ImportError:
+    from cgi import escape
+
+from collections import Counter
+
+SECTION_START = re.compile(r"^\[[0-9a-f]+\] \{([\w-]+)$")
+SECTION_END   = re.compile(r"^\[[0-9a-f]+\] ([\w-]+)\}$")
+
+LOOP_HEADER   = re.compile(r"^# Loop (\d+) \((.*)\) : (\w[\w ]*?) with (\d+) ops")
+BRIDGE_HEADER = re.compile(r"^# bridge out of Guard (0x[0-9a-fA-F]+) with (\d+) ops")
+MERGE_POINT   = re.compile(r"debug_merge_point\((\d+), (\d+), '(.*)'\)\s*$")
+GUARD         = re.compile(r"^\+?\d*:? ?(guard_\w+)\(.*descr=<Guard(0x[0-9a-fA-F]+)>")
+TARGET_TOKEN  = re.compile(r"^\+?\d*:? ?label\(.*descr=TargetToken\((\d+)\)\)")
+LOCATION      = re.compile(r"^\[([^\]]*)\] ")
+ABORT         = re.compile(r"~~~ ABORTING TRACING (\w+)")
+COUNT         = re.compile(r"^(entry|bridge|TargetToken\()\s*(\d+)\)?:(\d+)$")
+
+UNKNOWN = "<unknown>"
+
+def split_location(printable):
+    match = LOCATION.match(printable)
+    if match is None:
+        return UNKNOWN, printable
+    return match.group(1), printable[match.end():]
+
+class Guard(object):
+    def __init__(self, name, ident, location, trace):
+        self.name     = name
+        self.ident    = ident
+        self.location = location
+        self.trace    = trace
+        self.bridge   = None
+
+class Trace(object):
+    def __init__(self, kind, ident, greenkey, ops):
+        self.kind      = kind
+        self.ident     = ident
+        self.greenkey  = greenkey
+        self.ops       = ops
+        self.locations = Counter()
+        self.guards    = []
+        self.tokens    = []
+        # iterations for loops, runs for bridges
+        self.count     = 0
+        self.entries   = 0
+        # the location of the last merge point seen while parsing
+        self.current_location = UNKNOWN
+
+    def name(self):
+        if self.kind == "bridge":
+            return "bridge out of guard %s" % self.ident
+        return "loop %s (%s)" % (self.ident, self.kind)
+
+class Abort(object):
+    def __init__(self, reason, location, printable):
+        self.reason    = reason
+        self.location  = location
+        self.printable = printable
+
+class JitLog(object):
+    def __init__(self):
+        self.traces = []
+        self.guards = {}
+        self.aborts = []
+
+    def parse(self, lines):
+        section = None
+        trace = None
+        last_location = (UNKNOWN, "")
+        for line in lines:
+            line = line.rstrip("\n")
+            match = SECTION_START.match(line)
+            if match is not None:
+                section = match.group(1)
+                trace = None
+                if section == "jit-tracing":
+                    last_location = (UNKNOWN, "")
+                continue
+            if SECTION_END.match(line) is not None:
+                section = None
+                trace = None
+                continue
+            if section in ("jit-log-opt-loop", "jit-log-opt-bridge"):
+                trace = self.parse_trace_line(line, trace)
+            elif section == "jit-backend-counts":
+                self.parse_count(line)
+            elif section is not None and section.startswith("jit-"):
+                match = MERGE_POINT.search(line)
+                if match is not None:
+                    last_location = split_location(match.group(3))
+                match = ABORT.search(line)
+                if match is not None:
+                    location, printable = last_location
+                    self.aborts.append(Abort(match.group(1), location, printable))
+        self.link_bridges()
+
+    def parse_trace_line(self, line, trace):
+        match = LOOP_HEADER.match(line)
+        if match is not None:
+            trace = Trace(match.group(3), match.group(1), match.group(2),
+                          int(match.group(4)))
+            self.traces.append(trace)
+            return trace
+        match = BRIDGE_HEADER.match(line)
+        if match is not None:
+            trace = Trace("bridge", match.group(1).lower(), "", int(match.group(2)))
+            self.traces.append(trace)
+            return trace
+        if trace is None:
+            return trace
+        match = MERGE_POINT.search(line)
+        if match is not None:
+            location, _ = split_location(match.group(3))
+            trace.locations[location] += 1
+            trace.current_location = location
+            return trace
+        match = GUARD.match(line)
+        if match is not None:
+            guard = Guard(match.group(1), match.group(2).lower(),
+                          trace.current_location, trace)
+            trace.guards.append(guard)
+            self.guards[guard.ident] = guard
+            return trace
+        match = TARGET_TOKEN.match(line)
+        if match is not None:
+            trace.tokens.append(match.group(1))
+        return trace
+
+    def parse_count(self, line):
+        match = COUNT.match(line.strip())
+        if match is None:
+            return
+        kind, ident, count = match.group(1), match.group(2), int(match.group(3))
+        if kind == "bridge":
+            ident = hex(int(ident)).rstrip("L")
+        for trace in self.traces:
+            if kind == "entry" and trace.kind != "bridge" and trace.ident == ident:
+                trace.entries += count
+            elif kind == "bridge" and trace.kind == "bridge" and trace.ident == ident:
+                trace.count += count
+            elif kind.startswith("TargetToken") and ident in trace.tokens:
+                trace.count += count
+
+    def link_bridges(self):
+        for trace in self.traces:
+            if trace.kind == "bridge":
+                guard = self.guards.get(trace.ident)
+                if guard is not None:
+                    guard.bridge = trace
+
+    def failing_guards(self):
+        guards = [guard for guard in self.guards.values() if guard.bridge is not None]
+        guards.sort(key=lambda guard: guard.bridge.count, reverse=True)
+        return guards
+
+    def abort_summary(self):
+        summary = Counter()
+        for abort in self.aborts:
+            summary[(abort.reason, abort.location)] += 1
+        return summary.most_common()
+
+def sorted_traces(log):
+    return sorted(log.traces, key=lambda trace: trace.count, reverse=True)
+
+def top_locations(trace, limit=5):
+    return trace.locations.most_common(limit)
+
+def render_text(log, out):
+    out.write("=== traces by iterations ===\n")
+    for trace in sorted_traces(log):
+        out.write("%10d  %s, %d ops, %d guards, entered %d times\n" %
+                  (trace.count, trace.name(), trace.ops, len(trace.guards),
+                   trace.entries))
+        for location, count in top_locations(trace):
+            out.write("%14s%4d merge points in %s\n" % ("", count, location))
+    out.write("\n=== guards with the busiest bridges ===\n")
+    for guard in log.failing_guards():
+        out.write("%10d  %s %s at %s\n%14sin %s\n" %
+                  (guard.bridge.count, guard.name, guard.ident, guard.location,
+                   "", guard.trace.name()))
+    out.write("\n=== aborted traces ===\n")
+    for (reason, location), count in log.abort_summary():
+        out.write("%10d  %s at %s\n" % (count, reason, location))
+
+def render_html(log, out):
+    esc = lambda s: escape(str(s), quote=True)
+    out.write("<!DOCTYPE html>\n<html><head><meta charset='utf-8'>"
+              "<title>pycket JIT traces</title><style>"
+              "body{font-family:sans-serif} td,th{padding:2px 8px;text-align:left}"
+              "td.n{text-align:right} details{margin:4px 0}</style></head><body>\n")
+    out.write("<h1>Traces by iterations</h1>\n")
+    for trace in sorted_traces(log):
+        out.write("<details><summary>%d &times; %s, %d ops, %d guards, "
+                  "entered %d times</summary>\n" %
+                  (trace.count, esc(trace.name()), trace.ops, len(trace.guards),
+                   trace.entries))
+        out.write("<table><tr><th>merge points</th><th>location</th></tr>\n")
+        for location, count in trace.locations.most_common():
+            out.write("<tr><td class='n'>%d</td><td>%s</td></tr>\n" % (count, esc(location)))
+        out.write("</table><table><tr><th>guard</th><th>location</th><th>bridge runs</th></tr>\n")
+        for guard in trace.guards:
+            runs = guard.bridge.count if guard.bridge is not None else ""
+            out.write("<tr><td>%s %s</td><td>%s</td><td class='n'>%s</td></tr>\n" %
+                      (esc(guard.name), esc(guard.ident), esc(guard.location), runs))
+        out.write("</table></details>\n")
+    out.write("<h1>Guards with the busiest bridges</h1>\n<table>"
+              "<tr><th>bridge runs</th><th>guard</th><th>location</th><th>trace</th></tr>\n")
+    for guard in log.failing_guards():
+        out.write("<tr><td class='n'>%d</td><td>%s %s</td><td>%s</td><td>%s</td></tr>\n" %
+                  (guard.bridge.count, esc(guard.name), esc(guard.ident),
+                   esc(guard.location), esc(guard.trace.name())))
+    out.write("</table>\n<h1>Aborted traces</h1>\n<table>"
+              "<tr><th>count</th><th>reason</th><th>location</th></tr>\n")
+    for (reason, location), count in log.abort_summary():
+        out.write("<tr><td class='n'>%d</td><td>%s</td><td>%s</td></tr>\n" %
+                  (count, esc(reason), esc(location)))
+    out.write("</table></body></html>\n")
+
+def main(args):
+    html = None
+    if len(args) >= 2 and args[0] == "--html":
+        html = args[1]
+        args = args[2:]
+    if len(args) != 1:
+        print("usage: traceviewer.py [--html <output>] <pypylog>")
+        return 2
+    log = JitLog()
+    with open(args[0], 'r') as infile:
+        log.parse(infile)
+    if html is None:
+        render_text(log, sys.stdout)
+    else:
+        with open(html, 'w') as outfile:
+            render_html(log, outfile)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))